@@ -0,0 +1,146 @@
+/**
+ * labelJobQueue.js
+ * Durable queue for large label runs, used by routes/labels.js
+ * (POST /labels/l7651/jobs, GET /labels/l7651/jobs/:id).
+ *
+ * The queue is a directory shared with `generate_labels_L7651_v4.py --queue DIR`
+ * (see scripts/label_queue.py for the layout). Submitting writes the job JSON
+ * and a status snapshot through temp files + rename, so a worker never sees a
+ * partial file; workers claim jobs by renaming them into running/ and publish
+ * progress (sheets done, labels/s, ETA) in status/<id>.json, which is what a
+ * poll returns. Queued and running jobs survive API and worker restarts: a
+ * worker requeues jobs whose worker process died when it starts.
+ *
+ * Env:
+ *   LABEL_QUEUE_WORKERS  `--queue-worker` processes kept running by this API process
+ *                        (default 1; 0 = jobs are only queued, run workers elsewhere)
+ *   PYTHON_BIN           python executable (see labelPaths.js)
+ */
+
+'use strict';
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { spawn } = require('child_process');
+const logger = require('./logger');
+const { SCRIPT_PATH, pickPythonBin } = require('./labelPaths');
+
+const QUEUE_DIR = path.join(__dirname, '..', '.cache', 'labels', 'queue');
+// Same shape as label_queue.new_job_id(): sorts in submit order
+const JOB_ID_RE = /^\d{13}-[0-9a-f]{12}$/;
+const RESPAWN_DELAY_MS = 1000;
+
+function newJobId() {
+  return `${String(Date.now()).padStart(13, '0')}-${crypto.randomBytes(6).toString('hex')}`;
+}
+
+class LabelJobQueue {
+  /**
+   * @param {object} [options]
+   * @param {string} [options.root]     Queue directory
+   * @param {number} [options.workers]  `--queue-worker` processes to keep running
+   */
+  constructor({ root = QUEUE_DIR, workers = 1 } = {}) {
+    this.root = root;
+    this.size = Math.max(0, workers);
+    this.workers = [];
+    this.closed = false;
+    for (const dir of ['queued', 'running', 'done', 'failed', 'status']) {
+      fs.mkdirSync(path.join(root, dir), { recursive: true });
+    }
+  }
+
+  _file(dir, id) {
+    return path.join(this.root, dir, `${id}.json`);
+  }
+
+  async _write(file, obj) {
+    const tmp = path.join(path.dirname(file), `.${path.basename(file)}.${process.pid}.tmp`);
+    await fs.promises.writeFile(tmp, JSON.stringify(obj));
+    await fs.promises.rename(tmp, file);
+  }
+
+  _spawnWorker() {
+    const py = pickPythonBin();
+    const args = [SCRIPT_PATH, '--queue', this.root, '--queue-worker'];
+    const cp = spawn(py, py === 'py' ? ['-3', ...args] : args, { stdio: ['ignore', 'ignore', 'pipe'] });
+    const worker = { cp, failed: false };
+    cp.stderr.on('data', (d) => {
+      for (const line of d.toString().split('\n')) if (line.trim()) logger.info(`[labelJobQueue] ${line}`);
+    });
+    cp.on('error', (e) => {
+      worker.failed = true;
+      logger.error(`[labelJobQueue] failed to start '${py}': ${e.message}. Set PYTHON_BIN or LABEL_QUEUE_WORKERS=0.`);
+    });
+    cp.on('close', (code) => {
+      const i = this.workers.indexOf(worker);
+      if (i !== -1) this.workers.splice(i, 1);
+      if (this.closed || worker.failed) return;
+      // a worker only exits on a crash; replace it (its job is requeued on start)
+      logger.warn(`[labelJobQueue] queue worker exited (${code}); restarting`);
+      setTimeout(() => this._ensureWorkers(), RESPAWN_DELAY_MS).unref();
+    });
+    this.workers.push(worker);
+  }
+
+  _ensureWorkers() {
+    while (!this.closed && this.workers.length < this.size) this._spawnWorker();
+  }
+
+  /**
+   * Queue one label job.
+   * @param {object} job  run_job() options in snake_case (out, ids, logo, checkin_base, ...)
+   * @returns {Promise<string>} job id to poll with status()
+   */
+  async submit(job) {
+    if (this.closed) throw new Error('Label job queue is closed');
+    const id = newJobId();
+    const now = Date.now() / 1000;
+    await this._write(this._file('status', id), { id, state: 'queued', submitted: now, updated: now });
+    await this._write(this._file('queued', id), job);
+    this._ensureWorkers();
+    return id;
+  }
+
+  /**
+   * Latest status snapshot: { id, state, progress, result | error, ... }, or null for unknown ids.
+   * @param {string} id
+   */
+  async status(id) {
+    if (!JOB_ID_RE.test(String(id))) return null;
+    let status;
+    try {
+      status = JSON.parse(await fs.promises.readFile(this._file('status', id), 'utf8'));
+    } catch (e) {
+      if (e.code === 'ENOENT') return null;
+      throw e;
+    }
+    // jobs left over from before an API restart still need someone to run them
+    if (status.state === 'queued' || status.state === 'running') this._ensureWorkers();
+    return status;
+  }
+
+  /** Stop the workers started here; queued and running jobs stay on disk. */
+  close() {
+    this.closed = true;
+    for (const w of this.workers.splice(0)) w.cp.kill();
+  }
+}
+
+let shared = null;
+
+/**
+ * Shared queue for the API process (workers start with the first submitted job).
+ * @returns {LabelJobQueue}
+ */
+function getLabelJobQueue() {
+  if (!shared) {
+    const workers = parseInt(process.env.LABEL_QUEUE_WORKERS ?? '1', 10);
+    shared = new LabelJobQueue({ workers: Number.isFinite(workers) ? workers : 1 });
+    process.once('exit', () => shared && shared.close());
+  }
+  return shared;
+}
+
+module.exports = { LabelJobQueue, getLabelJobQueue, QUEUE_DIR };
@@ -0,0 +1,34 @@
+/**
+ * labelPaths.js
+ * Where the label generator and its inputs live, shared by routes/labels.js,
+ * labelWorkerPool.js and labelJobQueue.js.
+ *
+ * Env:
+ *   PYTHON_BIN  python executable (default: 'py' on Windows, 'python3' elsewhere)
+ */
+
+'use strict';
+
+const fs = require('fs');
+const path = require('path');
+
+const SCRIPT_PATH = path.join(__dirname, '..', 'scripts', 'generate_labels_L7651_v4.py');
+
+// Repo-relative first, then relative to the working directory; both spellings of the file name
+const LOGO_CANDIDATES = [
+  path.join(__dirname, '..', '..', 'assets', 'ES_Logo.png'),
+  path.join(__dirname, '..', '..', 'assets', 'ES_logo.png'),
+  path.join(process.cwd(), 'assets', 'ES_Logo.png'),
+  path.join(process.cwd(), 'assets', 'ES_logo.png'),
+];
+
+function pickPythonBin() {
+  return process.env.PYTHON_BIN || (process.platform === 'win32' ? 'py' : 'python3');
+}
+
+/** Path of the label logo, or undefined when none of the candidates exists. */
+function findLogoPath() {
+  return LOGO_CANDIDATES.find((p) => fs.existsSync(p));
+}
+
+module.exports = { SCRIPT_PATH, pickPythonBin, findLogoPath };
@@ -0,0 +1,153 @@
+/**
+ * labelWorkerPool.js
+ * Pool of warm `generate_labels_L7651_v4.py --serve` processes used by
+ * routes/labels.js instead of spawning a fresh Python per request.
+ *
+ * Each worker speaks JSON lines: one job object per line on stdin, one result
+ * object per line on stdout (matched by `id`). A worker handles one job at a
+ * time; extra jobs wait in a FIFO queue. Workers are started lazily on the
+ * first job, and a worker that exits or times out is replaced on demand.
+ *
+ * Env:
+ *   LABEL_WORKERS         pool size (default 1; 0 disables the pool → spawn per request)
+ *   LABEL_JOB_TIMEOUT_MS  per-job timeout before the worker is killed (default 300000)
+ *   PYTHON_BIN            python executable (see labelPaths.js)
+ */
+
+'use strict';
+
+const readline = require('readline');
+const { spawn } = require('child_process');
+const logger = require('./logger');
+const { SCRIPT_PATH, pickPythonBin } = require('./labelPaths');
+
+class LabelWorkerPool {
+  /**
+   * @param {object} [options]
+   * @param {number} [options.size]       Number of warm Python workers
+   * @param {number} [options.timeoutMs]  Per-job timeout
+   * @param {string[]} [options.extraArgs] Extra CLI args for `--serve` (e.g. ['--logo', path])
+   */
+  constructor({ size = 1, timeoutMs = 300000, extraArgs = [] } = {}) {
+    this.size = Math.max(1, size);
+    this.timeoutMs = timeoutMs;
+    this.extraArgs = extraArgs;
+    this.workers = [];
+    this.queue = [];
+    this.nextId = 1;
+    this.closed = false;
+  }
+
+  _spawnWorker() {
+    const py = pickPythonBin();
+    const args = [SCRIPT_PATH, '--serve', ...this.extraArgs];
+    const cp = spawn(py, py === 'py' ? ['-3', ...args] : args, { stdio: ['pipe', 'pipe', 'pipe'] });
+    const worker = { cp, job: null, timer: null, stderr: '' };
+
+    readline.createInterface({ input: cp.stdout }).on('line', (line) => {
+      let msg;
+      try {
+        msg = JSON.parse(line);
+      } catch (e) {
+        logger.warn('[labelWorkerPool] ignoring non-JSON worker output:', line);
+        return;
+      }
+      const job = worker.job;
+      if (!job || msg.id !== job.payload.id) return;
+      this._finish(worker, msg.ok ? null : new Error(`Generator failed: ${msg.error}`), msg);
+    });
+    // a dead worker is reported through 'close'; don't let EPIPE crash the API
+    cp.stdin.on('error', () => {});
+    cp.stderr.on('data', (d) => {
+      // keep only the tail for error reports
+      worker.stderr = (worker.stderr + d.toString()).slice(-4000);
+    });
+    cp.on('error', (e) => {
+      this._retire(worker, new Error(`Failed to start '${py}': ${e.message}. Set PYTHON_BIN or disable the pool with LABEL_WORKERS=0.`));
+    });
+    cp.on('close', (code) => {
+      this._retire(worker, new Error(`Label worker exited (${code}): ${worker.stderr}`));
+    });
+
+    this.workers.push(worker);
+    return worker;
+  }
+
+  _retire(worker, err) {
+    const i = this.workers.indexOf(worker);
+    if (i === -1) return;
+    this.workers.splice(i, 1);
+    if (worker.job) this._finish(worker, err);
+    this._drain();
+  }
+
+  _finish(worker, err, result) {
+    const job = worker.job;
+    worker.job = null;
+    clearTimeout(worker.timer);
+    if (err) job.reject(err);
+    else job.resolve(result);
+    this._drain();
+  }
+
+  _drain() {
+    if (this.closed) return;
+    while (this.queue.length) {
+      let worker = this.workers.find((w) => !w.job);
+      if (!worker && this.workers.length < this.size) worker = this._spawnWorker();
+      if (!worker) return;
+      const job = this.queue.shift();
+      worker.job = job;
+      worker.timer = setTimeout(() => {
+        worker.cp.kill();
+        this._retire(worker, new Error(`Label job timed out after ${this.timeoutMs} ms`));
+      }, this.timeoutMs);
+      worker.cp.stdin.write(`${JSON.stringify(job.payload)}\n`);
+    }
+  }
+
+  /**
+   * Run one label job on a warm worker.
+   * @param {object} job  generate_pdf options in snake_case (out, ids, logo, checkin_base, ...)
+   * @returns {Promise<{ok:boolean, pages:number, labels:number, seconds:number}>}
+   */
+  run(job) {
+    if (this.closed) return Promise.reject(new Error('Label worker pool is closed'));
+    return new Promise((resolve, reject) => {
+      this.queue.push({ payload: { ...job, id: this.nextId++ }, resolve, reject });
+      this._drain();
+    });
+  }
+
+  /** Stop all workers; queued jobs are rejected. */
+  close() {
+    this.closed = true;
+    for (const job of this.queue.splice(0)) job.reject(new Error('Label worker pool is closed'));
+    for (const w of this.workers.splice(0)) {
+      if (w.job) this._finish(w, new Error('Label worker pool is closed'));
+      w.cp.stdin.end();
+      w.cp.kill();
+    }
+  }
+}
+
+let shared = null;
+
+/**
+ * Shared pool for the API process, or null when disabled (LABEL_WORKERS=0).
+ * @returns {LabelWorkerPool|null}
+ */
+function getLabelWorkerPool() {
+  const size = parseInt(process.env.LABEL_WORKERS ?? '1', 10);
+  if (!Number.isFinite(size) || size <= 0) return null;
+  if (!shared) {
+    shared = new LabelWorkerPool({
+      size,
+      timeoutMs: parseInt(process.env.LABEL_JOB_TIMEOUT_MS || '300000', 10),
+    });
+    process.once('exit', () => shared && shared.close());
+  }
+  return shared;
+}
+
+module.exports = { LabelWorkerPool, getLabelWorkerPool, SCRIPT_PATH };
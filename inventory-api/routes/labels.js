@@ -2,15 +2,45 @@
 const express = require('express');
 const fs = require('fs');
 const path = require('path');
+const crypto = require('crypto');
 const { spawn } = require('child_process');
 const AWS = require('aws-sdk');
+const { getLabelWorkerPool } = require('../lib/labelWorkerPool');
+const { getLabelJobQueue } = require('../lib/labelJobQueue');
+const { pickPythonBin, findLogoPath } = require('../lib/labelPaths');
+// Request defaults, shared with the load test (scripts/bench_labels.py load)
+const LABEL_DEFAULTS = require('../lib/labelJobDefaults.json');
 
 const router = express.Router();
 
+// Runtime caches of the label generator (QR matrices, ...) — not web-served
+const LABEL_CACHE_DIR = path.join(__dirname, '..', '.cache', 'labels');
+const QR_CACHE_PATH = path.join(LABEL_CACHE_DIR, 'qr-matrix.sqlite');
+// Every generated ID is reserved here so random IDs never repeat across jobs/processes
+const ID_INDEX_PATH = path.join(LABEL_CACHE_DIR, 'issued-ids.sqlite');
+// Print history (unless a request sends record: false): every label's batch, page, slot and payload;
+// IDs printed before are rejected unless the job is an identical re-fetch of a cached sheet
+const LEDGER_PATH = path.join(LABEL_CACHE_DIR, 'ledger.sqlite');
+// Finished PDFs by job hash: re-running an identical job returns the earlier PDF
+const OUTPUT_CACHE_DIR = path.join(LABEL_CACHE_DIR, 'output');
+// Logo resampled to print size, keyed by the source file's hash
+const LOGO_CACHE_DIR = path.join(LABEL_CACHE_DIR, 'logos');
+// LABEL_TIMINGS=1 logs the generator's per-phase timings for every job
+const LOG_TIMINGS = !!process.env.LABEL_TIMINGS && process.env.LABEL_TIMINGS !== '0';
+// LABEL_QR_UPPERCASE=1 encodes upper-cased check-in URLs (smaller QR codes); only
+// when every check-in URL handler ignores case (the app scanner and /check-in/:id do)
+const QR_UPPERCASE = !!process.env.LABEL_QR_UPPERCASE && process.env.LABEL_QR_UPPERCASE !== '0';
+// LABEL_VERIFY=1 decodes every QR and ID of a sheet back before it is stored
+// (needs pymupdf and zxing-cpp); a sheet that fails verification is rejected
+const VERIFY = !!process.env.LABEL_VERIFY && process.env.LABEL_VERIFY !== '0';
+
 function ensureDir(p) { if (!fs.existsSync(p)) fs.mkdirSync(p, { recursive: true }); }
 
-function pickPythonBin() {
-  return process.env.PYTHON_BIN || (process.platform === 'win32' ? 'py' : 'python3');
+// Same summary as the generator's VerificationError
+function verificationError(failures) {
+  const where = failures.slice(0, 5)
+    .map((f) => `page ${f.page} row ${f.row} col ${f.col} ${f.id}: ${f.problem}`).join('; ');
+  return `Label verification failed for ${failures.length} check(s): ${where}`;
 }
 
 function resolveCheckinBase(req) {
@@ -45,17 +75,74 @@ async function uploadToS3(buffer, key) {
   return res.Location;
 }
 
+function runGeneratorProcess(scriptPath, { ids, logoPath, checkinBase, email, phone, fontScale, startIndex, showGrid, format = 'pdf', record = LABEL_DEFAULTS.record, reprint = false }) {
+  // IDs go in on stdin and the PDF (or PNG preview) comes back on stdout — no temp files
+  const args = [
+    scriptPath,
+    ...(logoPath ? ['--logo', logoPath, '--logo-cache', LOGO_CACHE_DIR] : []),
+    '--checkin-base', checkinBase,
+    '--email', email,
+    '--phone', phone,
+    '--out', '-',
+    '--csv', '',
+    '--font-scale', String(fontScale),
+    '--start-index', String(startIndex),
+    '--qr-cache', QR_CACHE_PATH,
+  ];
+  if (format === 'pdf') {
+    // Previews must not reserve IDs in the index
+    args.push('--id-index', ID_INDEX_PATH, '--output-cache', OUTPUT_CACHE_DIR);
+    if (record) { args.push('--ledger', LEDGER_PATH); }
+    if (record && reprint) { args.push('--reprint'); }
+    // Sheets go to S3 and field laptops: smaller PDF, identical print
+    if (LABEL_DEFAULTS.optimize) { args.push('--optimize'); }
+    if (VERIFY) { args.push('--verify'); }
+  } else {
+    args.push('--format', format);
+  }
+  if (ids.length) { args.push('--ids-file', '-'); }
+  if (showGrid) { args.push('--show-grid'); }
+  if (LOG_TIMINGS) { args.push('--timings'); }
+  if (QR_UPPERCASE) { args.push('--qr-uppercase'); }
+
+  const py = pickPythonBin();
+  // If using Windows launcher 'py', prefer Python 3 explicitly
+  const cmd = py;
+  const cmdArgs = (py === 'py') ? ['-3', ...args] : args;
+  return new Promise((resolve, reject) => {
+    const cp = spawn(cmd, cmdArgs, { stdio: ['pipe', 'pipe', 'pipe'] });
+    const chunks = []; let err = '';
+    cp.stdout.on('data', (d) => { chunks.push(d); });
+    cp.stderr.on('data', (d) => { err += d.toString(); });
+    cp.stdin.on('error', () => {}); // reported via 'close'
+    cp.stdin.end(ids.join('\n'), 'utf8');
+    cp.on('error', (e) => {
+      reject(new Error(`Failed to start '${cmd}': ${e.message}.\nSet PYTHON_BIN to your python.exe (e.g., C:\\Path\\to\\Python311\\python.exe) or ensure '${cmd}' is on PATH.`));
+    });
+    cp.on('close', (code) => {
+      if (code === 0) {
+        const line = err.split('\n').find((l) => l.includes('"label_timings"'));
+        if (line) console.log('[labels] timings:', line);
+        return resolve(Buffer.concat(chunks));
+      }
+      reject(new Error(`Generator failed (${code}) via '${cmd}': ${err}`));
+    });
+  });
+}
+
 router.post('/l7651', async (req, res) => {
   try {
     const {
       ids = [],
-      email = 'admin@engsurveys.com.au',
-      phone = '+61 8 8340 4469',
-      fontScale = 1.1,
+      email = LABEL_DEFAULTS.email,
+      phone = LABEL_DEFAULTS.phone,
+      fontScale = LABEL_DEFAULTS.fontScale,
       startIndex = 1,
       storage = undefined, // 's3' | 'local' | undefined (auto)
       fileName = undefined,
       showGrid = false,
+      record = LABEL_DEFAULTS.record, // record the labels in the print ledger (false for test prints)
+      reprint = false, // with record: allow IDs that were printed before
     } = req.body || {};
 
     const scriptPath = path.join(__dirname, '..', 'scripts', 'generate_labels_L7651_v4.py');
@@ -65,60 +152,57 @@ router.post('/l7651', async (req, res) => {
     const sheetsDir = path.join(qrRoot, 'sheets');
     ensureDir(qrRoot); ensureDir(sheetsDir);
 
-    const stamp = new Date().toISOString().replace(/[-:T]/g, '').slice(0, 14);
-    const baseName = (fileName && String(fileName).trim()) || `labels_l7651_${stamp}.pdf`;
-    const outPath = path.join(sheetsDir, baseName);
-
-    // Prepare ids file if provided
-    let idsFile = null;
-    if (Array.isArray(ids) && ids.length) {
-      idsFile = path.join(sheetsDir, `ids-${stamp}.txt`);
-      fs.writeFileSync(idsFile, ids.join('\n'), 'utf8');
-    }
-
     const checkinBase = resolveCheckinBase(req);
-    // Resolve logo path robustly relative to repo root (../.. from routes/)
-    const logoCandidates = [
-      path.join(__dirname, '..', '..', 'assets', 'ES_Logo.png'),
-      path.join(__dirname, '..', '..', 'assets', 'ES_logo.png'),
-      path.join(process.cwd(), 'assets', 'ES_Logo.png'),
-      path.join(process.cwd(), 'assets', 'ES_logo.png'),
-    ];
-    const logoPath = logoCandidates.find((p) => fs.existsSync(p));
-
-    const args = [
-      scriptPath,
-      ...(logoPath ? ['--logo', logoPath] : []),
-      '--checkin-base', checkinBase,
-      '--email', email,
-      '--phone', phone,
-      '--out', outPath,
-      '--font-scale', String(fontScale),
-      '--start-index', String(startIndex),
-    ];
-    if (idsFile) { args.push('--ids-file', idsFile); }
-    if (showGrid) { args.push('--show-grid'); }
-
-    const py = pickPythonBin();
-    // If using Windows launcher 'py', prefer Python 3 explicitly
-    const cmd = py;
-    const cmdArgs = (py === 'py') ? ['-3', ...args] : args;
-    await new Promise((resolve, reject) => {
-      const cp = spawn(cmd, cmdArgs, { stdio: ['ignore', 'pipe', 'pipe'] });
-      let out = ''; let err = '';
-      cp.stdout.on('data', (d) => { out += d.toString(); });
-      cp.stderr.on('data', (d) => { err += d.toString(); });
-      cp.on('error', (e) => {
-        reject(new Error(`Failed to start '${cmd}': ${e.message}.\nSet PYTHON_BIN to your python.exe (e.g., C:\\Path\\to\\Python311\\python.exe) or ensure '${cmd}' is on PATH.`));
+    const logoPath = findLogoPath();
+
+    // Prefer a warm --serve worker; fall back to spawn-per-request when LABEL_WORKERS=0.
+    // Either way the PDF comes back in memory and is written to disk once.
+    const idList = Array.isArray(ids) ? ids.map(String) : [];
+    const pool = getLabelWorkerPool();
+    let pdfBuf;
+    if (pool) {
+      const result = await pool.run({
+        ids: idList.length ? idList : null,
+        ...(logoPath ? { logo: logoPath, logo_cache: LOGO_CACHE_DIR } : {}),
+        checkin_base: checkinBase,
+        email,
+        phone,
+        out: '-',
+        font_scale: Number(fontScale),
+        start_index: Number(startIndex),
+        show_grid: !!showGrid,
+        qr_cache: QR_CACHE_PATH,
+        id_index: ID_INDEX_PATH,
+        output_cache: OUTPUT_CACHE_DIR,
+        ...(record ? { ledger: LEDGER_PATH } : {}),
+        ...(record && reprint ? { reprint: true } : {}),
+        optimize: LABEL_DEFAULTS.optimize,
+        ...(QR_UPPERCASE ? { qr_uppercase: true } : {}),
+        ...(LOG_TIMINGS ? { timings: true } : {}),
+        ...(VERIFY ? { verify: true } : {}),
       });
-      cp.on('close', (code) => {
-        if (code === 0) return resolve();
-        reject(new Error(`Generator failed (${code}) via '${cmd}': ${err || out}`));
+      if (result.timings) console.log('[labels] timings:', JSON.stringify(result.timings));
+      if (result.verify && result.verify.failures.length) {
+        throw new Error(verificationError(result.verify.failures));
+      }
+      pdfBuf = Buffer.from(result.pdf_b64, 'base64');
+    } else {
+      pdfBuf = await runGeneratorProcess(scriptPath, {
+        ids: idList, logoPath, checkinBase, email, phone, fontScale, startIndex, showGrid, record: !!record, reprint: !!reprint,
       });
-    });
+    }
 
-    // Read the PDF
-    const pdfBuf = fs.readFileSync(outPath);
+    // Default names are content-addressed, so a repeated identical job (served
+    // from the output cache) reuses its sheet file instead of adding another
+    const digest = crypto.createHash('sha256').update(pdfBuf).digest('hex').slice(0, 16);
+    const baseName = (fileName && String(fileName).trim()) || `labels_l7651_${digest}.pdf`;
+    const outPath = path.join(sheetsDir, baseName);
+    if (!fileName && fs.existsSync(outPath)) {
+      const now = new Date();
+      await fs.promises.utimes(outPath, now, now); // surfaces first in the sheets list again
+    } else {
+      await fs.promises.writeFile(outPath, pdfBuf);
+    }
 
     // Decide storage: prefer S3 if configured unless explicitly set to 'local'
     const wantS3 = storage === 's3';
@@ -134,9 +218,6 @@ router.post('/l7651', async (req, res) => {
     const apiBase = `${req.protocol}://${req.get('host')}`.replace(/\/+$/, '');
     const localUrl = `${apiBase}${STATIC_MOUNT}/sheets/${baseName}`;
 
-    // Cleanup temp ids file
-    if (idsFile && fs.existsSync(idsFile)) fs.unlink(idsFile, () => {});
-
     return res.json({
       status: 'ok',
       file: {
@@ -147,10 +228,206 @@ router.post('/l7651', async (req, res) => {
       },
     });
   } catch (e) {
+    if (/DuplicateIDError|already printed/.test(e.message || '')) {
+      // Rejected by the print ledger before rendering; resend with reprint: true to print them again
+      return res.status(409).json({ error: e.message });
+    }
     console.error('[labels] error:', e);
     return res.status(500).json({ error: e.message || 'Failed to generate labels' });
   }
 });
 
+// PNG preview of the first sheet (raster engine, same geometry as the PDF).
+// Nothing is stored and no IDs are reserved; without ids, random placeholders are shown.
+router.post('/l7651/preview', async (req, res) => {
+  try {
+    const {
+      ids = [],
+      email = LABEL_DEFAULTS.email,
+      phone = LABEL_DEFAULTS.phone,
+      fontScale = LABEL_DEFAULTS.fontScale,
+      startIndex = 1,
+      showGrid = false,
+      dpi = undefined,
+    } = req.body || {};
+
+    const scriptPath = path.join(__dirname, '..', 'scripts', 'generate_labels_L7651_v4.py');
+    if (!fs.existsSync(scriptPath)) return res.status(500).json({ error: 'Label generator script not found' });
+
+    const checkinBase = resolveCheckinBase(req);
+    const logoPath = findLogoPath();
+
+    const idList = Array.isArray(ids) ? ids.map(String) : [];
+    const pool = getLabelWorkerPool();
+    let pngBuf;
+    if (pool) {
+      const result = await pool.run({
+        ids: idList.length ? idList : null,
+        ...(logoPath ? { logo: logoPath, logo_cache: LOGO_CACHE_DIR } : {}),
+        checkin_base: checkinBase,
+        email,
+        phone,
+        out: '-',
+        format: 'png',
+        ...(dpi ? { dpi: Number(dpi) } : {}),
+        font_scale: Number(fontScale),
+        start_index: Number(startIndex),
+        show_grid: !!showGrid,
+        qr_cache: QR_CACHE_PATH,
+        ...(QR_UPPERCASE ? { qr_uppercase: true } : {}),
+      });
+      pngBuf = Buffer.from(result.png_b64, 'base64');
+    } else {
+      pngBuf = await runGeneratorProcess(scriptPath, {
+        ids: idList, logoPath, checkinBase, email, phone, fontScale, startIndex, showGrid, format: 'png',
+      });
+    }
+
+    res.set('Content-Type', 'image/png');
+    res.set('Cache-Control', 'no-store');
+    return res.send(pngBuf);
+  } catch (e) {
+    console.error('[labels] preview error:', e);
+    return res.status(500).json({ error: e.message || 'Failed to render label preview' });
+  }
+});
+
+// Queued generation for large runs: returns a job id at once; poll GET /l7651/jobs/:id
+// for progress (sheets done, labels/s, ETA). The sheet lands in utils/qrcodes/sheets.
+router.post('/l7651/jobs', async (req, res) => {
+  try {
+    const {
+      ids = [],
+      count = undefined, // new random IDs when ids is empty
+      email = LABEL_DEFAULTS.email,
+      phone = LABEL_DEFAULTS.phone,
+      fontScale = LABEL_DEFAULTS.fontScale,
+      startIndex = 1,
+      storage = undefined, // 's3' uploads the finished sheet on the first poll after it is done
+      fileName = undefined,
+      showGrid = false,
+      record = LABEL_DEFAULTS.record, // record the labels in the print ledger (false for test prints)
+      reprint = false, // with record: allow IDs that were printed before
+      exportFormat = undefined, // 'tsv' | 'jsonl': bulk-load file of the placed IDs beside the sheet
+    } = req.body || {};
+    if (exportFormat && !['tsv', 'jsonl'].includes(exportFormat)) {
+      return res.status(400).json({ error: "exportFormat must be 'tsv' or 'jsonl'" });
+    }
+
+    const sheetsDir = path.join(__dirname, '..', '..', 'utils', 'qrcodes', 'sheets');
+    ensureDir(sheetsDir);
+    const checkinBase = resolveCheckinBase(req);
+    const logoPath = findLogoPath();
+
+    const queue = getLabelJobQueue();
+    const idList = Array.isArray(ids) ? ids.map(String) : [];
+    // The sheet name must be known before the job runs, so the default one carries a
+    // random tag instead of the content digest the synchronous route uses
+    const baseName = (fileName && path.basename(String(fileName).trim()))
+      || `labels_l7651_${crypto.randomBytes(8).toString('hex')}.pdf`;
+    const exportName = exportFormat ? `${baseName.replace(/\.pdf$/i, '')}.${exportFormat}` : null;
+    const jobId = await queue.submit({
+      ids: idList.length ? idList : null,
+      ...(!idList.length && count ? { count: Number(count) } : {}),
+      ...(logoPath ? { logo: logoPath, logo_cache: LOGO_CACHE_DIR } : {}),
+      checkin_base: checkinBase,
+      email,
+      phone,
+      out: path.join(sheetsDir, baseName),
+      font_scale: Number(fontScale),
+      start_index: Number(startIndex),
+      show_grid: !!showGrid,
+      qr_cache: QR_CACHE_PATH,
+      id_index: ID_INDEX_PATH,
+      ...(record ? { ledger: LEDGER_PATH } : {}),
+      ...(record && reprint ? { reprint: true } : {}),
+      optimize: LABEL_DEFAULTS.optimize,
+      ...(QR_UPPERCASE ? { qr_uppercase: true } : {}),
+      ...(LOG_TIMINGS ? { timings: true } : {}),
+      ...(VERIFY ? { verify: true } : {}),
+      ...(exportName ? { export: path.join(sheetsDir, exportName), export_format: exportFormat } : {}),
+      // read back by GET /l7651/jobs/:id, ignored by the generator
+      api: { fileName: baseName, storage: storage || null, exportName },
+    });
+    return res.status(202).json({ status: 'queued', jobId, statusUrl: `${req.baseUrl}/l7651/jobs/${jobId}` });
+  } catch (e) {
+    console.error('[labels] queue error:', e);
+    return res.status(500).json({ error: e.message || 'Failed to queue label job' });
+  }
+});
+
+// Uploads in flight per job, so concurrent polls of a finished job upload once
+const s3Uploads = new Map();
+
+router.get('/l7651/jobs/:id', async (req, res) => {
+  try {
+    const queue = getLabelJobQueue();
+    const status = await queue.status(req.params.id);
+    if (!status) return res.status(404).json({ error: 'Unknown label job' });
+
+    const body = {
+      jobId: status.id,
+      state: status.state, // queued | running | done | failed
+      progress: status.progress || null,
+      submitted: status.submitted,
+      ...(status.started ? { started: status.started } : {}),
+      ...(status.finished ? { finished: status.finished } : {}),
+    };
+    // Workers fail jobs whose sheet does not verify; a done job that still carries
+    // failures (e.g. finished by an older worker) is reported failed and never served
+    const failures = (status.state === 'done' && status.result && status.result.verify
+      && status.result.verify.failures) || [];
+    if (failures.length) {
+      body.state = 'failed';
+      body.error = verificationError(failures);
+    }
+    if (body.state === 'failed' && !failures.length) {
+      body.error = status.error;
+      if (/DuplicateIDError|already printed/.test(status.error || '')) body.conflict = true;
+    }
+    if (body.state === 'done') {
+      const done = JSON.parse(await fs.promises.readFile(path.join(queue.root, 'done', `${status.id}.json`), 'utf8'));
+      const { fileName, storage, exportName } = (done.job && done.job.api) || {};
+      const result = status.result || {};
+      const config = require('../config');
+      const STATIC_MOUNT = (config && config.STATIC_MOUNT) || '/qrcodes';
+      const apiBase = `${req.protocol}://${req.get('host')}`.replace(/\/+$/, '');
+      body.result = { pages: result.pages, labels: result.labels, seconds: result.seconds, ledger: result.ledger };
+      body.file = { name: fileName, bytes: result.bytes, localUrl: `${apiBase}${STATIC_MOUNT}/sheets/${fileName}` };
+      if (exportName && result.export) {
+        const { format, rows, batch } = result.export;
+        body.export = { name: exportName, format, rows, batch, localUrl: `${apiBase}${STATIC_MOUNT}/sheets/${exportName}` };
+      }
+      if (storage === 's3') {
+        // The upload result is kept next to the job so later polls don't upload again
+        const sidecar = path.join(queue.root, 'done', `${status.id}.s3.json`);
+        let uploaded = null;
+        try {
+          uploaded = JSON.parse(await fs.promises.readFile(sidecar, 'utf8'));
+        } catch (e) {
+          if (e.code !== 'ENOENT') throw e;
+        }
+        if (!uploaded) {
+          if (!s3Uploads.has(status.id)) {
+            s3Uploads.set(status.id, (async () => {
+              const pdfBuf = await fs.promises.readFile(done.job.out);
+              const s3Url = await uploadToS3(pdfBuf, `qrcodes/sheets/${fileName}`);
+              await fs.promises.writeFile(sidecar, JSON.stringify({ s3Url }));
+              return { s3Url };
+            })().finally(() => s3Uploads.delete(status.id)));
+          }
+          uploaded = await s3Uploads.get(status.id);
+        }
+        body.file.s3Url = uploaded.s3Url;
+      }
+    }
+    res.set('Cache-Control', 'no-store');
+    return res.json(body);
+  } catch (e) {
+    console.error('[labels] job status error:', e);
+    return res.status(500).json({ error: e.message || 'Failed to read label job' });
+  }
+});
+
 module.exports = router;
 
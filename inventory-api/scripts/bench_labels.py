@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for generate_labels_L7651_v4.py (runs offline, no API needed).
+
+    python3 scripts/bench_labels.py suite [--quick] [--runs 1] [--update-baseline]
+    python3 scripts/bench_labels.py qr [--sheets 2] [--repeat 3]
+    python3 scripts/bench_labels.py ids [--count 1000000] [--rounds 2]
+    python3 scripts/bench_labels.py size [--sheets 10]
+    python3 scripts/bench_labels.py load [--jobs 40] [--concurrency 8] [--mode spawn worker]
+
+`suite` runs every case (1 label, partial sheet, full sheet, multi-sheet
+batches; each with/without logo and grid, the multi-sheet ones also with
+--workers 2 and 4) in a fresh process and records wall time, peak RSS, PDF
+bytes, content-stream operator count and the host's CPU count. Each case first
+renders one untimed label, so the deferred imports are not in its time.
+Worker speedups are printed against the single-process logo variant; their
+times are only compared with a baseline taken on the same CPU count. Results are
+compared with bench_labels_baseline.json and the run exits non-zero if any
+metric regresses past its tolerance. Timings are machine specific: refresh the
+baseline on the machine you compare on with --update-baseline --runs 5, which
+stores the median of five suite runs rather than one noisy sample.
+
+`qr` renders full 65-label sheets with every QR engine and prints, per sheet:
+content-stream operator count, PDF bytes and render time.
+
+`size` renders the same labels with and without --optimize and reports bytes
+per sheet before and after, with and without the logo.
+
+`load` is a load test of the path routes/labels.js takes. --concurrency
+simulated admins fire --jobs label jobs between them, with a seeded mix of
+sizes (single labels, partial sheets, new-ID sheets, multi-sheet batches).
+Each --mode runs in its own scratch cache and sheets directory:
+
+- spawn: one generator process per job, with runGeneratorProcess' arguments
+  (LABEL_WORKERS=0).
+- worker: warm --serve processes fed the JSON jobs labelWorkerPool sends.
+
+Every finished PDF is stored the way the route stores it, and the S3 upload
+is replaced by a stub with --s3-latency-ms. The report gives job latency
+(p50/p95/p99/max), throughput, CPU time and utilization, peak memory and
+failed jobs. Peak memory is the largest single process and the sampled total
+of all generator processes. Collisions count sheet names that two different
+PDFs would have been stored under, for the legacy second-resolution
+timestamp names and for the current content-digest names.
+
+`ids` allocates --count IDs per round into a scratch label_id_index file
+(each round checks against everything issued before) and verifies that no ID
+repeats.
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import time
+import math
+import queue
+import base64
+import random
+import statistics
+import hashlib
+import argparse
+import datetime
+import resource
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+import label_id_index  # noqa: E402
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+LOGO_PATH = os.path.join(REPO_ROOT, "assets", "ES_Logo.png")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_labels_baseline.json")
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate_labels_L7651_v4.py")
+# The label routes' request defaults (email, phone, font scale, ledger, optimize)
+ROUTE_DEFAULTS_PATH = os.path.join(REPO_ROOT, "inventory-api", "lib", "labelJobDefaults.json")
+
+# name -> (label count, start_index)
+CASES = {
+    "one_label": (1, 1),
+    "partial_sheet": (20, 46),
+    "full_sheet": (65, 1),
+    "multi_sheet_10": (650, 1),
+    "multi_sheet_40": (2600, 1),
+}
+QUICK_CASES = ("one_label", "partial_sheet", "full_sheet", "multi_sheet_10")
+VARIANTS = {
+    "logo": {"logo": True, "grid": False},
+    "nologo": {"logo": False, "grid": False},
+    "logo_grid": {"logo": True, "grid": True},
+    "nologo_grid": {"logo": False, "grid": True},
+    "logo_workers2": {"logo": True, "grid": False, "workers": 2},
+    "logo_workers4": {"logo": True, "grid": False, "workers": 4},
+}
+# --workers variants only run on the multi-sheet cases (one sheet cannot be split)
+WORKER_CASES = ("multi_sheet_10", "multi_sheet_40")
+
+# load: job kind -> (labels, start_index, weight); labels None = new IDs (the route sends no IDs)
+LOAD_MIX = {
+    "single": (1, 1, 3),
+    "partial": (20, 46, 3),
+    "new_sheet": (None, 1, 2),
+    "sheet": (65, 1, 2),
+    "batch_5": (325, 1, 1),
+    "batch_10": (650, 1, 0.5),
+}
+LOAD_MODES = ("spawn", "worker")
+# How often load samples the memory of the generator processes (s)
+RSS_SAMPLE_SECONDS = 0.02
+
+# Allowed growth over the baseline before a metric counts as a regression
+# (time is compared after dividing by the calibration workload, see _calibrate)
+# (time gets the most room: single runs on a shared 1-CPU host vary by about +-35%)
+TOLERANCE = {"seconds_norm": 0.50, "peak_rss_kb": 0.20, "bytes": 0.02, "ops": 0.01}
+# ...and by at least this much in absolute terms (keeps tiny cases from flapping:
+# a partial sheet is ~3 calibration units and swings by 2 of them between runs)
+MIN_DELTA = {"seconds_norm": 3.0, "peak_rss_kb": 2048, "bytes": 64, "ops": 16}
+# Iterations of the calibration workload (tens of milliseconds on one core)
+CALIBRATION_ROUNDS = 50000
+
+# Strings, names, dict/array delimiters, hex strings and numbers are operands;
+# any other bare word is an operator.
+_TOKEN_RE = re.compile(
+    rb"\((?:\\.|[^\\)])*\)|/[^\s/\[\]()<>{}%]*|<<|>>|\[|\]|<[0-9A-Fa-f\s]*>"
+    rb"|[-+]?(?:\d+\.?\d*|\.\d+)|([A-Za-z'\"*][A-Za-z0-9'\"*]*)"
+)
+
+
+_LENGTH_RE = re.compile(rb"/Length (\d+)")
+
+
+def _decode_stream(head, raw):
+    if b"/ASCII85Decode" in head:
+        raw = raw.strip()
+        if raw.startswith(b"<~"):
+            raw = raw[2:]
+        if raw.endswith(b"~>"):
+            raw = raw[:-2]
+        raw = base64.a85decode(raw)
+    if b"/FlateDecode" in head:
+        raw = zlib.decompress(raw)
+    return raw
+
+
+def iter_streams(pdf_bytes):
+    """Yield ``(dict_bytes, raw_stream_bytes)`` for every stream object.
+
+    Splitting on ``endobj`` is exact for reportlab's ASCII85 streams; binary
+    (--optimize) streams could contain those bytes in theory, but the odds are
+    negligible for a benchmark.
+    """
+    for chunk in pdf_bytes.split(b"endobj"):
+        head, sep, rest = chunk.partition(b"stream")
+        if not sep or b"endstream" not in rest:
+            continue
+        rest = rest[2:] if rest.startswith(b"\r\n") else rest[1:] if rest.startswith(b"\n") else rest
+        m = _LENGTH_RE.search(head)
+        yield head, rest[:int(m.group(1))] if m else rest[:rest.rfind(b"endstream")]
+
+
+def pdf_stats(pdf_bytes):
+    """Return ``{"bytes", "ops", "content_bytes"}`` for a reportlab-written PDF.
+
+    ``ops`` counts operators in page and form content streams (images are skipped);
+    ``content_bytes`` is the decoded size of those streams.
+    """
+    ops = 0
+    content = 0
+    for head, raw in iter_streams(pdf_bytes):
+        if b"/Image" in head:
+            continue
+        data = _decode_stream(head, raw)
+        content += len(data)
+        ops += sum(1 for t in _TOKEN_RE.finditer(data) if t.group(1))
+    return {"bytes": len(pdf_bytes), "ops": ops, "content_bytes": content}
+
+
+def random_ids(n, seed=1234):
+    rng = random.Random(seed)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    return ["".join(rng.choice(alphabet) for _ in range(8)) for _ in range(n)]
+
+
+def bench_qr(args):
+    ids = random_ids(args.sheets * labels.SLOTS_PER_SHEET)
+    rows = []
+    for engine in labels.QR_ENGINES:
+        best = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            pdf = labels.render_labels(ids, logo_path=LOGO_PATH, qr_engine=engine)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        st = pdf_stats(pdf)
+        rows.append((engine, st["ops"] / args.sheets, st["bytes"] / args.sheets, best / args.sheets))
+    print(f"{'engine':<8} {'ops/sheet':>10} {'bytes/sheet':>12} {'s/sheet':>8}")
+    for engine, ops, size, secs in rows:
+        print(f"{engine:<8} {ops:>10.0f} {size:>12.0f} {secs:>8.3f}")
+
+
+def bench_size(args):
+    ids = random_ids(args.sheets * labels.SLOTS_PER_SHEET)
+    print(f"{'variant':<8} {'default B/sheet':>16} {'optimized B/sheet':>18} {'saved':>7}")
+    for vname, logo in (("logo", LOGO_PATH), ("nologo", None)):
+        before = len(labels.render_labels(ids, logo_path=logo)) / args.sheets
+        after = len(labels.render_labels(ids, logo_path=logo, optimize=True)) / args.sheets
+        print(f"{vname:<8} {before:>16.0f} {after:>18.0f} {(1 - after / before) * 100:>6.1f}%")
+
+
+def bench_ids(args):
+    seen = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        index = label_id_index.IDIndex(os.path.join(tmp, "ids.sqlite"))
+        for r in range(args.rounds):
+            t0 = time.perf_counter()
+            ids = index.allocate(args.count)
+            dt = time.perf_counter() - t0
+            seen.update(ids)
+            print(f"round {r + 1}: {len(ids)} IDs in {dt:.2f}s ({len(ids) / dt:,.0f}/s), index holds {len(index)}")
+        index.close()
+    if len(seen) != args.count * args.rounds:
+        print(f"DUPLICATES: {args.count * args.rounds - len(seen)}")
+        return 1
+    print("All IDs unique.")
+    return 0
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def load_jobs(count, seed=1234):
+    """``count`` (kind, ids or None, start_index) jobs drawn from LOAD_MIX; IDs never repeat across jobs."""
+    rng = random.Random(seed)
+    kinds = list(LOAD_MIX)
+    weights = [LOAD_MIX[k][2] for k in kinds]
+    jobs = []
+    used = set()
+    for n in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        size, start_index, _weight = LOAD_MIX[kind]
+        ids = None
+        if size is not None:
+            ids = [uid for uid in random_ids(size * 2, seed=seed * 1000 + n) if uid not in used][:size]
+            used.update(ids)
+        jobs.append((kind, ids, start_index))
+    return jobs
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _RSSSampler(threading.Thread):
+    """Samples the RSS of a changing set of pids (Linux /proc; reads 0 elsewhere).
+
+    ``peak`` is the largest sum seen at one time, ``peak_one`` the largest single process.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pids = set()
+        self.peak = 0
+        self.peak_one = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            sizes = [_rss_bytes(pid) for pid in list(self.pids)]
+            self.peak = max(self.peak, sum(sizes))
+            self.peak_one = max(self.peak_one, max(sizes, default=0))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class _ServePool:
+    """Warm --serve workers handed out one job at a time, FIFO like labelWorkerPool."""
+
+    def __init__(self, size, sampler):
+        self.procs = [subprocess.Popen([sys.executable, SCRIPT_PATH, "--serve", "--logo", LOGO_PATH],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                       text=True) for _ in range(size)]
+        self.idle = queue.Queue()
+        self.next_id = iter(range(1, 1 << 62))
+        for proc in self.procs:
+            sampler.pids.add(proc.pid)
+            self.idle.put(proc)
+
+    def run(self, job):
+        proc = self.idle.get()
+        try:
+            proc.stdin.write(json.dumps(dict(job, id=next(self.next_id))) + "\n")
+            proc.stdin.flush()
+            resp = json.loads(proc.stdout.readline())
+        finally:
+            self.idle.put(proc)
+        if not resp.get("ok"):
+            raise RuntimeError(resp.get("error"))
+        return base64.b64decode(resp["pdf_b64"])
+
+    def close(self):
+        for proc in self.procs:
+            proc.stdin.close()
+        for proc in self.procs:
+            proc.wait()
+
+
+def route_defaults():
+    """The request defaults routes/labels.js fills in (lib/labelJobDefaults.json)."""
+    with open(ROUTE_DEFAULTS_PATH) as fh:
+        return json.load(fh)
+
+
+def _spawn_job(ids, start_index, cache, sampler):
+    """One generator process with runGeneratorProcess' arguments; returns the PDF bytes."""
+    route = route_defaults()
+    args = [sys.executable, SCRIPT_PATH, "--logo", LOGO_PATH, "--logo-cache", cache["logos"],
+            "--checkin-base", "http://localhost:3000/check-in", "--email", route["email"],
+            "--phone", route["phone"], "--out", "-", "--csv", "", "--font-scale", str(route["fontScale"]),
+            "--start-index", str(start_index), "--qr-cache", cache["qr"], "--id-index", cache["ids"],
+            "--output-cache", cache["output"]]
+    if route["record"]:
+        args += ["--ledger", cache["ledger"]]
+    if route["optimize"]:
+        args.append("--optimize")
+    if ids:
+        args += ["--ids-file", "-"]
+    proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    sampler.pids.add(proc.pid)
+    try:
+        pdf, err = proc.communicate("\n".join(ids or ()).encode("utf-8"))
+    finally:
+        sampler.pids.discard(proc.pid)
+    if proc.returncode:
+        raise RuntimeError(f"generator exited {proc.returncode}: {err.decode('utf-8', 'replace')[-500:]}")
+    return pdf
+
+
+def _worker_job(ids, start_index, cache, pool):
+    """The job labelWorkerPool sends for POST /l7651; returns the PDF bytes."""
+    route = route_defaults()
+    return pool.run({
+        "ids": ids, "logo": LOGO_PATH, "logo_cache": cache["logos"],
+        "checkin_base": "http://localhost:3000/check-in", "email": route["email"],
+        "phone": route["phone"], "out": "-", "font_scale": route["fontScale"], "start_index": start_index,
+        "show_grid": False, "qr_cache": cache["qr"], "id_index": cache["ids"],
+        "output_cache": cache["output"], **({"ledger": cache["ledger"]} if route["record"] else {}),
+        "optimize": route["optimize"],
+    })
+
+
+def _children_cpu():
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def run_load(mode, jobs, concurrency, workers, s3_latency):
+    """Run ``jobs`` (see load_jobs) ``concurrency`` at a time in ``mode``; returns the report dict."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = {name: os.path.join(tmp, file) for name, file in (
+            ("qr", "qr-matrix.sqlite"), ("ids", "issued-ids.sqlite"), ("ledger", "ledger.sqlite"),
+            ("output", "output"), ("logos", "logos"), ("sheets", "sheets"))}
+        os.makedirs(cache["sheets"])
+        sampler = _RSSSampler()
+        sampler.start()
+        lock = threading.Lock()
+        names = {"stamp": {}, "digest": {}}
+        collisions = {"stamp": 0, "digest": 0}
+        uploads = []
+        cpu0 = _children_cpu()
+        pool = _ServePool(workers, sampler) if mode == "worker" else None
+
+        def one(job):
+            _kind, ids, start_index = job
+            t0 = time.perf_counter()
+            if pool:
+                pdf = _worker_job(ids, start_index, cache, pool)
+            else:
+                pdf = _spawn_job(ids, start_index, cache, sampler)
+            digest = hashlib.sha256(pdf).hexdigest()
+            stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%S")
+            candidates = {"stamp": f"labels_l7651_{stamp}.pdf", "digest": f"labels_l7651_{digest[:16]}.pdf"}
+            with lock:
+                for scheme, name in candidates.items():
+                    # Same name, different sheet: the route would overwrite an earlier job's file
+                    if names[scheme].setdefault(name, digest) != digest:
+                        collisions[scheme] += 1
+            with open(os.path.join(cache["sheets"], candidates["digest"]), "wb") as fh:
+                fh.write(pdf)
+            time.sleep(s3_latency)  # stubbed S3 upload
+            with lock:
+                uploads.append(f"qrcodes/sheets/{candidates['digest']}")
+            return time.perf_counter() - t0, len(ids) if ids else labels.SLOTS_PER_SHEET
+
+        latencies, label_count, errors = [], 0, []
+        t0 = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as ex:
+                for future in [ex.submit(one, job) for job in jobs]:
+                    try:
+                        seconds, n = future.result()
+                    except Exception as e:
+                        errors.append(f"{type(e).__name__}: {e}")
+                        continue
+                    latencies.append(seconds)
+                    label_count += n
+        finally:
+            if pool:
+                pool.close()
+            wall = time.perf_counter() - t0
+            sampler.stop()
+        cpu = _children_cpu() - cpu0
+    return {
+        "mode": mode, "jobs": len(jobs), "concurrency": concurrency, "workers": workers if pool else None,
+        "ok": len(latencies), "errors": errors,
+        "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+        "max": max(latencies, default=None), "wall_seconds": wall,
+        "jobs_per_second": len(latencies) / wall, "labels_per_second": label_count / wall,
+        "cpu_seconds": cpu, "cpu_utilization": cpu / wall / (os.cpu_count() or 1),
+        "max_process_rss_mb": sampler.peak_one / 2**20,
+        "peak_total_rss_mb": sampler.peak / 2**20,
+        "collisions": collisions, "uploads": len(uploads),
+    }
+
+
+def bench_load(args):
+    jobs = load_jobs(args.jobs, args.seed)
+    mix = {}
+    for kind, _ids, _start in jobs:
+        mix[kind] = mix.get(kind, 0) + 1
+    print(f"{args.jobs} jobs, {args.concurrency} concurrent, mix: "
+          + ", ".join(f"{kind} x{n}" for kind, n in sorted(mix.items())))
+    workers = args.workers or min(args.concurrency, os.cpu_count() or 1)
+    reports = []
+    print(f"{'mode':<10} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'jobs/s':>7} {'labels/s':>9} "
+          f"{'CPU s':>7} {'CPU%':>5} {'proc MB':>8} {'total MB':>9} {'errors':>6} {'collisions stamp/digest':>24}")
+    for mode in args.mode:
+        r = run_load(mode, jobs, args.concurrency, workers, args.s3_latency_ms / 1000)
+        reports.append(r)
+        mode_name = f"{mode}[{workers}]" if mode == "worker" else mode
+        print(f"{mode_name:<10} {r['p50'] or 0:>7.2f} {r['p95'] or 0:>7.2f} {r['p99'] or 0:>7.2f} {r['max'] or 0:>7.2f} "
+              f"{r['jobs_per_second']:>7.2f} {r['labels_per_second']:>9.1f} {r['cpu_seconds']:>7.1f} "
+              f"{r['cpu_utilization'] * 100:>4.0f}% {r['max_process_rss_mb']:>8.1f} {r['peak_total_rss_mb']:>9.1f} "
+              f"{len(r['errors']):>6} {r['collisions']['stamp']:>17}/{r['collisions']['digest']}")
+        for err in r["errors"][:3]:
+            print(f"  {err}")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(reports, fh, indent=2)
+            fh.write("\n")
+    return 1 if any(r["errors"] or r["collisions"]["digest"] for r in reports) else 0
+
+
+def _calibration_workload():
+    acc = 0
+    parts = []
+    digest = b"calibrate"
+    for i in range(CALIBRATION_ROUNDS):
+        digest = hashlib.sha256(digest).digest()
+        acc = (acc * 31 + digest[i % 32] + i) & 0xFFFFFFFF
+        parts.append(f"{acc:08x}")
+        if len(parts) == 64:
+            acc ^= zlib.crc32("".join(parts).encode()) & 0xFFFF
+            parts.clear()
+    return acc
+
+
+def _calibrate():
+    """Time a fixed pure-Python workload (hashing, integer and string ops), best of 3.
+
+    Case times are also stored divided by this, so a slower or busier machine
+    does not read as a regression. The workload uses nothing from the
+    generator: a slower QR encoder must show up in the case times, not cancel
+    out against the calibration.
+    """
+    best = None
+    for _ in range(3):
+        t0 = time.perf_counter()
+        _calibration_workload()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def _run_case(count, start_index, logo, grid, repeat, workers=1):
+    """Runs in a fresh process so peak RSS belongs to this case alone.
+
+    One untimed label with the same options is rendered first: the generator
+    defers reportlab and PIL imports to the first render, and that one-off
+    cost is reported as ``warmup_seconds`` instead of landing in the case time.
+    The calibration runs before and after the case and the mean is used, so
+    load that comes and goes during a long case is divided out too.
+    """
+    calib_before = _calibrate()
+    logo_path = LOGO_PATH if logo else None
+    t0 = time.perf_counter()
+    labels.render_labels(random_ids(1, seed=99), logo_path=logo_path, show_grid=grid)
+    warmup = time.perf_counter() - t0
+    ids = random_ids(count)
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        pdf = labels.render_labels(ids, logo_path=logo_path, show_grid=grid, start_index=start_index,
+                                   workers=workers)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    calib = (calib_before + _calibrate()) / 2
+    st = pdf_stats(pdf)
+    return {
+        "seconds": round(best, 4),
+        "seconds_norm": round(best / calib, 3),
+        "warmup_seconds": round(warmup, 4),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "bytes": st["bytes"],
+        "ops": st["ops"],
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline):
+    """Return a list of regression messages (empty when everything is within tolerance)."""
+    problems = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        pooled = VARIANTS.get(name.split("/", 1)[-1], {}).get("workers", 1) > 1
+        for metric, tol in TOLERANCE.items():
+            if metric == "seconds_norm" and pooled and base.get("cpu_count") != metrics.get("cpu_count"):
+                continue  # a worker pool's speedup depends on the cores available
+            old, new = base.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tol) and new - old > MIN_DELTA[metric]:
+                problems.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.1f}%, limit +{tol * 100:.0f}%)")
+    return problems
+
+
+def median_results(runs):
+    """Per case, the median of every metric over ``runs`` (suite results of the same cases)."""
+    return {key: {metric: statistics.median(run[key][metric] for run in runs) for metric in runs[0][key]}
+            for key in runs[0]}
+
+
+def _print_result(key, m, results):
+    speedup = ""
+    if "workers" in key:
+        case = key.split("/", 1)[0]
+        speedup = f"  x{results[f'{case}/logo']['seconds'] / m['seconds']:.2f} on {m['cpu_count']} CPUs"
+    print(f"{key:<30} {m['seconds']:>8.3f} {m['peak_rss_kb'] / 1024:>8.1f}MB {m['bytes']:>10} {m['ops']:>8}"
+          + speedup)
+
+
+def _suite_run(names, ctx, repeat):
+    results = {}
+    for name in names:
+        count, start_index = CASES[name]
+        for vname, v in VARIANTS.items():
+            workers = v.get("workers", 1)
+            if workers > 1 and name not in WORKER_CASES:
+                continue
+            key = f"{name}/{vname}"
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+                results[key] = ex.submit(_run_case, count, start_index, v["logo"], v["grid"], repeat, workers).result()
+            _print_result(key, results[key], results)
+    return results
+
+
+def bench_suite(args):
+    names = QUICK_CASES if args.quick else tuple(CASES)
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'case':<30} {'seconds':>8} {'peak RSS':>10} {'bytes':>10} {'ops':>8}")
+    runs = []
+    for run in range(args.runs):
+        if args.runs > 1:
+            print(f"-- run {run + 1}/{args.runs}")
+        runs.append(_suite_run(names, ctx, args.repeat))
+    results = median_results(runs)
+    if args.runs > 1:
+        print(f"-- median of {args.runs} runs")
+        for key, m in results.items():
+            _print_result(key, m, results)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fh:
+                baseline = json.load(fh)
+        baseline.update(results)
+        with open(args.baseline, "w") as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"Baseline updated -> {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline first.")
+        return 0
+    with open(args.baseline) as fh:
+        problems = compare(results, json.load(fh))
+    if problems:
+        print("\nREGRESSIONS:")
+        for msg in problems:
+            print("  " + msg)
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label generator benchmarks.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_suite = sub.add_parser("suite", help="Run all cases and compare with the stored baseline.")
+    p_suite.add_argument("--quick", action="store_true", help="Skip the largest batch.")
+    p_suite.add_argument("--repeat", type=int, default=1, help="Runs per case (best time is kept).")
+    p_suite.add_argument("--runs", type=int, default=1,
+                         help="Run the whole suite this many times and use each metric's median "
+                              "(record baselines with 5).")
+    p_suite.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON file.")
+    p_suite.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline.")
+    p_suite.set_defaults(func=bench_suite)
+    p_qr = sub.add_parser("qr", help="Compare QR rendering engines per full sheet.")
+    p_qr.add_argument("--sheets", type=int, default=2, help="Sheets per run.")
+    p_qr.add_argument("--repeat", type=int, default=3, help="Runs per engine (best time is reported).")
+    p_qr.set_defaults(func=bench_qr)
+    p_size = sub.add_parser("size", help="Compare PDF bytes per sheet with and without --optimize.")
+    p_size.add_argument("--sheets", type=int, default=10, help="Sheets per render.")
+    p_size.set_defaults(func=bench_size)
+    p_ids = sub.add_parser("ids", help="Time collision-free ID allocation against a growing index.")
+    p_ids.add_argument("--count", type=int, default=1000000, help="IDs per round.")
+    p_ids.add_argument("--rounds", type=int, default=2, help="Allocation rounds into the same index.")
+    p_ids.set_defaults(func=bench_ids)
+    p_load = sub.add_parser("load", help="Concurrent mixed label jobs through the route's generator path.")
+    p_load.add_argument("--jobs", type=int, default=40, help="Jobs in total.")
+    p_load.add_argument("--concurrency", type=int, default=8, help="Jobs in flight at once (simulated admins).")
+    p_load.add_argument("--mode", nargs="+", choices=LOAD_MODES, default=list(LOAD_MODES),
+                        help="Generator modes to compare (each in a fresh scratch cache).")
+    p_load.add_argument("--workers", type=int, default=None,
+                        help="Warm --serve workers in worker mode (default: concurrency, capped at the CPU count).")
+    p_load.add_argument("--s3-latency-ms", type=float, default=0.0, help="Time the stubbed S3 upload takes per sheet.")
+    p_load.add_argument("--seed", type=int, default=1234, help="Seed of the job mix and IDs.")
+    p_load.add_argument("--json", default=None, help="Also write the reports to this JSON file.")
+    p_load.set_defaults(func=bench_load)
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    main()
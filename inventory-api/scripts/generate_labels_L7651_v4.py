@@ -17,32 +17,48 @@ Inside each label (left → right):
 Text block is vertically centered relative to the QR height.
 """
 
+import io
 import os
+import re
 import sys
 import csv
+import base64
 import json
-import random
+import time
+import shutil
+import types
+import hashlib
 import argparse
-from reportlab.pdfgen import canvas
+import tempfile
+import itertools
+import functools
+import contextlib
+
+_IMPORT_T0 = time.perf_counter()
+import reportlab
 from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-from reportlab.graphics.barcode import qr as rl_qr
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics import renderPDF
+from label_qr_encoder import LEVEL_CHOICES, QR_LEVELS, encode_qr
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_T0
+# The rest of reportlab (canvas, pdfmetrics, colors, the QrCodeWidget route) and
+# PIL are imported where they are first used, so --help, --lookup, --queue and
+# small jobs only load what they need (see --startup-report).
 
 # ---------- Constants (mm/points) ----------
 A4_W, A4_H = 210.0, 297.0
 LABEL_W, LABEL_H = 38.1, 21.2
 COLS, ROWS = 5, 13
+SLOTS_PER_SHEET = COLS * ROWS
 
 PADDING_L = 1.0   # mm — left inner padding of a label (label left edge → QR left)
 PADDING_R = 1.0   # mm — right inner padding of a label
 QR_W = 19.0       # mm
 QR_H = 19.0       # mm
 GAP = 0      # mm — BASE horizontal gap between the QR and the right stack (logo + text)
+GAP_REDUCTION_MM = 0.6  # mm — tighten the QR → right-stack spacing beyond GAP
 LOGO_MAX_W = 19.0 # mm (allow a bit wider; clamped to section)
 LOGO_MAX_H = 12.0 # mm (slightly taller)
+# The logo is resampled to the size it is drawn at for this print resolution
+LOGO_DPI = 300
 
 EMAIL_PT = 4.0
 PHONE_PT = 4.0
@@ -85,10 +101,230 @@ FONT_CANDIDATES = [
 # 0 = first pair in FONT_CANDIDATES (Helvetica)
 SELECTED_FONT_INDEX = 0
 
+# QR rendering: "path" merges dark modules into one filled path per code,
+# "widget" is the original QrCodeWidget/renderPDF route (one shape per run)
+QR_ENGINES = ("path", "widget")
+DEFAULT_QR_ENGINE = "path"
+QR_BORDER = 4      # quiet-zone width in modules (QrCodeWidget default)
+QR_LEVEL = "L"     # error-correction level (QrCodeWidget default); "auto" = strongest free one, see label_qr_encoder.py
+
+# --optimize: decimals kept in content-stream numbers (0.001 pt ≈ 0.35 µm)
+OPTIMIZE_DIGITS = 3
+
+# --format: raster outputs (see label_raster.py) and their default resolution:
+# screen previews, and the common 8 dots/mm thermal print head
+RASTER_FORMATS = ("png", "zpl", "pbm")
+RASTER_DPI = {"png": 150, "zpl": 203, "pbm": 203}
+# Least time (s) between two progress reports of a queued job (see progress_tracker)
+PROGRESS_INTERVAL = 0.5
+# --queue-worker: seconds between looks at an empty queue
+QUEUE_POLL_SECONDS = 1.0
+# --verify: print resolution finished PDFs are rasterized at to decode them back (see label_verify.py)
+VERIFY_DPI = 300
+
+# --workers: sheets per process-pool task (amortises the per-task setup)
+PARALLEL_CHUNK_SHEETS = 4
+
+# Defaults shared by the CLI flags and --serve job requests
+DEFAULT_LOGO = "assets/ES_logo.png"
+DEFAULT_CHECKIN_BASE = "http://localhost:3000/check-in"
+DEFAULT_EMAIL = "admin@engsurveys.com.au"
+DEFAULT_PHONE = "+61 8 8340 4469"
+
+# --ids-file ingestion: read size per chunk, and the accepted ID shape (URL-safe,
+# since the ID becomes the last path segment of the QR payload)
+IDS_READ_CHUNK = 1 << 16
+ID_RE = re.compile(r"[A-Za-z0-9._~-]{1,64}")
+# Header names of the ID column in CSV input (matched case-insensitively)
+ID_HEADERS = ("id", "uid", "asset_id")
+
+# Decoded print-size logos, keyed by (absolute path, mtime), reused across jobs in --serve mode
+_LOGO_CACHE = {}
+# Open QR matrix caches by path (see label_qr_cache.py), also kept across jobs
+_QR_CACHES = {}
+# Open issued-ID indexes by path (see label_id_index.py)
+_ID_INDEXES = {}
+# Open finished-PDF caches by directory (see label_output_cache.py)
+_OUTPUT_CACHES = {}
+# Open print-history ledgers by path (see label_ledger.py)
+_LEDGERS = {}
+# SHA-256 of logo files, keyed by (absolute path, mtime)
+_LOGO_DIGESTS = {}
+
+# Bump when a rendering change alters the PDF for the same inputs, so cached
+# outputs (--output-cache) from older code are never served
+OUTPUT_FORMAT = 5
+# Module constants that shape the output; all of them are part of the job key
+LAYOUT_CONSTANTS = (
+    "A4_W", "A4_H", "LABEL_W", "LABEL_H", "COLS", "ROWS", "PADDING_L", "PADDING_R", "QR_W", "QR_H",
+    "GAP", "GAP_REDUCTION_MM", "LOGO_MAX_W", "LOGO_MAX_H", "LOGO_DPI", "EMAIL_PT", "PHONE_PT", "ID_PT", "TEXT_HSCALE",
+    "RIGHT_SECTION_TOP_OFFSET_MM", "IN_LABEL_X_NUDGE_MM", "VERTICAL_UP_OFFSET_MM",
+    "COLUMN_SHIFTS_PERCENT", "FONT_CANDIDATES", "SELECTED_FONT_INDEX", "QR_BORDER", "QR_LEVEL",
+)
+# Compiled sheet layouts kept, by (logo source pixel size, font scale); font_scale comes from clients
+LAYOUT_CACHE_SIZE = 64
+
+
+class Timings:
+    """Per-phase wall time and counters collected for --timings.
+
+    Spans may nest; each phase is charged only its own (exclusive) time, so the
+    phases add up to the instrumented total.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        self._stack = []
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, record, prefix=""):
+        for k, v in record["phases"].items():
+            self.phases[prefix + k] = self.phases.get(prefix + k, 0.0) + v
+        for k, v in record["counts"].items():
+            self.count(prefix + k, v)
+
+    def record(self):
+        return {"phases": {k: round(v, 6) for k, v in self.phases.items()}, "counts": dict(self.counts)}
+
+
+class _Span:
+    __slots__ = ("timings", "name", "t0", "child")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.child = 0.0
+        self.timings._stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        stack = self.timings._stack
+        stack.pop()
+        phases = self.timings.phases
+        phases[self.name] = phases.get(self.name, 0.0) + dt - self.child
+        if stack:
+            stack[-1].child += dt
+        return False
+
+
+class _NoTimings:
+    """Used while --timings is off: spans are a shared no-op context."""
+
+    _null = contextlib.nullcontext()
+
+    def span(self, name):
+        return self._null
+
+    def count(self, name, n=1):
+        pass
+
+
+NO_TIMINGS = _NoTimings()
+_timings = NO_TIMINGS
+
+
+def set_timings(timings):
+    """Install a Timings collector (or NO_TIMINGS) for this process; returns the previous one."""
+    global _timings
+    previous, _timings = _timings, timings
+    return previous
+
+
+def open_id_index(path):
+    """Return the shared IDIndex for ``path`` (None means no uniqueness index)."""
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    index = _ID_INDEXES.get(path)
+    if index is None:
+        from label_id_index import IDIndex
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        index = _ID_INDEXES[path] = IDIndex(path)
+    return index
+
+
+def open_ledger(path):
+    """Return the shared print-history Ledger for ``path`` (None means no ledger)."""
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    ledger = _LEDGERS.get(path)
+    if ledger is None:
+        from label_ledger import Ledger
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ledger = _LEDGERS[path] = Ledger(path)
+    return ledger
+
+
+@contextlib.contextmanager
+def ledger_batch(ledger, ids, checkin_base, start_index=1, qr_uppercase=False, batch=None, reprint=False):
+    """Record a render of ``ids`` (a list) in ``ledger`` around the ``with`` body.
+
+    Every label's page, slot and QR payload is appended before the body runs,
+    and IDs printed before are rejected there with DuplicateIDError unless
+    ``reprint``. The batch is marked printed when the body completes and failed
+    when it raises. Yields ``{"batch": name, "labels": n}`` (None without a
+    ledger).
+    """
+    if ledger is None:
+        yield None
+        return
+    rows = ((page, slot, uid, qr_payload(checkin_base, uid, qr_uppercase))
+            for page, sheet in enumerate(iter_sheets(ids, start_index), 1) for slot, uid in sheet)
+    with _timings.span("ledger"):
+        batch_id, name, labels = ledger.begin_batch(rows, batch, reprint)
+    ok = False
+    try:
+        yield {"batch": name, "labels": labels}
+        ok = True
+    finally:
+        with _timings.span("ledger"):
+            ledger.finish_batch(batch_id, ok)
+
+
+def open_export(path, checkin_base, qr_uppercase=False, batch=None, fmt=None):
+    """Bulk-load export of a run's labels to ``path`` (see label_export.py).
+
+    A context manager yielding the IDExport to pass to generate_pdf (None
+    without a path); the file appears only if the ``with`` body completes.
+    ``batch`` is the ledger batch name (a fresh one when not given).
+    """
+    if not path:
+        return contextlib.nullcontext()
+    from label_export import IDExport
+    if batch is None:
+        from label_ledger import batch_name
+        batch = batch_name()
+    return IDExport(path, functools.partial(qr_payload, checkin_base, uppercase=qr_uppercase), batch, fmt)
+
+
+def reprint_ids(ledger, batch):
+    """The IDs of an earlier ledger batch, in the order they were printed."""
+    if ledger is None:
+        raise ValueError("reprinting a batch needs a ledger")
+    return [row["id"] for row in ledger.batch_rows(batch)]
+
 
-def rand_id(n=8):
-    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-    return ''.join(random.choice(alphabet) for _ in range(n))
+def new_ids(count=SLOTS_PER_SHEET, id_index=None):
+    """Return ``count`` fresh random IDs (8 chars, A-Z0-9, from the OS CSPRNG).
+
+    With an IDIndex (see open_id_index) the IDs are reserved in it, so they
+    never repeat an ID issued before by any process sharing the index.
+    """
+    if id_index is not None:
+        return id_index.allocate(count)
+    from label_id_index import random_ids
+    return random_ids(count)
 
 
 def compute_layout_mm():
@@ -116,19 +352,215 @@ def compute_layout_mm():
     return margin_l, margin_t, gutter_x
 
 
-def draw_qr_at(c, payload, left_mm, bottom_mm, size_mm):
+def load_logo(logo_path, logo_cache=None):
+    """Return a decoded ImageReader of the print-size logo (cached), or None if missing.
+
+    The file is flattened and resampled to the pixels it covers at LOGO_DPI (see
+    label_logo_cache.py); with a ``logo_cache`` directory the result is kept on
+    disk and later runs just read it. The reader's ``source_size`` is the
+    original pixel size, which the layout uses (see logo_size).
+    """
+    if not (logo_path and os.path.exists(logo_path)):
+        return None
+    key = (os.path.abspath(logo_path), os.path.getmtime(logo_path))
+    img = _LOGO_CACHE.get(key)
+    if img is None:
+        from label_logo_cache import prepare_logo, print_size_px, source_size
+        with _timings.span("logo"):
+            size = source_size(logo_path)
+            target_px = print_size_px(fit_logo_mm(size), LOGO_DPI)
+            digest = logo_digest(logo_path) if logo_cache else None
+            from reportlab.lib.utils import ImageReader
+            img = ImageReader(prepare_logo(logo_path, target_px, logo_cache, digest))
+            img.source_size = size
+            img.getRGBData()  # decode now so every later job reuses the pixels
+        _LOGO_CACHE[key] = img
+    return img
+
+
+def logo_size(logo_img):
+    """Pixel size of the logo as supplied.
+
+    Layout is computed from this rather than from the resampled image, whose
+    rounded pixel size would shift the aspect ratio slightly.
+    """
+    return getattr(logo_img, "source_size", None) or logo_img.getSize()
+
+
+def fit_logo_mm(size_px, max_w_mm=None):
+    """Drawn ``(width, height)`` in mm of a logo of ``size_px`` pixels.
+
+    The aspect ratio is kept and the logo fitted into LOGO_MAX_W x LOGO_MAX_H,
+    clamped to ``max_w_mm`` (the right section's width by default).
+    """
+    if max_w_mm is None:
+        max_w_mm = LABEL_W - PADDING_L - PADDING_R - (QR_W + max(0.0, GAP - GAP_REDUCTION_MM))
+    max_w_mm = min(LOGO_MAX_W, max_w_mm)
+    max_h_mm = LOGO_MAX_H
+    img_w_px, img_h_px = size_px
+    aspect = img_w_px / float(img_h_px) if img_h_px else 1.0
+    if max_h_mm * aspect <= max_w_mm:
+        return max_h_mm * aspect, max_h_mm
+    return max_w_mm, max_w_mm / max(aspect, 1e-6)
+
+
+def iter_sheets(ids, start_index=1):
+    """Split an iterable of IDs into sheets of (slot, uid) pairs.
+
+    Slots are 1-based. ``start_index`` only applies to the first sheet (for
+    partially used sheets); every following sheet starts at slot 1. IDs are
+    consumed lazily, one sheet at a time, so a generator of any length can be
+    fed in without materialising it. At least one (possibly empty) sheet is
+    always yielded so an empty job still produces a blank page.
+    """
+    it = iter(ids)
+    slot = min(max(1, int(start_index)), SLOTS_PER_SHEET)
+    first = True
+    while True:
+        room = SLOTS_PER_SHEET - slot + 1
+        with _timings.span("parse_ids"):
+            batch = list(itertools.islice(it, room))
+        if not batch and not first:
+            return
+        yield [(slot + i, uid) for i, uid in enumerate(batch)]
+        if len(batch) < room:
+            return
+        slot = 1
+        first = False
+
+
+def open_qr_cache(path):
+    """Return the shared QRMatrixCache for ``path`` (None disables caching)."""
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    cache = _QR_CACHES.get(path)
+    if cache is None:
+        from label_qr_cache import QRMatrixCache
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cache = _QR_CACHES[path] = QRMatrixCache(path)
+    return cache
+
+
+def qr_matrix(payload, level=QR_LEVEL, cache=None):
+    """Encode ``payload`` and return its module matrix (rows of booleans, True = dark).
+
+    The smallest symbol for ``level`` is chosen by encode_qr() (mixed segment
+    modes). With a QRMatrixCache the
+    matrix is looked up first and stored after encoding.
+    """
+    if cache is not None:
+        with _timings.span("qr_cache"):
+            modules = cache.get(payload, level)
+        if modules is not None:
+            return modules
+    with _timings.span("qr_encode"):
+        modules = encode_qr(payload, level)[0]
+    _timings.count("qr_encoded")
+    if cache is not None:
+        cache.put(payload, level, modules)
+    return modules
+
+
+def qr_rects(modules):
+    """Merge dark modules into rectangles ``(col, row, w, h)`` in module units.
+
+    Each row is split into horizontal runs of dark modules, and a run that repeats
+    with the same span on consecutive rows is extended downwards instead of being
+    emitted again. The union of the rectangles is exactly the set of dark modules.
+    Rectangles are returned sorted by (col, row).
+    """
+    rects = []
+    open_runs = {}  # (col, width) -> top row
+    n_rows = len(modules)
+    for r in range(n_rows + 1):
+        runs = set()
+        if r < n_rows:
+            row = modules[r]
+            col = 0
+            for dark, group in itertools.groupby(row):
+                width = len(list(group))
+                if dark:
+                    runs.add((col, width))
+                col += width
+        for key in [k for k in open_runs if k not in runs]:
+            top = open_runs.pop(key)
+            rects.append((key[0], top, key[1], r - top))
+        for key in runs:
+            open_runs.setdefault(key, r)
+    # Column-major order makes neighbouring operators alike, which Flate compresses better
+    rects.sort()
+    return rects
+
+
+def _is_black(color):
+    from reportlab.lib import colors
+    # The canvas starts with the tuple (0, 0, 0); setFillColor() stores Color objects
+    return color == (0, 0, 0) or color == colors.black
+
+
+def draw_qr_path(c, modules, left_mm, bottom_mm, size_mm, border=QR_BORDER):
+    """Draw a QR matrix as one filled path of merged rectangles.
+
+    Coordinates are emitted in whole module units under a single ``cm``, so each
+    rectangle costs one short ``re`` operator. Geometry matches QrCodeWidget:
+    ``border`` quiet-zone modules on every side of a ``size_mm`` square.
+    """
+    n = len(modules)
+    box = (size_mm * mm) / (n + 2 * border)
+    c.saveState()
+    if not _is_black(c._fillColorObj):
+        from reportlab.lib import colors
+        c.setFillColor(colors.black)
+    c.transform(box, 0, 0, box, left_mm * mm, bottom_mm * mm)
+    p = c.beginPath()
+    for col, row, w, h in qr_rects(modules):
+        # PDF y grows upwards; rows are counted from the top of the matrix
+        p.rect(col + border, n + border - row - h, w, h)
+    c.drawPath(p, stroke=0, fill=1)
+    c.restoreState()
+
+
+def qr_payload(checkin_base, uid, uppercase=False):
+    """The check-in URL encoded in a label's QR.
+
+    ``uppercase`` upper-cases the whole URL so it fits QR alphanumeric mode
+    (5.5 instead of 8 bits per character, usually a smaller version). Only use
+    it when the check-in route ignores case: the app's scanner and the API's
+    /check-in/:id route do, a case-sensitive web front end may not.
+    """
+    payload = f"{checkin_base.rstrip('/')}/{uid}"
+    return payload.upper() if uppercase else payload
+
+
+def draw_qr_at(c, payload, left_mm, bottom_mm, size_mm, engine=DEFAULT_QR_ENGINE, qr_cache=None, level=QR_LEVEL):
+    """Draw the QR of ``payload``; returns its size in modules per side (None for the widget)."""
     # Vector QR (crisp at any DPI)
-    widget = rl_qr.QrCodeWidget(payload)
+    if engine == "path":
+        modules = qr_matrix(payload, level, cache=qr_cache)
+        draw_qr_path(c, modules, left_mm, bottom_mm, size_mm)
+        return len(modules)
+    from reportlab.graphics.barcode import qr as rl_qr
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.graphics import renderPDF
+    # The widget has no "auto"; it gets the fixed level auto starts from
+    widget = rl_qr.QrCodeWidget(payload, barLevel=level if level in QR_LEVELS else QR_LEVELS[0])
     bounds = widget.getBounds()
     bw = bounds[2] - bounds[0]
     bh = bounds[3] - bounds[1]
     d = Drawing(size_mm * mm, size_mm * mm, transform=[(size_mm * mm) / bw, 0, 0, (size_mm * mm) / bh, 0, 0])
     d.add(widget)
     renderPDF.draw(d, c, left_mm * mm, bottom_mm * mm)
+    return None
 
 
-def draw_label(c, x_label_mm, y_top_mm, qr_payload, logo_img, email, phone, uid, font_pair, font_scale=1.1):
-    """Draw one label at top-left (x_label_mm, y_top_mm)."""
+def label_geometry(x_label_mm, y_top_mm, logo_img, font_scale=1.1):
+    """Resolve the positions (mm) of the QR, logo and text lines of one label.
+
+    (x_label_mm, y_top_mm) is the label's top-left corner. Returns a dict with
+    the QR origin, the logo box (or None), the text column centre and the
+    baselines/sizes of the email, phone and ID lines.
+    """
     # Inner usable bounds
     # Padding around the QR (horizontally):
     #   - PADDING_L controls space from the label's left edge to the QR's left edge.
@@ -142,189 +574,1711 @@ def draw_label(c, x_label_mm, y_top_mm, qr_payload, logo_img, email, phone, uid,
     qr_x_mm = x_left_mm
     qr_y_bottom_mm = y_top_mm - (LABEL_H - QR_H) / 2.0 - QR_H  # bottom y of QR (mm)
 
-    # Draw vector QR for this uid
-    draw_qr_at(c, qr_payload, qr_x_mm, qr_y_bottom_mm, QR_W)
-
     # Right block origin — reduce QR→logo/text gap further
-    GAP_REDUCTION_MM = 0.6  # tighten spacing beyond previous tweak
     gap_mm = max(0.0, GAP - GAP_REDUCTION_MM)  # effective QR → right-stack gap (mm)
     right_x_mm = qr_x_mm + QR_W + gap_mm       # start X of the right stack (logo + text)
     right_w_mm = usable_w_mm - (QR_W + gap_mm)
 
     # Logo: top-aligned with QR; centered in right section; aspect preserved
+    logo_box = None
     if logo_img is not None:
-        # Compute maximum drawable size within the right section
-        max_w_mm = min(LOGO_MAX_W, right_w_mm)
-        max_h_mm = LOGO_MAX_H
+        # Fit image into the right section preserving aspect
         try:
-            img_w_px, img_h_px = logo_img.getSize()
-            aspect = img_w_px / float(img_h_px) if img_h_px else 1.0
+            size_px = logo_size(logo_img)
         except Exception:
-            aspect = 1.0
-
-        # Fit image into max_w_mm x max_h_mm preserving aspect
-        if max_h_mm * aspect <= max_w_mm:
-            draw_h_mm = max_h_mm
-            draw_w_mm = draw_h_mm * aspect
-        else:
-            draw_w_mm = max_w_mm
-            draw_h_mm = draw_w_mm / max(aspect, 1e-6)
+            size_px = (1, 1)
+        draw_w_mm, draw_h_mm = fit_logo_mm(size_px, right_w_mm)
 
         # Top align (with small offset) and center horizontally in the right section
         qr_top_mm = qr_y_bottom_mm + QR_H
         align_top_mm = qr_top_mm - RIGHT_SECTION_TOP_OFFSET_MM
         logo_y_bottom_mm = align_top_mm - draw_h_mm
         logo_x_mm = right_x_mm + (right_w_mm - draw_w_mm) / 2.0
+        logo_box = (logo_x_mm, logo_y_bottom_mm, draw_w_mm, draw_h_mm)
 
-        c.drawImage(logo_img,
-                    logo_x_mm * mm,
-                    logo_y_bottom_mm * mm,
-                    width=draw_w_mm * mm,
-                    height=draw_h_mm * mm,
-                    preserveAspectRatio=True,
-                    mask='auto')
     # Anchor text block directly under the logo with a 1 px gap
-    if logo_img is not None:
-        start_top_mm = logo_y_bottom_mm - PX_TO_MM
+    if logo_box is not None:
+        start_top_mm = logo_box[1] - PX_TO_MM
     else:
         # If no logo, start just under the QR top for consistency
         start_top_mm = (qr_y_bottom_mm + QR_H) - PX_TO_MM
 
-    # Helper to draw condensed text without changing point size
-    def draw_narrow_text(x_mm, y_mm, text, font_name, size_pt, hscale=TEXT_HSCALE, align_center=False):
-        c.saveState()
-        c.scale(hscale, 1.0)
-        c.setFont(font_name, size_pt)
-        # Compute pre-scale X so that post-scale alignment matches request
-        if align_center:
-            w_pts = c.stringWidth(text, font_name, size_pt)
-            x_pre = (x_mm * mm) / hscale - (w_pts / 2.0)
-        else:
-            # Left alignment; compensate x by 1/hscale to keep left edge aligned
-            x_pre = (x_mm * mm) / hscale
-        c.drawString(x_pre, y_mm * mm, text)
-        c.restoreState()
-
-    # Draw texts centered within the right section horizontally
-    section_center_x_mm = right_x_mm + right_w_mm / 2.0
-    font_normal, font_bold = font_pair
     # Apply a global font scale so all text grows uniformly
     email_pt = EMAIL_PT * font_scale
     phone_pt = PHONE_PT * font_scale
     id_pt = ID_PT * font_scale
 
     email_y_mm = start_top_mm - (email_pt * PT_TO_MM)
-    draw_narrow_text(section_center_x_mm, email_y_mm, email, font_bold, email_pt, align_center=True)
-
     phone_y_mm = email_y_mm - (phone_pt * 1.2 * PT_TO_MM)
-    draw_narrow_text(section_center_x_mm, phone_y_mm, phone, font_bold, phone_pt, align_center=True)
-
     id_y_mm = phone_y_mm - (id_pt * 1.6 * PT_TO_MM)
-    draw_narrow_text(section_center_x_mm, id_y_mm, uid, font_bold, id_pt, align_center=True)
 
+    return {
+        "qr": (qr_x_mm, qr_y_bottom_mm),
+        "logo": logo_box,
+        # Texts are centered within the right section horizontally
+        "text_x": right_x_mm + right_w_mm / 2.0,
+        "email": (email_y_mm, email_pt),
+        "phone": (phone_y_mm, phone_pt),
+        "id": (id_y_mm, id_pt),
+    }
 
-def generate_pdf(output_pdf, logo_path, checkin_base, email, phone, ids=None, out_csv=None, show_grid=False, font_scale=1.1, start_index=1):
-    margin_l, margin_t, gutter_x = compute_layout_mm()
-    c = canvas.Canvas(output_pdf, pagesize=(A4_W * mm, A4_H * mm))
 
-    logo_img = ImageReader(logo_path) if (logo_path and os.path.exists(logo_path)) else None
+def compile_sheet_layout(logo_img, font_scale=1.1):
+    """Resolve the geometry of every slot on a sheet once.
 
-    # Build IDs
-    if ids is None:
-        ids = [rand_id(8) for _ in range(COLS * ROWS)]
+    Returns a dict with ``label`` (label_geometry() at the origin, used by the
+    static form), ``id_pt`` and ``slots``: one ``(x_label, y_top, qr_x, qr_y,
+    text_x, id_y)`` tuple in mm per slot, indexed by slot - 1. Only the logo's
+    aspect ratio affects the layout, so the last LAYOUT_CACHE_SIZE results are
+    cached by logo pixel size and font scale and reused by every sheet and job.
+    """
+    size_px = tuple(logo_size(logo_img)) if logo_img is not None else None
+    return _compile_sheet_layout(size_px, float(font_scale))
 
-    total_slots = COLS * ROWS
-    # Place starting at start_index (1-based)
-    slot = max(1, int(start_index))
-    idx = 0
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _compile_sheet_layout(size_px, font_scale):
+    # label_geometry() only reads the logo's size
+    logo_img = types.SimpleNamespace(source_size=size_px) if size_px is not None else None
+    margin_l, margin_t, gutter_x = compute_layout_mm()
+    slots = []
     for r in range(ROWS):
+        # Vertically centered block; rows are stacked without extra vertical gutters
+        y_top_mm = A4_H - margin_t - r * LABEL_H
         for col in range(COLS):
             # Equal horizontal spacing: left margin = gutter_x, and
             # spacing between labels = gutter_x
             x_label_mm = margin_l + col * (LABEL_W + gutter_x)
             # Apply column-specific horizontal shift (as percentage of label width)
             if col < len(COLUMN_SHIFTS_PERCENT):
-                column_shift_mm = LABEL_W * COLUMN_SHIFTS_PERCENT[col]
-                x_label_mm += column_shift_mm
-            # Vertically centered block; rows are stacked without extra vertical gutters
-            y_top_mm = A4_H - margin_t - r * LABEL_H
-            if show_grid:
-                c.setStrokeColor(colors.lightgrey)
-                c.setLineWidth(0.25)
-                c.rect(x_label_mm * mm, (y_top_mm - LABEL_H) * mm, LABEL_W * mm, LABEL_H * mm, stroke=1, fill=0)
-            # Always use the first label's font across all labels
-            font_pair = FONT_CANDIDATES[min(max(SELECTED_FONT_INDEX, 0), len(FONT_CANDIDATES)-1)]
-            # Compute current slot number (1..65) for this row/col
-            current_slot = (r * COLS) + (col + 1)
-            if current_slot < slot or idx >= len(ids):
-                # leave blank (maybe draw grid only)
+                x_label_mm += LABEL_W * COLUMN_SHIFTS_PERCENT[col]
+            geo = label_geometry(x_label_mm, y_top_mm, logo_img, font_scale)
+            slots.append((x_label_mm, y_top_mm) + geo["qr"] + (geo["text_x"], geo["id"][0]))
+    return {
+        "label": label_geometry(0.0, 0.0, logo_img, font_scale),
+        "id_pt": ID_PT * font_scale,
+        "slots": tuple(slots),
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def text_width(text, font_name, size_pt):
+    """Memoized pdfmetrics.stringWidth (points) — email/phone repeat on every label."""
+    from reportlab.pdfbase import pdfmetrics
+    return pdfmetrics.stringWidth(text, font_name, size_pt)
+
+
+class LabelText:
+    """Condensed label strings collected into one PDF text object (BT ... ET).
+
+    Condensing uses horizontal text scaling (Tz) instead of a scaled CTM, so a
+    string costs a text matrix and a show operator rather than a saveState /
+    scale / setFont / drawString / restoreState round trip, and the font and
+    scale are only written when they change: a sheet's IDs are one text object
+    with a single Tf. Glyphs land exactly where the CTM-scaled version put them.
+    Text state outlives ET, so finish() sets Tz back to 100 for later text.
+    Only reportlab's public text object API is used.
+    """
+
+    def __init__(self, c):
+        self.canvas = c
+        self.text = None  # opened at the first string's origin
+        self.font = None
+        self.hscale = 1.0
+        self.count = 0
+
+    def add(self, x_mm, y_mm, text, font_name, size_pt, hscale=TEXT_HSCALE, align_center=False):
+        # X in the condensed space, then back to page space (Tz does not scale Tm)
+        if align_center:
+            x_pre = (x_mm * mm) / hscale - text_width(text, font_name, size_pt) / 2.0
+        else:
+            x_pre = (x_mm * mm) / hscale
+        t = self.text
+        if t is None:
+            t = self.text = self.canvas.beginText(x_pre * hscale, y_mm * mm)
+        else:
+            t.setTextOrigin(x_pre * hscale, y_mm * mm)
+        if (font_name, size_pt) != self.font:
+            t.setFont(font_name, size_pt)
+            self.font = (font_name, size_pt)
+        if hscale != self.hscale:
+            t.setHorizScale(hscale * 100)
+            self.hscale = hscale
+        t.textOut(text)
+        self.count += 1
+
+    def finish(self):
+        """Write the text object to the canvas (nothing when no string was added)."""
+        if self.text is None:
+            return
+        if self.hscale != 1.0:
+            self.text.setHorizScale(100)
+        self.canvas.drawText(self.text)
+
+
+def draw_narrow_text(c, x_mm, y_mm, text, font_name, size_pt, hscale=TEXT_HSCALE, align_center=False):
+    """Draw condensed text without changing point size (one string; see LabelText)."""
+    text_obj = LabelText(c)
+    text_obj.add(x_mm, y_mm, text, font_name, size_pt, hscale, align_center)
+    text_obj.finish()
+
+
+def draw_label_static(c, geo, logo_img, email, phone, font_pair, text=None):
+    """Draw the parts of a label that are the same on every label of a job.
+
+    With ``text`` (a LabelText) the email and phone lines are added to it
+    instead of being written straight away.
+    """
+    if geo["logo"] is not None:
+        logo_x_mm, logo_y_bottom_mm, draw_w_mm, draw_h_mm = geo["logo"]
+        c.drawImage(logo_img,
+                    logo_x_mm * mm,
+                    logo_y_bottom_mm * mm,
+                    width=draw_w_mm * mm,
+                    height=draw_h_mm * mm,
+                    preserveAspectRatio=True,
+                    mask='auto')
+    font_bold = font_pair[1]
+    lines = text or LabelText(c)
+    lines.add(geo["text_x"], geo["email"][0], email, font_bold, geo["email"][1], align_center=True)
+    lines.add(geo["text_x"], geo["phone"][0], phone, font_bold, geo["phone"][1], align_center=True)
+    if text is None:
+        lines.finish()
+
+
+# Skips strings and names, so only real numeric operands are touched
+_CONTENT_NUMBER_RE = re.compile(r"\((?:\\.|[^\\)])*\)|/[^\s/\[\]()<>{}%]*|(-?\d*\.\d+)")
+
+
+def compact_numbers(ops, digits=OPTIMIZE_DIGITS):
+    """Round the decimal operands in content-stream operators to ``digits`` places.
+
+    Small values (scale factors) keep at least 5 significant digits, so a QR's
+    ~40-module span does not drift.
+    """
+    def fmt(m):
+        if m.group(1) is None:
+            return m.group(0)
+        value = float(m.group(1))
+        places = max(digits, 5 - len(str(int(abs(value)))))
+        text = f"{value:.{places}f}".rstrip("0").rstrip(".")
+        if text in ("", "-0", "-"):
+            return "0"
+        # Same short forms reportlab writes: .5 and -.5
+        return text.replace("0.", ".", 1) if text.startswith(("0.", "-0.")) else text
+    return [_CONTENT_NUMBER_RE.sub(fmt, op) for op in ops]
+
+
+def new_canvas(target, font_pair):
+    """Canvas for a label sheet PDF.
+
+    The initial font (which reportlab declares in every page preamble) is the
+    label's bold face, so the PDF does not carry an extra, otherwise unused font.
+    """
+    from reportlab.pdfgen import canvas
+    return canvas.Canvas(target, pagesize=(A4_W * mm, A4_H * mm), initialFontName=font_pair[1])
+
+
+def page_content(c):
+    """The current page's content-stream operators and used XObjects on canvas ``c``.
+
+    reportlab has no public API for editing or splicing page content, so these
+    are its private ``Canvas._code`` and ``Canvas._formsinuse`` lists, pinned by
+    tests/test_reportlab_internals.py. This is the only place they are reached
+    for, and it fails loudly instead of writing a broken PDF if they change.
+    """
+    code, forms = getattr(c, "_code", None), getattr(c, "_formsinuse", None)
+    if not (isinstance(code, list) and isinstance(forms, list)):
+        raise RuntimeError(f"reportlab {reportlab.Version} changed the Canvas internals --optimize and --workers "
+                           "use; install the version pinned in requirements.txt")
+    return code, forms
+
+
+@contextlib.contextmanager
+def pdf_settings(optimize=False):
+    """reportlab document settings for one render (rl_config is process-wide).
+
+    ``optimize`` writes streams as raw Flate instead of ASCII85 + Flate, about
+    20% smaller. reportlab has no per-canvas switch for this: it reads
+    ``rl_config.useA85`` as each stream is built and written, so the setting is
+    only changed around this document's own draw and save calls and always put
+    back.
+    """
+    from reportlab import rl_config
+    saved = rl_config.useA85
+    if optimize:
+        rl_config.useA85 = 0
+    try:
+        yield
+    finally:
+        rl_config.useA85 = saved
+
+
+def build_static_form(c, logo_img, email, phone, font_pair, font_scale=1.1, name="LabelStatic"):
+    """Record the static label content once per job as a PDF form XObject.
+
+    The form is drawn in label-local coordinates (origin at the label's top-left
+    corner) so it can be placed on any slot with a translation. Returns the
+    form name for place_static_form().
+    """
+    geo = compile_sheet_layout(logo_img, font_scale)["label"]
+    # Generous bbox: forms clip to it, and the in-label nudge can go slightly negative
+    c.beginForm(name, lowerx=-LABEL_W * mm, lowery=-2 * LABEL_H * mm, upperx=2 * LABEL_W * mm, uppery=LABEL_H * mm)
+    draw_label_static(c, geo, logo_img, email, phone, font_pair)
+    c.endForm()
+    return name
+
+
+def place_static_form(c, name, x_label_mm, y_top_mm):
+    c.saveState()
+    c.translate(x_label_mm * mm, y_top_mm * mm)
+    c.doForm(name)
+    c.restoreState()
+
+
+def draw_label(c, x_label_mm, y_top_mm, payload, logo_img, email, phone, uid, font_pair, font_scale=1.1, static_form=None,
+               qr_engine=DEFAULT_QR_ENGINE, qr_cache=None, qr_level=QR_LEVEL):
+    """Draw one label at top-left (x_label_mm, y_top_mm).
+
+    With ``static_form`` (from build_static_form) the logo, email and phone are
+    placed as one form XObject and only the QR and ID are drawn per label.
+    """
+    geo = label_geometry(x_label_mm, y_top_mm, logo_img, font_scale)
+
+    # Draw vector QR for this uid
+    qr_x_mm, qr_y_bottom_mm = geo["qr"]
+    draw_qr_at(c, payload, qr_x_mm, qr_y_bottom_mm, QR_W, engine=qr_engine, qr_cache=qr_cache, level=qr_level)
+
+    if static_form:
+        place_static_form(c, static_form, x_label_mm, y_top_mm)
+    else:
+        draw_label_static(c, geo, logo_img, email, phone, font_pair)
+
+    id_y_mm, id_pt = geo["id"]
+    draw_narrow_text(c, geo["text_x"], id_y_mm, uid, font_pair[1], id_pt, align_center=True)
+
+
+def draw_sheet(c, sheet, opts, logo_img, static_form, qr_cache=None):
+    """Draw one sheet's labels (and the optional grid) on the current page.
+
+    ``sheet`` is a list of (slot, uid) pairs from iter_sheets(); ``opts`` holds
+    the per-job drawing options built by generate_pdf. Positions come from the
+    precompiled compile_sheet_layout() table, so the loop only draws. Returns
+    ``{modules per side: labels}`` for the QRs drawn.
+    """
+    layout = compile_sheet_layout(logo_img, opts["font_scale"])
+    slots = layout["slots"]
+    if opts["show_grid"]:
+        # Grid over every slot (used or not) as a single stroked path
+        from reportlab.lib import colors
+        c.setStrokeColor(colors.lightgrey)
+        c.setLineWidth(0.25)
+        p = c.beginPath()
+        for x_label_mm, y_top_mm, *_ in slots:
+            p.rect(x_label_mm * mm, (y_top_mm - LABEL_H) * mm, LABEL_W * mm, LABEL_H * mm)
+        c.drawPath(p, stroke=1, fill=0)
+
+    checkin_base = opts["checkin_base"]
+    uppercase = opts["qr_uppercase"]
+    email, phone = opts["email"], opts["phone"]
+    qr_engine, qr_level = opts["qr_engine"], opts["qr_level"]
+    font_bold = opts["font_pair"][1]
+    id_pt = layout["id_pt"]
+    # Every string on the page goes into one text object, written after the QRs
+    text = LabelText(c)
+    sizes = {}
+    for slot, uid in sheet:
+        x_label_mm, y_top_mm, qr_x_mm, qr_y_mm, text_x_mm, id_y_mm = slots[slot - 1]
+        n = draw_qr_at(c, qr_payload(checkin_base, uid, uppercase), qr_x_mm, qr_y_mm, QR_W,
+                       engine=qr_engine, qr_cache=qr_cache, level=qr_level)
+        if n is not None:
+            sizes[n] = sizes.get(n, 0) + 1
+        if static_form:
+            place_static_form(c, static_form, x_label_mm, y_top_mm)
+        else:
+            geo = label_geometry(x_label_mm, y_top_mm, logo_img, opts["font_scale"])
+            draw_label_static(c, geo, logo_img, email, phone, opts["font_pair"], text)
+        text.add(text_x_mm, id_y_mm, uid, font_bold, id_pt, align_center=True)
+    text.finish()
+    return sizes
+
+
+def _render_sheet_chunk(opts, logo_path, qr_cache_path, sheets):
+    """Process-pool task for --workers: draw ``sheets`` on a scratch canvas.
+
+    Returns each page's raw content-stream operators, the XObjects it uses and
+    its QR sizes (see draw_sheet), plus this task's QR cache hit/miss counts and (with --timings) its phases.
+    The scratch canvas defines the static form the same way the parent does, so
+    font and XObject resource names match and the parent can splice the pages
+    in unchanged.
+    """
+    c = new_canvas(io.BytesIO(), opts["font_pair"])
+    logo_img = load_logo(logo_path, opts["logo_cache"])
+    static_form = build_static_form(c, logo_img, opts["email"], opts["phone"], opts["font_pair"], opts["font_scale"])
+    qr_cache = open_qr_cache(qr_cache_path)
+    before = qr_cache.stats() if qr_cache is not None else None
+    timings = Timings() if opts.get("timings") else NO_TIMINGS
+    previous = set_timings(timings)
+    try:
+        pages = []
+        for sheet in sheets:
+            with timings.span("draw"):
+                sizes = draw_sheet(c, sheet, opts, logo_img, static_form, qr_cache)
+                code, forms = page_content(c)
+                if opts["optimize"]:
+                    code[:] = compact_numbers(code)
+            pages.append((list(code), list(forms), sizes))
+            c.showPage()
+    finally:
+        set_timings(previous)
+    counts = None
+    if qr_cache is not None:
+        qr_cache.flush()
+        counts = {k: v - before[k] for k, v in qr_cache.stats().items()}
+    return pages, counts, (timings.record() if timings is not NO_TIMINGS else None)
+
+
+def _iter_parallel_pages(sheets, workers, opts, logo_path, qr_cache, chunk_sheets=PARALLEL_CHUNK_SHEETS):
+    """Render sheets in a process pool; yield (sheet, page) in the original order.
+
+    At most ``2 * workers`` chunks are in flight, so memory stays bounded however
+    long the ID stream is.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    qr_cache_path = qr_cache.path if qr_cache is not None else None
+    pending = deque()
+
+    def finished(chunk, future):
+        with _timings.span("wait_workers"):
+            pages, counts, record = future.result()
+        if counts and qr_cache is not None:
+            qr_cache.hits += counts["hits"]
+            qr_cache.misses += counts["misses"]
+        if record:
+            # Worker time is CPU time spent in parallel, reported separately
+            _timings.merge(record, prefix="worker:")
+        return zip(chunk, pages)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        sheets = iter(sheets)
+        while True:
+            chunk = list(itertools.islice(sheets, chunk_sheets))
+            if not chunk:
+                break
+            pending.append((chunk, pool.submit(_render_sheet_chunk, opts, logo_path, qr_cache_path, chunk)))
+            if len(pending) >= 2 * workers:
+                yield from finished(*pending.popleft())
+        while pending:
+            yield from finished(*pending.popleft())
+
+
+def usable_workers(workers):
+    """``workers`` capped at the number of CPUs, so a 1-CPU host renders serially.
+
+    A pool on a single CPU only adds the merge and process start-up to the
+    serial time; no multi-core speed-up has been measured for --workers yet.
+    """
+    return max(1, min(int(workers), os.cpu_count() or 1))
+
+
+def open_output_cache(path):
+    """Return the shared OutputCache for directory ``path`` (None disables it)."""
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    cache = _OUTPUT_CACHES.get(path)
+    if cache is None:
+        from label_output_cache import OutputCache
+        cache = _OUTPUT_CACHES[path] = OutputCache(path)
+    return cache
+
+
+def logo_digest(logo_path):
+    """SHA-256 of the logo file's bytes (None when there is no logo)."""
+    if not (logo_path and os.path.exists(logo_path)):
+        return None
+    key = (os.path.abspath(logo_path), os.path.getmtime(logo_path))
+    digest = _LOGO_DIGESTS.get(key)
+    if digest is None:
+        with open(logo_path, "rb") as fh:
+            digest = _LOGO_DIGESTS[key] = hashlib.sha256(fh.read()).hexdigest()
+    return digest
+
+
+def job_key(ids, logo_path, checkin_base, email, phone, show_grid=False, font_scale=1.1, start_index=1,
+            qr_engine=DEFAULT_QR_ENGINE, optimize=False, qr_level=QR_LEVEL, qr_uppercase=False):
+    """Hash of everything that determines a job's PDF, for the output cache.
+
+    Inputs are normalized first (trailing slash of ``checkin_base``, clamped
+    ``start_index``, ...), and the logo is hashed by content, not by path.
+    """
+    h = _job_hash(logo_path, checkin_base, email, phone, show_grid, font_scale, start_index, qr_engine, optimize,
+                  qr_level, qr_uppercase)
+    for uid in ids:
+        h.update(b"\n" + uid.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _job_hash(logo_path, checkin_base, email, phone, show_grid, font_scale, start_index, qr_engine, optimize,
+              qr_level, qr_uppercase):
+    """job_key()'s hash over the job settings, before any ID is added."""
+    header = {
+        "format": OUTPUT_FORMAT,
+        "reportlab": reportlab.Version,
+        "layout": [globals()[name] for name in LAYOUT_CONSTANTS],
+        "logo": logo_digest(logo_path),
+        "checkin_base": checkin_base.rstrip('/'),
+        "email": email,
+        "phone": phone,
+        "show_grid": bool(show_grid),
+        "font_scale": float(font_scale),
+        "start_index": min(max(1, int(start_index)), SLOTS_PER_SHEET),
+        "qr_engine": qr_engine,
+        "optimize": bool(optimize),
+        "qr_level": qr_level,
+        "qr_uppercase": bool(qr_uppercase),
+    }
+    return hashlib.sha256(json.dumps(header, sort_keys=True).encode("utf-8"))
+
+
+def _spool_ids(ids, h, spool):
+    """Add ``ids`` to the job hash ``h`` while writing them to ``spool``, one JSON string per line.
+
+    Returns a function that reads them back in order, so a job keyed by its
+    whole ID list never holds that list in memory.
+    """
+    for uid in ids:
+        h.update(b"\n" + uid.encode("utf-8"))
+        spool.write(json.dumps(uid) + "\n")
+
+    def replay():
+        spool.seek(0)
+        return (json.loads(line) for line in spool)
+    return replay
+
+
+def is_refetch(ledger, output_cache, ids, *key_args):
+    """Whether this job re-fetches an identical PDF whose labels are all in ``ledger``.
+
+    ``key_args`` are job_key()'s arguments after ``ids``. Such a job is served
+    from ``output_cache`` and records a reprint instead of failing the
+    duplicate check, so a client can fetch the same sheet again.
+    """
+    if ledger is None or output_cache is None or job_key(ids, *key_args) not in output_cache:
+        return False
+    return len(ledger.printed(ids)) == len(set(ids))
+
+
+def _write_ids_csv(out_csv, ids):
+    with open(out_csv, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["index", "id"])
+        writer.writerows(enumerate(ids, 1))
+
+
+def _generate_cached(output_cache, output_pdf, logo_path, checkin_base, email, phone, ids, out_csv, show_grid,
+                     font_scale, start_index, qr_engine, qr_cache, workers, optimize, logo_cache, qr_level,
+                     qr_uppercase, progress=None, export=None):
+    """generate_pdf() through the output cache: reuse an identical earlier result.
+
+    On a miss the job renders into the cache under the key's lock, so identical
+    jobs running at the same time render once and the others wait and reuse it.
+    The IDs are hashed into the key as they stream past and spooled to a
+    temporary file for rendering.
+    """
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        return _generate_spooled(output_cache, output_pdf, logo_path, checkin_base, email, phone, ids, out_csv,
+                                 show_grid, font_scale, start_index, qr_engine, qr_cache, workers, optimize, logo_cache,
+                                 qr_level, qr_uppercase, progress, export, spool)
+
+
+def _generate_spooled(output_cache, output_pdf, logo_path, checkin_base, email, phone, ids, out_csv, show_grid,
+                      font_scale, start_index, qr_engine, qr_cache, workers, optimize, logo_cache, qr_level,
+                      qr_uppercase, progress, export, spool):
+    t0 = time.perf_counter()
+    h = _job_hash(logo_path, checkin_base, email, phone, show_grid, font_scale, start_index, qr_engine, optimize,
+                  qr_level, qr_uppercase)
+    ids = _spool_ids(ids, h, spool)
+    key = h.hexdigest()
+    with _timings.span("output_cache"):
+        hit = output_cache.get(key)
+    state = "hit"
+    if hit is None:
+        with output_cache.lock(key):
+            hit = output_cache.get(key)  # an identical job may have finished meanwhile
+            if hit is None:
+                state = "miss"
+                tmp = output_cache.temp_path()
+                try:
+                    run = generate_pdf(tmp, logo_path, checkin_base, email, phone, ids=ids(), out_csv=out_csv,
+                                       show_grid=show_grid, font_scale=font_scale, start_index=start_index,
+                                       qr_engine=qr_engine, qr_cache=qr_cache, workers=workers, optimize=optimize,
+                                       logo_cache=logo_cache, qr_level=qr_level, qr_uppercase=qr_uppercase,
+                                       progress=progress, export=export)
+                    output_cache.put(key, tmp, {k: run[k] for k in ("pages", "labels", "bytes", "qr_modules")})
+                finally:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(tmp)
+                hit = output_cache.get(key)
+    fh, cached = hit
+    with fh, _timings.span("output_cache"):
+        if isinstance(output_pdf, (str, os.PathLike)):
+            with open(output_pdf, "wb") as out:
+                shutil.copyfileobj(fh, out)
+        else:
+            shutil.copyfileobj(fh, output_pdf)
+        if out_csv and state == "hit":
+            _write_ids_csv(out_csv, ids())
+    if export is not None and state == "hit":
+        with _timings.span("export"):
+            for page, sheet in enumerate(iter_sheets(ids(), start_index), 1):
+                export.add_sheet(page, sheet)
+    stats = dict(cached, seconds=time.perf_counter() - t0, output_cache=state, cache_key=key)
+    if state == "miss" and "qr_cache" in run:
+        stats["qr_cache"] = run["qr_cache"]
+    return stats
+
+
+def optimize_sizes(ids, logo_path, checkin_base, email, phone, optimize=False, written=None, **opts):
+    """PDF size of a job with and without ``optimize``, as ``{"plain": n, "optimized": n}``.
+
+    ``written`` is the size of the PDF already rendered with ``optimize`` (None
+    when unknown, e.g. on a pipe); the other variant, or both, are rendered in
+    memory. ``opts`` are further generate_pdf() arguments.
+    """
+    sizes = {}
+    for name, flag in (("plain", False), ("optimized", True)):
+        if flag == bool(optimize) and written is not None:
+            sizes[name] = written
+        else:
+            buf = io.BytesIO()
+            generate_pdf(buf, logo_path, checkin_base, email, phone, ids=ids, optimize=flag, **opts)
+            sizes[name] = len(buf.getvalue())
+    return sizes
+
+
+def _output_offset(output_pdf):
+    """Current position of a seekable output stream (None for paths and pipes)."""
+    if isinstance(output_pdf, (str, os.PathLike)):
+        return None
+    try:
+        return output_pdf.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _output_size(output_pdf, start_offset):
+    """Bytes written to ``output_pdf`` (None when that cannot be told, e.g. a pipe)."""
+    if isinstance(output_pdf, (str, os.PathLike)):
+        return os.path.getsize(output_pdf)
+    if start_offset is None:
+        return None
+    return output_pdf.tell() - start_offset
+
+
+def generate_pdf(output_pdf, logo_path, checkin_base, email, phone, ids=None, out_csv=None, show_grid=False, font_scale=1.1, start_index=1,
+                 qr_engine=DEFAULT_QR_ENGINE, qr_cache=None, workers=1, output_cache=None, optimize=False,
+                 logo_cache=None, qr_level=QR_LEVEL, qr_uppercase=False, progress=None, export=None):
+    """Render all IDs onto as many L7651 sheets as needed.
+
+    ``ids`` may be any iterable (list, generator, ...); it is consumed one sheet
+    at a time and the CSV ID map is written as labels are placed. ``qr_cache`` is
+    an optional QRMatrixCache (see open_qr_cache). With ``workers > 1`` sheets
+    are drawn in a process pool and merged in order into this one document, so
+    the logo, fonts and static form are still defined once. With an
+    ``output_cache`` (see open_output_cache) an identical earlier job's PDF is
+    reused instead of rendering. ``optimize`` makes the PDF smaller without a
+    visible change (raw Flate streams, numbers rounded to OPTIMIZE_DIGITS).
+    ``logo_cache`` is a directory keeping the print-size logo between runs
+    (see load_logo). ``qr_level`` is the QR error-correction level (or "auto") and
+    ``qr_uppercase`` encodes upper-cased URLs (see qr_payload). ``progress``
+    is called as ``progress(sheets, labels)`` after every finished sheet, and
+    each sheet's labels are written to ``export`` (an IDExport, see
+    open_export) as they are placed, like the CSV ID map. Returns a
+    dict with ``pages``, ``labels``, ``seconds``, ``bytes`` (when the output
+    size can be determined) and ``qr_modules`` (``{modules per side: labels}``,
+    path engine only), plus ``qr_cache`` hit/miss counts when caching and
+    ``output_cache`` ("hit"/"miss") and ``cache_key`` with an output cache.
+    """
+    if qr_engine not in QR_ENGINES:
+        raise ValueError(f"unknown qr_engine {qr_engine!r} (expected one of {', '.join(QR_ENGINES)})")
+    if qr_level not in LEVEL_CHOICES:
+        raise ValueError(f"unknown qr_level {qr_level!r} (expected one of {', '.join(LEVEL_CHOICES)})")
+    if output_cache is not None:
+        if ids is None:
+            ids = new_ids(SLOTS_PER_SHEET)
+        return _generate_cached(output_cache, output_pdf, logo_path, checkin_base, email, phone, ids, out_csv,
+                                show_grid, font_scale, start_index, qr_engine, qr_cache, workers, optimize, logo_cache,
+                                qr_level, qr_uppercase, progress, export)
+    t0 = time.perf_counter()
+    timings = _timings
+    font_pair = FONT_CANDIDATES[min(max(SELECTED_FONT_INDEX, 0), len(FONT_CANDIDATES)-1)]
+    start_offset = _output_offset(output_pdf)
+    with timings.span("setup"):
+        c = new_canvas(output_pdf, font_pair)
+
+    logo_img = load_logo(logo_path, logo_cache)
+
+    # Build IDs
+    if ids is None:
+        ids = new_ids(SLOTS_PER_SHEET)
+
+    csv_fh = open(out_csv, "w", newline="") if out_csv else None
+    writer = csv.writer(csv_fh) if csv_fh else None
+    if writer:
+        writer.writerow(["index", "id"])
+
+    opts = {
+        "checkin_base": checkin_base,
+        "email": email,
+        "phone": phone,
+        "show_grid": show_grid,
+        "font_scale": font_scale,
+        "qr_engine": qr_engine,
+        "qr_level": qr_level,
+        "qr_uppercase": bool(qr_uppercase),
+        # Always use the first label's font across all labels
+        "font_pair": font_pair,
+        "timings": timings is not NO_TIMINGS,
+        "optimize": bool(optimize),
+        "logo_cache": logo_cache,
+    }
+    with timings.span("setup"), pdf_settings(optimize):
+        static_form = build_static_form(c, logo_img, email, phone, font_pair, font_scale)
+
+    sheets = iter_sheets(ids, start_index)
+    if workers > 1:
+        rendered = _iter_parallel_pages(sheets, workers, opts, logo_path, qr_cache)
+    else:
+        rendered = ((sheet, None) for sheet in sheets)
+
+    pages = 0
+    idx = 0
+    qr_modules = {}
+    try:
+        for sheet, page in rendered:
+            with timings.span("draw"):
+                if page is None:
+                    sizes = draw_sheet(c, sheet, opts, logo_img, static_form, qr_cache)
+                    if optimize:
+                        code = page_content(c)[0]
+                        code[:] = compact_numbers(code)
+                else:
+                    # Splice a worker-rendered page; it references the same resource names
+                    code, forms, sizes = page
+                    page_code, page_forms = page_content(c)
+                    page_code.extend(code)
+                    page_forms.extend(forms)
+                for n, count in sizes.items():
+                    qr_modules[n] = qr_modules.get(n, 0) + count
+            with timings.span("csv"):
+                for _slot, uid in sheet:
+                    idx += 1
+                    if writer:
+                        writer.writerow([idx, uid])
+            if export is not None:
+                with timings.span("export"):
+                    export.add_sheet(pages + 1, sheet)
+            with timings.span("draw"), pdf_settings(optimize):
+                c.showPage()
+            pages += 1
+            if progress:
+                progress(pages, idx)
+        with timings.span("save"), pdf_settings(optimize):
+            c.save()
+    finally:
+        if csv_fh:
+            csv_fh.close()
+        if qr_cache is not None:
+            with timings.span("qr_cache"):
+                qr_cache.flush()
+
+    stats = {"pages": pages, "labels": idx, "seconds": time.perf_counter() - t0,
+             "qr_modules": {str(n): qr_modules[n] for n in sorted(qr_modules)}}
+    size = _output_size(output_pdf, start_offset)
+    if size is not None:
+        stats["bytes"] = size
+    if qr_cache is not None:
+        stats["qr_cache"] = qr_cache.stats()
+    timings.count("pages", pages)
+    timings.count("labels", idx)
+    return stats
+
+
+def render_labels(ids=None, out=None, logo_path=DEFAULT_LOGO, checkin_base=DEFAULT_CHECKIN_BASE,
+                  email=DEFAULT_EMAIL, phone=DEFAULT_PHONE, out_csv=None, show_grid=False,
+                  font_scale=1.1, start_index=1, qr_engine=DEFAULT_QR_ENGINE, qr_cache=None, workers=1,
+                  output_cache=None, optimize=False, logo_cache=None, qr_level=QR_LEVEL, qr_uppercase=False):
+    """Library entry point: render ``ids`` to a PDF without touching the disk.
+
+    With ``out=None`` the PDF is returned as ``bytes``. Otherwise ``out`` is any
+    writable binary stream (file, socket wrapper, ``sys.stdout.buffer``, ...) and
+    the generate_pdf stats dict is returned.
+    """
+    target = io.BytesIO() if out is None else out
+    stats = generate_pdf(target, logo_path, checkin_base, email, phone, ids=ids, out_csv=out_csv,
+                         show_grid=show_grid, font_scale=font_scale, start_index=start_index,
+                         qr_engine=qr_engine, qr_cache=qr_cache, workers=workers, output_cache=output_cache,
+                         optimize=optimize, logo_cache=logo_cache, qr_level=qr_level, qr_uppercase=qr_uppercase)
+    return target.getvalue() if out is None else stats
+
+
+class VerificationError(ValueError):
+    """A job's PDF did not decode back to what was placed; ``report`` is the verify_pdf() report."""
+
+    def __init__(self, report):
+        self.report = report
+        failures = report["failures"]
+        shown = "; ".join(f"page {f['page']} row {f['row']} col {f['col']} {f['id']}: {f['problem']}"
+                          for f in failures[:5])
+        super().__init__(f"Label verification failed for {len(failures)} check(s): {shown}")
+
+
+def verify_pdf(source, ids, checkin_base, logo_path=DEFAULT_LOGO, font_scale=1.1, start_index=1,
+               qr_uppercase=False, logo_cache=None, workers=None, dpi=VERIFY_DPI):
+    """Decode every label of a generated PDF back and compare it with what was placed.
+
+    ``source`` is the PDF's path or bytes, ``ids`` the list it was rendered
+    from and the other options the ones it was rendered with. Pages are checked
+    in a pool of ``workers`` processes (default: one per CPU, see
+    label_verify.py). Returns the verify_document() report with each failure's
+    ``row`` and ``col`` (1-based) added.
+    """
+    from label_verify import verify_document
+
+    layout = compile_sheet_layout(load_logo(logo_path, logo_cache), font_scale)
+    id_pt = layout["id_pt"]
+    boxes = []
+    for x_label_mm, _y_top_mm, qr_x_mm, qr_y_mm, _text_x_mm, id_y_mm in layout["slots"]:
+        # PDF points from the page's top-left corner, as the rasterizer sees them
+        baseline = (A4_H - id_y_mm) * mm
+        boxes.append((
+            (qr_x_mm * mm, (A4_H - qr_y_mm - QR_W) * mm, (qr_x_mm + QR_W) * mm, (A4_H - qr_y_mm) * mm),
+            (x_label_mm * mm, baseline - id_pt, (x_label_mm + LABEL_W) * mm, baseline + 0.4 * id_pt),
+        ))
+    pages = ((page, [(slot, uid, qr_payload(checkin_base, uid, qr_uppercase)) for slot, uid in sheet])
+             for page, sheet in enumerate(iter_sheets(ids, start_index), 1))
+    with _timings.span("verify"):
+        report = verify_document(source, pages, boxes, dpi, workers or os.cpu_count() or 1)
+    for failure in report["failures"]:
+        row, col = divmod(failure["slot"] - 1, COLS)
+        failure["row"], failure["col"] = row + 1, col + 1
+    _timings.count("verify_failures", len(report["failures"]))
+    return report
+
+
+def open_raster(logo_img, email, phone, font_pair, font_scale, dpi):
+    """A label_raster.LabelRaster laid out exactly like the PDF (same compile_sheet_layout())."""
+    from PIL import Image
+    from label_raster import LabelRaster
+    spec = {
+        "label_w": LABEL_W, "label_h": LABEL_H, "page_w": A4_W, "page_h": A4_H,
+        "qr_size": QR_W, "qr_border": QR_BORDER, "hscale": TEXT_HSCALE,
+    }
+    logo = None
+    if logo_img is not None:
+        # load_logo() already flattened it; getRGBData() is "L" for greyscale logos
+        logo = Image.frombytes(logo_img.mode, logo_img.getSize(), logo_img.getRGBData())
+    return LabelRaster(compile_sheet_layout(logo_img, font_scale), spec, logo, email, phone, font_pair[1], dpi)
+
+
+def _raster_page_path(output, page):
+    """Path of sheet ``page`` of a PNG job: ``{page}`` in ``output`` is replaced,
+    otherwise sheets after the first get ``-<page>`` before the extension."""
+    output = os.fspath(output)
+    if "{page}" in output:
+        return output.replace("{page}", str(page))
+    if page == 1:
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}-{page}{ext}"
+
+
+def placed_start_index(fmt, start_index):
+    """The first slot a ``fmt`` render actually uses: zpl/pbm labels are not placed on a sheet."""
+    return start_index if fmt in ("pdf", "png") else 1
+
+
+def generate_raster(output, logo_path, checkin_base, email, phone, ids=None, fmt="png", dpi=None, out_csv=None,
+                    show_grid=False, font_scale=1.1, start_index=1, qr_cache=None, logo_cache=None,
+                    qr_level=QR_LEVEL, qr_uppercase=False, progress=None, export=None):
+    """Render labels as bitmaps instead of a PDF (see label_raster.py).
+
+    ``fmt`` "png" renders whole A4 sheets at ``dpi`` (default RASTER_DPI): to a
+    path, one PNG per sheet (see _raster_page_path); to a stream, only the first
+    sheet, as a preview. "zpl" and "pbm" render every label on its own at label
+    size, as one stream of 1-bit images for thermal printers. Geometry, QR
+    encoding, the CSV ID map, ``progress`` and ``export`` are the same as generate_pdf's. Returns a dict
+    with ``format``, ``dpi``, ``pages`` (sheets, or labels for zpl/pbm),
+    ``labels``, ``seconds``, ``bytes`` and ``qr_modules``, plus ``qr_cache``
+    counts when caching.
+    """
+    if fmt not in RASTER_FORMATS:
+        raise ValueError(f"unknown raster format {fmt!r} (expected one of {', '.join(RASTER_FORMATS)})")
+    if qr_level not in LEVEL_CHOICES:
+        raise ValueError(f"unknown qr_level {qr_level!r} (expected one of {', '.join(LEVEL_CHOICES)})")
+    from label_raster import to_png, to_pbm, to_zpl
+    t0 = time.perf_counter()
+    timings = _timings
+    dpi = int(dpi or RASTER_DPI[fmt])
+    font_pair = FONT_CANDIDATES[min(max(SELECTED_FONT_INDEX, 0), len(FONT_CANDIDATES)-1)]
+    logo_img = load_logo(logo_path, logo_cache)
+    if ids is None:
+        ids = new_ids(SLOTS_PER_SHEET)
+    with timings.span("setup"):
+        raster = open_raster(logo_img, email, phone, font_pair, font_scale, dpi)
+    to_path = isinstance(output, (str, os.PathLike))
+    sheets_to_files = fmt == "png" and to_path
+    out_fh = open(output, "wb") if to_path and not sheets_to_files else output
+    csv_fh = open(out_csv, "w", newline="") if out_csv else None
+    writer = csv.writer(csv_fh) if csv_fh else None
+    if writer:
+        writer.writerow(["index", "id"])
+    encode_label = to_zpl if fmt == "zpl" else to_pbm
+    pages = idx = written = 0
+    qr_modules = {}
+    try:
+        for sheets, sheet in enumerate(iter_sheets(ids, placed_start_index(fmt, start_index)), 1):
+            labels = []
+            for slot, uid in sheet:
+                modules = qr_matrix(qr_payload(checkin_base, uid, qr_uppercase), qr_level, cache=qr_cache)
+                qr_modules[len(modules)] = qr_modules.get(len(modules), 0) + 1
+                labels.append((slot, uid, modules))
+            with timings.span("csv"):
+                for _slot, uid in sheet:
+                    idx += 1
+                    if writer:
+                        writer.writerow([idx, uid])
+            if export is not None:
+                with timings.span("export"):
+                    export.add_sheet(sheets, sheet)
+            with timings.span("draw"):
+                if fmt == "png":
+                    data = to_png(raster.sheet(labels, show_grid), dpi)
+                    pages += 1
+                else:
+                    data = b"".join(encode_label(raster.label(uid, modules)) for _slot, uid, modules in labels)
+                    pages += len(labels)
+            with timings.span("save"):
+                if sheets_to_files:
+                    with open(_raster_page_path(output, pages), "wb") as fh:
+                        fh.write(data)
+                else:
+                    out_fh.write(data)
+            written += len(data)
+            if progress:
+                progress(sheets, idx)
+            if fmt == "png" and not to_path:
+                break  # a stream holds one PNG: the first sheet is the preview
+    finally:
+        if csv_fh:
+            csv_fh.close()
+        if to_path and not sheets_to_files:
+            out_fh.close()
+        if qr_cache is not None:
+            with timings.span("qr_cache"):
+                qr_cache.flush()
+
+    stats = {"format": fmt, "dpi": dpi, "pages": pages, "labels": idx, "seconds": time.perf_counter() - t0,
+             "bytes": written, "qr_modules": {str(n): qr_modules[n] for n in sorted(qr_modules)}}
+    if qr_cache is not None:
+        stats["qr_cache"] = qr_cache.stats()
+    timings.count("pages", pages)
+    timings.count("labels", idx)
+    return stats
+
+
+def _id_from_record(value):
+    """ID of one parsed record: a string, a number or an object with an "id" key."""
+    if isinstance(value, dict):
+        value = value.get("id")
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"unsupported ID record: {value!r}")
+    return str(value).strip()
+
+
+def _iter_json_array(buf, fh):
+    """Yield the elements of a JSON array, decoding one element at a time.
+
+    ``buf`` is the text read so far (starting at the ``[``); more is read from
+    ``fh`` in IDS_READ_CHUNK pieces only when an element runs past its end, so
+    the buffer never holds much more than one chunk.
+
+    Fast path: everything up to the buffer's last comma is handed to json.loads
+    in one call. A comma inside a string or nested object leaves that slice
+    unterminated, so the call can only succeed when the comma is between top-level
+    elements. Otherwise that chunk is decoded one element at a time.
+    """
+    decoder = json.JSONDecoder()
+    ws = re.compile(r"\s*")
+    pos = 1
+    eof = False
+    want_value = True
+    first = True
+    batch_ok = True
+    while True:
+        if want_value and batch_ok:
+            cut = buf.rfind(",", pos)
+            if cut > pos:
+                try:
+                    values = json.loads("[" + buf[pos:cut] + "]")
+                except ValueError:
+                    batch_ok = False
+                else:
+                    yield from values
+                    pos = cut + 1
+                    first = False
+                    continue
+        pos = ws.match(buf, pos).end()
+        need_more = pos >= len(buf)
+        if not need_more:
+            ch = buf[pos]
+            if not want_value:
+                if ch == "]":
+                    return
+                if ch != ",":
+                    raise ValueError(f"ids file: expected ',' or ']' in JSON array, got {ch!r}")
+                pos += 1
+                want_value = True
                 continue
-            uid = ids[idx]
-            payload = f"{checkin_base.rstrip('/')}/{uid}"
-            draw_label(c, x_label_mm, y_top_mm, payload, logo_img, email, phone, uid, font_pair, font_scale)
-            idx += 1
+            if ch == "]" and first:
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                need_more = True
+            else:
+                # A number at the very end of the buffer may continue in the next chunk
+                need_more = end == len(buf) and not eof
+        if need_more:
+            if eof:
+                raise ValueError("ids file: truncated or invalid JSON array")
+            more = fh.read(IDS_READ_CHUNK)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            batch_ok = True
+            continue
+        yield value
+        pos = end
+        want_value = first = False
+
+
+def iter_ids(fh, stats=None):
+    """Stream IDs from a text file object, detecting the format from its first bytes.
+
+    Supported: a JSON array (strings, numbers or {"id": ...} objects), JSON
+    lines, CSV (the first column named like ID_HEADERS if the header has one,
+    else the first column) and plain text with one ID per line. A first line
+    of plain text that is one of ID_HEADERS is the header of a one-column CSV
+    and is skipped. Input is read lazily and IDs are
+    yielded as they are parsed, so memory does not grow with the file; only the
+    set of IDs already seen is kept, to drop duplicates (see clean_ids).
+    """
+    head = fh.read(IDS_READ_CHUNK).lstrip("\ufeff")
+    start = head.lstrip()
+    if start.startswith("["):
+        records = (v.strip() if v.__class__ is str else _id_from_record(v) for v in _iter_json_array(start, fh))
+    else:
+        # Complete the chunk's last line, then continue with the file's own line iterator
+        lines = itertools.chain(io.StringIO(head + fh.readline()), fh)
+        if start[:1] in ('{', '"'):
+            records = (_id_from_record(json.loads(line)) for line in lines if line.strip())
+        elif "," in start.split("\n", 1)[0]:
+            rows = csv.reader(lines)
+            header = next(rows, [])
+            names = [h.strip().lower() for h in header]
+            col = next((names.index(h) for h in ID_HEADERS if h in names), None)
+            if col is None:
+                col = 0
+                rows = itertools.chain([header], rows)
+            records = (row[col].strip() for row in rows if len(row) > col)
+        else:
+            records = _skip_id_header(line.strip() for line in lines)
+    return clean_ids(records, stats)
+
+
+def _skip_id_header(records):
+    """``records`` without a leading ID_HEADERS name (the header of a one-column CSV)."""
+    records = iter(records)
+    for first in records:
+        if first:
+            if first.lower() not in ID_HEADERS:
+                yield first
+            break
+    yield from records
+
+
+def clean_ids(records, stats=None):
+    """Yield the non-empty IDs of ``records`` once each, in order.
+
+    IDs not matching ID_RE raise ValueError. ``stats`` (a dict) receives
+    ``ids`` and ``duplicates`` counts as the generator is consumed.
+    """
+    stats = {} if stats is None else stats
+    stats.setdefault("ids", 0)
+    stats.setdefault("duplicates", 0)
+    seen = set()
+    for n, uid in enumerate(records, 1):
+        if not uid:
+            continue
+        if not ID_RE.fullmatch(uid):
+            raise ValueError(f"invalid ID {uid!r} (record {n})")
+        if uid in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(uid)
+        stats["ids"] += 1
+        yield uid
+
+
+def read_ids(fh):
+    """Read all IDs from a text stream (see iter_ids) into a list."""
+    return list(iter_ids(fh))
+
+
+def run_job(job, progress=None):
+    """Run one job given as a dict of generate_pdf options (the --serve request shape).
+
+    Keys mirror the CLI flags in snake_case: ``out`` (required), ``ids``
+    (validated and deduplicated like --ids-file) or ``ids_file``, ``logo``, ``checkin_base``,
+    ``email``, ``phone``, ``csv``, ``show_grid``, ``font_scale``, ``start_index``,
+    ``qr_engine``, ``qr_level``, ``qr_uppercase``, ``qr_cache`` (cache file
+    path), ``output_cache`` and ``logo_cache`` (directories), ``optimize``,
+    ``workers``, ``format`` ("pdf" or one of RASTER_FORMATS, see
+    generate_raster) and ``dpi``. ``verify: true`` decodes the finished PDF
+    back (see verify_pdf, ``verify_workers`` processes) and adds the report
+    under ``verify``; a failure raises VerificationError instead, and the
+    output file is removed. With ``ledger`` (file path) the labels are recorded
+    under ``batch`` (see ledger_batch) and IDs printed before are rejected
+    unless ``reprint`` or the job is a re-fetch of a cached PDF (see
+    is_refetch); ``reprint_batch`` prints an earlier batch's IDs again.
+    ``export`` is a bulk-load file of the placed IDs (``export_format`` "tsv"
+    or "jsonl", see open_export), summarized under ``export``. ``progress`` receives progress_tracker() dicts while the job renders.
+    Without ``ids``, ``count`` new IDs are generated (reserved in the ``id_index``
+    file when given). ``timings: true`` adds the per-phase record under
+    ``timings``. With ``out == "-"`` the output is returned base64-encoded under
+    ``pdf_b64`` (``png_b64``, ... for raster formats) instead of being written
+    to disk.
+    """
+    if not job.get("out"):
+        raise ValueError("job is missing 'out'")
+    ids = job.get("ids")
+    id_stats = {}
+    ledger = open_ledger(job.get("ledger"))
+    reprint = bool(job.get("reprint", False))
+    if job.get("reprint_batch"):
+        ids = reprint_ids(ledger, job["reprint_batch"])
+        reprint = True
+    elif ids is not None:
+        ids = list(clean_ids((_id_from_record(x) for x in ids), id_stats))
+    elif job.get("ids_file"):
+        with open(job["ids_file"], "r", encoding="utf-8", newline="") as fh:
+            ids = list(iter_ids(fh, id_stats))
+    else:
+        ids = new_ids(int(job.get("count", SLOTS_PER_SHEET)), open_id_index(job.get("id_index")))
+    to_memory = job["out"] == "-"
+    target = io.BytesIO() if to_memory else job["out"]
+    fmt = job.get("format", "pdf")
+    if job.get("verify") and fmt != "pdf":
+        raise ValueError("verify needs PDF output")
+    # Caches stay open across jobs; report this job's share of the hits and misses
+    qr_cache = open_qr_cache(job.get("qr_cache"))
+    qr_before = qr_cache.stats() if qr_cache is not None else None
+    output_cache = open_output_cache(job.get("output_cache")) if fmt == "pdf" else None
+    if not reprint and is_refetch(ledger, output_cache, ids, job.get("logo", DEFAULT_LOGO),
+                                  job.get("checkin_base", DEFAULT_CHECKIN_BASE), job.get("email", DEFAULT_EMAIL),
+                                  job.get("phone", DEFAULT_PHONE), bool(job.get("show_grid", False)),
+                                  float(job.get("font_scale", 1.1)), int(job.get("start_index", 1)),
+                                  job.get("qr_engine", DEFAULT_QR_ENGINE), bool(job.get("optimize", False)),
+                                  job.get("qr_level", QR_LEVEL), bool(job.get("qr_uppercase", False))):
+        reprint = True
+    if progress:
+        progress = progress_tracker(progress, len(ids), placed_start_index(fmt, int(job.get("start_index", 1))))
+    timings = Timings() if job.get("timings") else None
+    previous = set_timings(timings) if timings else None
+    try:
+        with ledger_batch(ledger, ids, job.get("checkin_base", DEFAULT_CHECKIN_BASE),
+                          start_index=placed_start_index(fmt, int(job.get("start_index", 1))),
+                          qr_uppercase=bool(job.get("qr_uppercase", False)),
+                          batch=job.get("batch"), reprint=reprint) as recorded, \
+                open_export(job.get("export"), job.get("checkin_base", DEFAULT_CHECKIN_BASE),
+                            bool(job.get("qr_uppercase", False)), recorded["batch"] if recorded else job.get("batch"),
+                            job.get("export_format")) as export:
+            if fmt != "pdf":
+                stats = generate_raster(
+                    target,
+                    job.get("logo", DEFAULT_LOGO),
+                    job.get("checkin_base", DEFAULT_CHECKIN_BASE),
+                    job.get("email", DEFAULT_EMAIL),
+                    job.get("phone", DEFAULT_PHONE),
+                    ids=ids,
+                    fmt=fmt,
+                    dpi=job.get("dpi"),
+                    out_csv=job.get("csv"),
+                    show_grid=bool(job.get("show_grid", False)),
+                    font_scale=float(job.get("font_scale", 1.1)),
+                    start_index=int(job.get("start_index", 1)),
+                    qr_cache=qr_cache,
+                    logo_cache=job.get("logo_cache"),
+                    qr_level=job.get("qr_level", QR_LEVEL),
+                    qr_uppercase=bool(job.get("qr_uppercase", False)),
+                    progress=progress,
+                    export=export,
+                )
+            else:
+                stats = generate_pdf(
+                    target,
+                    job.get("logo", DEFAULT_LOGO),
+                    job.get("checkin_base", DEFAULT_CHECKIN_BASE),
+                    job.get("email", DEFAULT_EMAIL),
+                    job.get("phone", DEFAULT_PHONE),
+                    ids=ids,
+                    out_csv=job.get("csv"),
+                    show_grid=bool(job.get("show_grid", False)),
+                    font_scale=float(job.get("font_scale", 1.1)),
+                    start_index=int(job.get("start_index", 1)),
+                    qr_engine=job.get("qr_engine", DEFAULT_QR_ENGINE),
+                    qr_cache=qr_cache,
+                    workers=usable_workers(job.get("workers", 1)),
+                    output_cache=output_cache,
+                    optimize=bool(job.get("optimize", False)),
+                    logo_cache=job.get("logo_cache"),
+                    qr_level=job.get("qr_level", QR_LEVEL),
+                    qr_uppercase=bool(job.get("qr_uppercase", False)),
+                    progress=progress,
+                    export=export,
+                )
+                if job.get("verify"):
+                    stats["verify"] = verify_pdf(
+                        target.getvalue() if to_memory else job["out"],
+                        ids,
+                        job.get("checkin_base", DEFAULT_CHECKIN_BASE),
+                        logo_path=job.get("logo", DEFAULT_LOGO),
+                        font_scale=float(job.get("font_scale", 1.1)),
+                        start_index=int(job.get("start_index", 1)),
+                        qr_uppercase=bool(job.get("qr_uppercase", False)),
+                        logo_cache=job.get("logo_cache"),
+                        workers=job.get("verify_workers"),
+                    )
+                    if stats["verify"]["failures"]:
+                        # The batch is marked failed and the export dropped; the PDF must not be used either
+                        if not to_memory:
+                            with contextlib.suppress(FileNotFoundError):
+                                os.remove(job["out"])
+                        raise VerificationError(stats["verify"])
+    finally:
+        if timings:
+            set_timings(previous)
+    if id_stats.get("duplicates"):
+        stats["duplicates"] = id_stats["duplicates"]
+    if "qr_cache" in stats:
+        stats["qr_cache"] = {k: v - qr_before[k] for k, v in stats["qr_cache"].items()}
+    if recorded:
+        stats["ledger"] = recorded
+    if export is not None:
+        stats["export"] = export.summary()
+    if timings:
+        stats["timings"] = timings.record()
+    if to_memory:
+        stats[f"{fmt}_b64"] = base64.b64encode(target.getvalue()).decode("ascii")
+    return stats
+
+
+def progress_tracker(report, labels_total, start_index=1, interval=PROGRESS_INTERVAL):
+    """A ``progress(sheets, labels)`` callback for generate_pdf that passes
+    ``report`` a dict with ``sheets_done``, ``sheets_total``, ``labels_done``,
+    ``labels_total``, ``labels_per_second``, ``eta_seconds`` and
+    ``elapsed_seconds``, at most every ``interval`` seconds (and always for the
+    last sheet).
+    """
+    start = min(max(1, int(start_index)), SLOTS_PER_SHEET)
+    sheets_total = max(1, -(-(labels_total + start - 1) // SLOTS_PER_SHEET))
+    t0 = time.perf_counter()
+    last = [None]
+
+    def tracker(sheets, labels):
+        now = time.perf_counter()
+        if labels < labels_total and last[0] is not None and now - last[0] < interval:
+            return
+        last[0] = now
+        elapsed = now - t0
+        rate = labels / elapsed if elapsed > 0 else 0.0
+        report({
+            "sheets_done": sheets,
+            "sheets_total": sheets_total,
+            "labels_done": labels,
+            "labels_total": labels_total,
+            "labels_per_second": round(rate, 1),
+            "eta_seconds": round((labels_total - labels) / rate, 1) if rate > 0 else None,
+            "elapsed_seconds": round(elapsed, 3),
+        })
+    return tracker
+
 
-    c.showPage()
-    c.save()
+def job_response(job):
+    """run_job() wrapped for a response line: ``id``, ``ok`` and the stats or the ``error``."""
+    job_id = job.get("id") if isinstance(job, dict) else None
+    try:
+        if not isinstance(job, dict):
+            raise ValueError("job must be a JSON object")
+        return {"id": job_id, "ok": True, **run_job(job)}
+    except Exception as e:
+        return {"id": job_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
 
-    if out_csv:
-        with open(out_csv, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["index", "id"])
-            for i, uid in enumerate(ids, start=1):
-                writer.writerow([i, uid])
+
+def read_manifest(fh):
+    """Parse a job manifest; returns the list of job dicts.
+
+    Accepted shapes: a JSON array of jobs, ``{"defaults": {...}, "jobs":
+    [...]}`` (every job starts from ``defaults``), a single job object, or
+    JSONL with one job per line. Jobs are run_job() dicts.
+    """
+    text = fh.read()
+    try:
+        doc = json.loads(text)
+    except json.JSONDecodeError:
+        doc = [json.loads(line) for line in text.splitlines() if line.strip()]
+    defaults = {}
+    if isinstance(doc, dict):
+        if "jobs" in doc:
+            defaults = doc.get("defaults") or {}
+            doc = doc["jobs"]
+        else:
+            doc = [doc]
+    if not isinstance(doc, list):
+        raise ValueError("manifest must be a job list, a {\"jobs\": [...]} object or JSONL")
+    return [{**defaults, **job} if isinstance(job, dict) else job for job in doc]
+
+
+def run_manifest(jobs, results, log=None, timings=False):
+    """Run ``jobs`` one after another in this process, writing one JSON result line per job.
+
+    Imports, the decoded logo, compiled layouts and open QR/ID/output caches are
+    shared by every job, so each job after the first only pays for its own
+    drawing. Result lines have the --serve response shape plus ``job`` (the
+    1-based position in the manifest; it is also the ``id`` when the job has
+    none) and ``job_seconds``. With ``timings`` every job gets its per-phase
+    record. Returns a summary dict (``jobs``, ``ok``, ``failed``, ``labels``,
+    ``seconds``).
+    """
+    t0 = time.perf_counter()
+    summary = {"jobs": 0, "ok": 0, "failed": 0, "labels": 0}
+    for n, job in enumerate(jobs, 1):
+        if isinstance(job, dict):
+            job = {"id": n, **job}
+            if timings:
+                job.setdefault("timings", True)
+        started = time.perf_counter()
+        resp = {"job": n, **job_response(job), "job_seconds": round(time.perf_counter() - started, 6)}
+        results.write(json.dumps(resp) + "\n")
+        results.flush()
+        summary["jobs"] += 1
+        if resp["ok"]:
+            summary["ok"] += 1
+            summary["labels"] += resp["labels"]
+            if log:
+                print(f"Job {n} ({resp['id']}): {resp['pages']} pages, {resp['labels']} labels, "
+                      f"{resp['job_seconds']:.2f}s", file=log)
+        else:
+            summary["failed"] += 1
+            if log:
+                print(f"Job {n} ({resp['id']}) failed: {resp['error']}", file=log)
+    summary["seconds"] = time.perf_counter() - t0
+    return summary
+
+
+def serve_queue(root, drain=False, poll=QUEUE_POLL_SECONDS, log=None):
+    """--queue-worker: run jobs from the durable queue in ``root`` one at a time.
+
+    Jobs are run_job() dicts submitted with --submit (or by the API; see
+    label_queue.py). While a job renders its status snapshot carries
+    progress_tracker() progress; when it ends the snapshot holds the stats
+    (state "done") or the error (state "failed"). Jobs left running by a dead
+    worker are requeued at start. Runs until killed, or with ``drain`` until the
+    queue is empty; returns the number of jobs run.
+    """
+    from label_queue import JobQueue
+
+    queue = JobQueue(root)
+    for job_id in queue.recover():
+        if log:
+            print(f"Requeued {job_id} (its worker died)", file=log)
+    ran = 0
+    while True:
+        claimed = queue.claim()
+        if claimed is None:
+            if drain:
+                return ran
+            time.sleep(poll)
+            continue
+        job_id, job = claimed
+        ran += 1
+        try:
+            result = run_job(job, progress=functools.partial(queue.progress, job_id))
+        except Exception as e:
+            queue.fail(job_id, f"{type(e).__name__}: {e}")
+            if log:
+                print(f"Job {job_id} failed: {type(e).__name__}: {e}", file=log)
+        else:
+            queue.finish(job_id, result)
+            if log:
+                print(f"Job {job_id}: {result['pages']} pages, {result['labels']} labels, "
+                      f"{result['seconds']:.2f}s", file=log)
+
+
+def serve(stdin=None, stdout=None, logo_path=None):
+    """Long-running worker: read one JSON job per line, answer with one JSON line.
+
+    Modules are imported and the logo decoded once, so each job only pays for
+    drawing. Responses echo the job's ``id`` and carry ``ok`` plus either the
+    generate_pdf stats or an ``error`` message. Nothing else is written to
+    ``stdout`` while serving.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    load_logo(logo_path)
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            resp = {"id": None, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        else:
+            resp = job_response(job)
+        stdout.write(json.dumps(resp) + "\n")
+        stdout.flush()
+
+
+def _run_cli(args, to_stdout):
+    # Build IDs from inputs. Files are streamed straight into rendering, so they
+    # stay open until generate_pdf() is done.
+    with contextlib.ExitStack() as stack:
+        ids = None
+        id_stats = {}
+        ledger = open_ledger(args.ledger)
+        reprint = args.reprint
+        if args.reprint_batch:
+            ids = reprint_ids(ledger, args.reprint_batch)
+            reprint = True
+        elif args.ids_file == "-":
+            ids = iter_ids(sys.stdin, id_stats)
+        elif args.ids_file:
+            p = args.ids_file
+            if os.path.exists(p):
+                ids = iter_ids(stack.enter_context(open(p, 'r', encoding='utf-8', newline='')), id_stats)
+        if ids is None and args.ids:
+            ids = clean_ids((s.strip() for s in args.ids.split(',')), id_stats)
+        if ids is None:
+            with _timings.span("parse_ids"):
+                ids = new_ids(args.count, open_id_index(args.id_index))
+
+        if args.verify or args.size_report or ledger is not None:
+            # Recorded before rendering / checked against the PDF afterwards, so the stream is kept
+            ids = list(ids)
+        output_cache = open_output_cache(args.output_cache) if args.format == "pdf" else None
+        if not reprint and is_refetch(ledger, output_cache, ids, args.logo, args.checkin_base, args.email, args.phone,
+                                      args.show_grid, args.font_scale, args.start_index, args.qr_engine,
+                                      args.optimize, args.qr_level, args.qr_uppercase):
+            reprint = True
+        output = sys.stdout.buffer if to_stdout else args.out
+        if args.verify and to_stdout:
+            # Verified before anything reaches the pipe
+            output = io.BytesIO()
+        # Duplicates are rejected here, before rendering; the batch is marked failed if rendering raises
+        recorded = stack.enter_context(ledger_batch(ledger, ids, args.checkin_base,
+                                                    placed_start_index(args.format, args.start_index),
+                                                    args.qr_uppercase, args.batch, reprint))
+        # Written sheet by sheet during rendering; only kept if the run completes
+        export = stack.enter_context(open_export(args.export, args.checkin_base, args.qr_uppercase,
+                                                 recorded["batch"] if recorded else args.batch, args.export_format))
+        if args.format != "pdf":
+            stats = generate_raster(
+                output,
+                args.logo,
+                args.checkin_base,
+                args.email,
+                args.phone,
+                ids=ids,
+                fmt=args.format,
+                dpi=args.dpi,
+                out_csv=args.csv,
+                show_grid=args.show_grid,
+                font_scale=args.font_scale,
+                start_index=args.start_index,
+                qr_cache=open_qr_cache(args.qr_cache),
+                logo_cache=args.logo_cache,
+                qr_level=args.qr_level,
+                qr_uppercase=args.qr_uppercase,
+                export=export,
+            )
+        else:
+            stats = generate_pdf(
+                output,
+                args.logo,
+                args.checkin_base,
+                args.email,
+                args.phone,
+                ids=ids,
+                out_csv=args.csv,
+                show_grid=args.show_grid,
+                font_scale=args.font_scale,
+                start_index=args.start_index,
+                qr_engine=args.qr_engine,
+                qr_cache=open_qr_cache(args.qr_cache),
+                workers=usable_workers(args.workers),
+                output_cache=output_cache,
+                optimize=args.optimize,
+                logo_cache=args.logo_cache,
+                qr_level=args.qr_level,
+                qr_uppercase=args.qr_uppercase,
+                export=export,
+            )
+        if args.size_report:
+            stats["sizes"] = optimize_sizes(ids, args.logo, args.checkin_base, args.email, args.phone,
+                                            optimize=args.optimize, written=None if to_stdout else stats.get("bytes"),
+                                            show_grid=args.show_grid, font_scale=args.font_scale,
+                                            start_index=args.start_index, qr_engine=args.qr_engine,
+                                            qr_cache=open_qr_cache(args.qr_cache), logo_cache=args.logo_cache,
+                                            qr_level=args.qr_level, qr_uppercase=args.qr_uppercase)
+        if recorded:
+            stats["ledger"] = recorded
+        if export is not None:
+            stats["export"] = export.summary()
+        if args.verify:
+            pdf = output.getvalue() if to_stdout else args.out
+            stats["verify"] = verify_pdf(pdf, ids, args.checkin_base, logo_path=args.logo,
+                                         font_scale=args.font_scale, start_index=args.start_index,
+                                         qr_uppercase=args.qr_uppercase, logo_cache=args.logo_cache,
+                                         workers=args.verify_workers)
+            if to_stdout:
+                sys.stdout.buffer.write(pdf)
+    return _cli_finish(stats, id_stats, to_stdout)
+
+
+def _queue_cli(args, parser):
+    from label_queue import JobQueue
+
+    if args.submit:
+        if args.submit == "-":
+            job = json.load(sys.stdin)
+        else:
+            with open(args.submit, "r", encoding="utf-8") as fh:
+                job = json.load(fh)
+        print(JobQueue(args.queue).submit(job))
+    elif args.status:
+        status = JobQueue(args.queue).status(args.status)
+        if status is None:
+            sys.exit(f"unknown job {args.status}")
+        print(json.dumps(status))
+    elif args.queue_worker:
+        serve_queue(args.queue, drain=args.drain, log=sys.stderr)
+    else:
+        parser.error("--queue needs --submit, --status or --queue-worker")
+
+
+def _lookup_cli(args):
+    ledger = open_ledger(args.ledger)
+    if ledger is None:
+        sys.exit("--lookup needs --ledger")
+    found = 0
+    for uid in (s.strip() for s in args.lookup.split(",")):
+        rows = ledger.history(uid) if uid else []
+        found += bool(rows)
+        for row in rows:
+            print(json.dumps(row))
+        if uid and not rows:
+            print(json.dumps({"id": uid, "printed": None}))
+    # Like grep: status 1 when nothing was ever printed
+    if not found:
+        sys.exit(1)
+
+
+def _run_manifest_cli(args):
+    with contextlib.ExitStack() as stack:
+        if args.manifest == "-":
+            jobs = read_manifest(sys.stdin)
+        else:
+            jobs = read_manifest(stack.enter_context(open(args.manifest, "r", encoding="utf-8")))
+        if args.results == "-":
+            results = sys.stdout
+        else:
+            results = stack.enter_context(open(args.results, "w", encoding="utf-8"))
+        summary = run_manifest(jobs, results, log=sys.stderr, timings=args.timings)
+    rate = summary["labels"] / summary["seconds"] if summary["seconds"] > 0 else 0.0
+    print(f"Manifest: {summary['ok']}/{summary['jobs']} jobs OK, {summary['labels']} labels, "
+          f"{summary['seconds']:.2f}s ({rate:.1f} labels/s, imports {IMPORT_SECONDS:.2f}s)", file=sys.stderr)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def _cli_finish(stats, id_stats, to_stdout):
+    if to_stdout:
+        sys.stdout.buffer.flush()
+    if id_stats.get("duplicates"):
+        stats["duplicates"] = id_stats["duplicates"]
+    return stats
 
 
 def main():
     parser = argparse.ArgumentParser(description="Generate Avery L7651 labels PDF (65/A4).")
-    parser.add_argument("--logo", default="assets/ES_logo.png", help="Path to the logo image (PNG).")
-    parser.add_argument("--checkin-base", default="http://localhost:3000/check-in", help="Base URL for QR payload, e.g., https://your-host/check-in")
-    parser.add_argument("--email", default="admin@engsurveys.com.au", help="Email text.")
-    parser.add_argument("--phone", default="+61 8 8340 4469", help="Phone text.")
-    parser.add_argument("--out", default="labels_L7651_v4.pdf", help="Output PDF path.")
+    parser.add_argument("--logo", default=DEFAULT_LOGO, help="Path to the logo image (PNG).")
+    parser.add_argument("--logo-cache", default=None, help="Directory keeping the logo resampled to print size (LOGO_DPI) between runs")
+    parser.add_argument("--checkin-base", default=DEFAULT_CHECKIN_BASE, help="Base URL for QR payload, e.g., https://your-host/check-in")
+    parser.add_argument("--email", default=DEFAULT_EMAIL, help="Email text.")
+    parser.add_argument("--phone", default=DEFAULT_PHONE, help="Phone text.")
+    parser.add_argument("--out", default=None, help="Output path (default labels_L7651_v4.<format>; '-' writes to stdout). "
+                        "PNG writes one file per sheet: '{page}' in the path is the sheet number")
     parser.add_argument("--csv", default="labels_L7651_ids_v4.csv", help="Optional output CSV for IDs.")
     parser.add_argument("--show-grid", action="store_true", help="Overlay Avery grid boundaries for alignment.")
     # Background template support removed per user request
     parser.add_argument("--font-scale", type=float, default=1.1, help="Scale all text sizes uniformly (e.g., 1.1).")
-    parser.add_argument("--ids-file", default=None, help="Path to a text/JSON file with IDs (one per line or JSON array)")
+    parser.add_argument("--ids-file", default=None, help="Path to a text/JSON file with IDs (one per line or JSON array); '-' reads stdin")
     parser.add_argument("--ids", default=None, help="Comma-separated list of IDs to print")
-    parser.add_argument("--start-index", type=int, default=1, help="1-based start slot on sheet (for partial sheets)")
+    parser.add_argument("--count", type=int, default=SLOTS_PER_SHEET, help="How many new IDs to generate when no --ids/--ids-file is given (default: one sheet)")
+    parser.add_argument("--id-index", default=None, help="SQLite index of every ID ever issued; generated IDs are reserved there so they never repeat")
+    parser.add_argument("--ledger", default=None,
+                        help="SQLite print-history ledger: every label is recorded (batch, page, slot, payload) and IDs printed before are rejected, unless the identical PDF is in --output-cache")
+    parser.add_argument("--batch", default=None, help="Ledger batch name for this run (default: start time plus a random suffix)")
+    parser.add_argument("--reprint", action="store_true", help="Allow IDs the ledger has already seen (recorded as reprints)")
+    parser.add_argument("--reprint-batch", default=None, help="Print every ID of this earlier ledger batch again, in its original order")
+    parser.add_argument("--lookup", default=None, help="Print the ledger history of these comma-separated IDs as JSON lines and exit")
+    parser.add_argument("--export", default=None,
+                        help="Also write a bulk-load file of the placed IDs (asset rows with check-in payload, batch, page, slot); see label_export.py")
+    parser.add_argument("--export-format", choices=("tsv", "jsonl"), default=None,
+                        help="--export format: PostgreSQL COPY TSV or Prisma-shaped JSONL (default: from the extension, else tsv)")
+    parser.add_argument("--start-index", type=int, default=1, help="1-based start slot on the first sheet (for partial sheets); later sheets start at slot 1")
+    parser.add_argument("--qr-engine", choices=QR_ENGINES, default=DEFAULT_QR_ENGINE, help="QR renderer: merged-module path (default) or the original reportlab widget")
+    parser.add_argument("--qr-level", choices=LEVEL_CHOICES, default=QR_LEVEL, help="QR error-correction level; 'auto' takes the strongest that fits the smallest (level L) symbol")
+    parser.add_argument("--qr-uppercase", action="store_true", help="Encode the check-in URL upper-cased (alphanumeric mode, fewer modules); only if the check-in route ignores case")
+    parser.add_argument("--qr-cache", default=None, help="SQLite file caching encoded QR matrices across runs (shared safely between processes)")
+    parser.add_argument("--output-cache", default=None, help="Directory caching finished PDFs by job hash; an identical job reuses the earlier PDF")
+    parser.add_argument("--optimize", action="store_true", help="Smaller PDF, same print: raw Flate streams and compact numbers")
+    parser.add_argument("--size-report", action="store_true",
+                        help="Also render the PDF with/without --optimize in memory and print both sizes")
+    parser.add_argument("--format", choices=("pdf",) + RASTER_FORMATS, default="pdf",
+                        help="Output: vector PDF (default), PNG sheet previews, or ZPL / PBM 1-bit label streams for thermal printers")
+    parser.add_argument("--dpi", type=int, default=None, help="Raster resolution (default: 150 for png, 203 for zpl/pbm)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Rasterize the finished PDF at print resolution and decode every QR and ID back; failures exit with status 1")
+    parser.add_argument("--verify-workers", type=int, default=None, help="Processes for --verify (default: one per CPU)")
+    parser.add_argument("--workers", type=int, default=1, help="Render sheets in N processes and merge them in order (for large batches). "
+                             "Capped at the CPU count, so it renders serially on a 1-CPU host, where a pool is "
+                             "only slower; the speed-up on several cores has not been measured yet")
+    parser.add_argument("--serve", action="store_true", help="Run as a persistent worker: JSON job per line on stdin, JSON result per line on stdout")
+    parser.add_argument("--manifest", default=None,
+                        help="Run every job of a JSON/JSONL manifest in this process ('-' reads stdin); see read_manifest()")
+    parser.add_argument("--queue", default=None, help="Directory of a durable job queue (see label_queue.py), for --submit, --status and --queue-worker")
+    parser.add_argument("--submit", default=None, help="With --queue: queue this job JSON file ('-' reads stdin) and print its id")
+    parser.add_argument("--status", default=None, help="With --queue: print the status snapshot (state, progress, result) of this job id")
+    parser.add_argument("--queue-worker", action="store_true", help="With --queue: run queued jobs one at a time, publishing progress")
+    parser.add_argument("--drain", action="store_true", help="With --queue-worker: exit once the queue is empty")
+    parser.add_argument("--results", default="-", help="With --manifest: JSONL file for the per-job results (default stdout)")
+    parser.add_argument("--timings", action="store_true", help="Print per-phase wall times and counters as one JSON line on stderr")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Run this command line under python -X importtime and summarize start-up and import time per module on stderr")
+    parser.add_argument("--profile", default=None, help="Write a cProfile dump of the run to this path (inspect with python -m pstats)")
+    if "--startup-report" in sys.argv[1:]:
+        # Before parsing, so --help can be measured too
+        from label_startup import run as startup_report
+        sys.exit(startup_report(os.path.abspath(__file__), [a for a in sys.argv[1:] if a != "--startup-report"]))
     args = parser.parse_args()
 
-    # Build IDs from inputs
-    ids = None
-    if args.ids_file:
-        p = args.ids_file
-        if os.path.exists(p):
-            with open(p, 'r', encoding='utf-8') as fh:
-                txt = fh.read().strip()
-                try:
-                    arr = json.loads(txt)
-                    if isinstance(arr, list):
-                        ids = [str(x).strip() for x in arr if str(x).strip()]
-                except Exception:
-                    # fallback: parse line by line
-                    ids = [line.strip() for line in txt.splitlines() if line.strip()]
-    if ids is None and args.ids:
-        ids = [s.strip() for s in args.ids.split(',') if s.strip()]
-    if ids is None:
-        ids = [rand_id(8) for _ in range(COLS * ROWS)]
-
-    generate_pdf(
-        args.out,
-        args.logo,
-        args.checkin_base,
-        args.email,
-        args.phone,
-        ids=ids,
-        out_csv=args.csv,
-        show_grid=args.show_grid,
-        font_scale=args.font_scale,
-        start_index=args.start_index,
-    )
-    print(f"Done. PDF -> {args.out}")
+    if args.serve:
+        serve(logo_path=args.logo)
+        return
+    if args.manifest:
+        _run_manifest_cli(args)
+        return
+    if args.lookup:
+        _lookup_cli(args)
+        return
+    if args.queue:
+        _queue_cli(args, parser)
+        return
+    if args.verify and args.format != "pdf":
+        parser.error("--verify needs --format pdf")
+    if args.size_report and args.format != "pdf":
+        parser.error("--size-report needs --format pdf")
+    if args.out is None:
+        args.out = f"labels_L7651_v4.{args.format}"
+
+    # With the PDF on stdout, progress messages move to stderr
+    to_stdout = args.out == "-"
+    log = sys.stderr if to_stdout else sys.stdout
+    timings = Timings() if args.timings else None
+    if timings:
+        set_timings(timings)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    t0 = time.perf_counter()
+    try:
+        stats = _run_cli(args, to_stdout)
+    except ValueError as e:
+        from label_ledger import DuplicateIDError
+        if not isinstance(e, DuplicateIDError):
+            raise
+        # Nothing was rendered; list where each ID went before
+        print(f"Rejected: {len(e.duplicates)} ID(s) already printed (use --reprint to print them again)",
+              file=sys.stderr)
+        for d in e.duplicates:
+            print(f"  {d['id']}: batch {d['batch']}, page {d['page']}, slot {d['slot']}, "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(d['printed']))}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    total = time.perf_counter() - t0
+
+    print(f"Done. {args.format.upper()} -> {'<stdout>' if to_stdout else args.out}", file=log)
     if args.csv:
-        print(f"IDs  -> {args.csv}")
+        print(f"IDs  -> {args.csv}", file=log)
+    if "export" in stats:
+        print(f"Export -> {args.export} ({stats['export']['format']}, {stats['export']['rows']} rows, "
+              f"batch {stats['export']['batch']})", file=log)
+    rate = stats["labels"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    print(f"Pages: {stats['pages']}, labels: {stats['labels']}, {stats['seconds']:.2f}s ({rate:.1f} labels/s)", file=log)
+    if "bytes" in stats:
+        print(f"{args.format.upper()} size: {stats['bytes']} bytes ({stats['bytes'] / max(stats['pages'], 1) / 1024:.1f} KiB/page)", file=log)
+    if "sizes" in stats:
+        plain, optimized = stats["sizes"]["plain"], stats["sizes"]["optimized"]
+        print(f"Size report: {plain} bytes plain -> {optimized} bytes with --optimize "
+              f"({(optimized - plain) / max(plain, 1):+.1%})", file=log)
+    if stats.get("qr_modules"):
+        sizes = ", ".join(f"{n}x{n} x {count}" for n, count in stats["qr_modules"].items())
+        print(f"QR modules per label: {sizes}", file=log)
+    if "qr_cache" in stats:
+        print(f"QR cache: {stats['qr_cache']['hits']} hits, {stats['qr_cache']['misses']} misses", file=log)
+    if "output_cache" in stats:
+        print(f"Output cache: {stats['output_cache']} ({stats['cache_key'][:16]})", file=log)
+    if stats.get("duplicates"):
+        print(f"Duplicate IDs skipped: {stats['duplicates']}", file=log)
+    if "ledger" in stats:
+        print(f"Ledger: batch {stats['ledger']['batch']} ({stats['ledger']['labels']} labels)", file=log)
+    verify = stats.get("verify")
+    if verify:
+        bad = len({(f["page"], f["slot"]) for f in verify["failures"]})
+        print(f"Verify: {verify['labels'] - bad}/{verify['labels']} labels OK at {verify['dpi']} dpi, "
+              f"{verify['seconds']:.2f}s ({verify['workers']} workers)", file=log)
+        for f in verify["failures"]:
+            found = f" (found {f['found']!r})" if "found" in f else ""
+            print(f"  page {f['page']} row {f['row']} col {f['col']}: {f['id']}: {f['problem']}{found}", file=log)
+    if profiler:
+        print(f"Profile -> {args.profile}", file=log)
+    if timings:
+        record = {"event": "label_timings", "imports_seconds": round(IMPORT_SECONDS, 6),
+                  "total_seconds": round(total, 6), **timings.record()}
+        print(json.dumps(record), file=sys.stderr)
+    if verify and verify["failures"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
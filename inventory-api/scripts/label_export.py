@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk-load export of the IDs a run placed (--export).
+
+The CSV ID map only has ``index,id``. The export is ready to register the
+labels as placeholder assets: one row per label, with the asset fields of
+the Prisma ``assets`` model plus where and how the label was printed. Rows
+are written sheet by sheet as the generator places labels, to a temp file
+next to the target, which replaces the target only when the render succeeds.
+A failed run therefore never leaves a half export behind for an import to
+pick up.
+
+``tsv`` is PostgreSQL COPY text format: no header, tab-separated, ``\\N`` for
+NULL, backslash escapes. Columns:
+
+    id, description, status, checkin_payload, label_batch, label_page, label_slot
+
+Load it into a staging table, then register all IDs with one statement::
+
+    CREATE TEMP TABLE label_import (id text, description text, status text,
+        checkin_payload text, label_batch text, label_page int, label_slot int);
+    \\copy label_import FROM 'labels.tsv'
+    INSERT INTO assets (id, description, status)
+        SELECT id, description, status FROM label_import ON CONFLICT (id) DO NOTHING;
+
+``jsonl`` is one object per line shaped like the Prisma model, with the
+print details under ``label``::
+
+    {"id": "A4F8E75G", "description": "QR reserved asset", "status": "In Service",
+     "label": {"checkin_payload": "...", "batch": "...", "page": 1, "slot": 1}}
+
+so ``prisma.assets.createMany({ data: rows.map(({ label, ...asset }) => asset),
+skipDuplicates: true })`` inserts a whole chunk in one round trip.
+"""
+
+import os
+import json
+
+EXPORT_FORMATS = ("tsv", "jsonl")
+
+# The placeholder-asset sentinel the API already uses (lib/qrService.js), with
+# the status GET /assets/asset-options lists placeholders under
+PLACEHOLDER_DESCRIPTION = "QR reserved asset"
+PLACEHOLDER_STATUS = "In Service"
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def export_format(path, fmt=None):
+    """``fmt``, or the format implied by ``path``'s extension (tsv by default)."""
+    if fmt is None:
+        fmt = "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson") else "tsv"
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+    return fmt
+
+
+def _copy_field(value):
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class IDExport:
+    """Streaming writer of one run's bulk-load rows; use as a context manager.
+
+    ``payload(uid)`` returns a label's check-in payload (the QR text). The
+    file is committed when the ``with`` body completes and discarded when it
+    raises.
+    """
+
+    def __init__(self, path, payload, batch, fmt=None):
+        self.path = path
+        self.fmt = export_format(path, fmt)
+        self.payload = payload
+        self.batch = batch
+        self.rows = 0
+        self._tmp = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                 f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self._tmp, "w", encoding="utf-8", newline="")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._fh.close()
+        if exc_type is None:
+            os.replace(self._tmp, self.path)
+        else:
+            os.remove(self._tmp)
+        return False
+
+    def add_sheet(self, page, sheet):
+        """Write the rows of one placed sheet (``sheet`` is iter_sheets' list of ``(slot, uid)``)."""
+        batch, payload = self.batch, self.payload
+        if self.fmt == "tsv":
+            prefix = f"\t{PLACEHOLDER_DESCRIPTION}\t{PLACEHOLDER_STATUS}\t"
+            tail = f"\t{_copy_field(batch)}\t{page}\t"
+            self._fh.write("".join(
+                f"{_copy_field(uid)}{prefix}{_copy_field(payload(uid))}{tail}{slot}\n" for slot, uid in sheet))
+        else:
+            self._fh.write("".join(
+                json.dumps({"id": uid, "description": PLACEHOLDER_DESCRIPTION, "status": PLACEHOLDER_STATUS,
+                            "label": {"checkin_payload": payload(uid), "batch": batch, "page": page, "slot": slot}},
+                           ensure_ascii=False) + "\n"
+                for slot, uid in sheet))
+        self.rows += len(sheet)
+
+    def summary(self):
+        return {"path": self.path, "format": self.fmt, "rows": self.rows, "batch": self.batch}
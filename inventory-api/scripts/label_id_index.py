@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Collision-free allocation of random asset IDs for generate_labels_L7651_v4.py.
+
+IDs are 8 characters from A-Z0-9 (36^8 ≈ 2.8e12 values). Candidates are cut
+from one bulk read of the OS CSPRNG (os.urandom) per block: bytes are mapped to
+the alphabet with bytes.translate, and bytes >= 252 are dropped so every
+character is equally likely.
+
+Every ID ever issued is kept in a SQLite file, whose primary-key B-tree is a
+sorted on-disk set:
+
+    issued(key INTEGER PRIMARY KEY, batch INTEGER)
+    batches(id INTEGER PRIMARY KEY, name TEXT, created REAL)
+
+``key`` is the ID read as a base-36 number, shifted left 4 bits, plus its
+length (see id_key). Small integer rows keep the tree compact, and each block
+is inserted in key order, so 1M IDs reserve in a couple
+of seconds.
+
+A block of candidates is reserved with INSERT OR IGNORE inside one BEGIN
+IMMEDIATE transaction. Concurrent generator processes sharing the file
+therefore serialise on the write lock, and two of them can never hand out the
+same ID. When fewer rows are inserted than were offered, some candidate was
+already taken. The block is then rolled back and redone without the taken
+IDs, and the shortfall is drawn again. At these densities that path
+practically never runs.
+"""
+
+import os
+import time
+import uuid
+import itertools
+
+from label_sqlite import connect
+
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+ID_LENGTH = 8
+# IDs reserved per transaction (bounds how long other processes wait for the lock)
+BLOCK_SIZE = 250000
+
+# Byte -> alphabet character for the first 252 byte values (7 full cycles of 36)
+_USABLE = 256 - 256 % len(ID_ALPHABET)
+_TABLE = bytes((ID_ALPHABET * 8).encode("ascii")[:_USABLE]) + bytes(256 - _USABLE)
+_REJECT = bytes(range(_USABLE, 256))
+
+
+def random_ids(n, length=ID_LENGTH):
+    """Return ``n`` uniformly random IDs from the OS CSPRNG (duplicates possible)."""
+    need = n * length
+    chars = b""
+    while len(chars) < need:
+        # ~1.6% of bytes are rejected; over-read a little so one pass is enough
+        chars += os.urandom((need - len(chars)) * 17 // 16 + 16).translate(_TABLE, _REJECT)
+    text = chars[:need].decode("ascii")
+    return [text[i:i + length] for i in range(0, need, length)]
+
+
+def id_key(uid):
+    """Index key of an ID of 1-15 ASCII letters/digits (letters are case-insensitive).
+
+    Raises ValueError for anything else.
+    """
+    if not (0 < len(uid) < 16 and uid.isascii() and uid.isalnum()):
+        raise ValueError(f"not an indexable ID: {uid!r}")
+    return int(uid, 36) << 4 | len(uid)
+
+
+class IDIndex:
+    """Persistent set of issued IDs with atomic block reservation."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = connect(path, 60, pragmas=(
+            "synchronous=NORMAL",
+            "cache_size=-65536",  # 64 MB page cache
+        ), schema=(
+            "CREATE TABLE IF NOT EXISTS issued (key INTEGER PRIMARY KEY, batch INTEGER NOT NULL) WITHOUT ROWID",
+            "CREATE TABLE IF NOT EXISTS batches (id INTEGER PRIMARY KEY, name TEXT NOT NULL, created REAL NOT NULL)",
+        ))
+
+    def __contains__(self, uid):
+        try:
+            key = id_key(uid)
+        except ValueError:
+            return False
+        return self._db.execute("SELECT 1 FROM issued WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM issued").fetchone()[0]
+
+    def _insert(self, keys, batch_id):
+        """Insert sorted ``keys``; return how many rows were new."""
+        before = self._db.total_changes
+        self._db.executemany("INSERT OR IGNORE INTO issued (key, batch) VALUES (?, ?)",
+                             zip(keys, itertools.repeat(batch_id)))
+        return self._db.total_changes - before
+
+    def _batch_id(self, name):
+        return self._db.execute("INSERT INTO batches (name, created) VALUES (?, ?)",
+                                (name, time.time())).lastrowid
+
+    def _reserve(self, by_key, batch):
+        """Reserve the IDs of ``by_key`` (key -> ID) atomically; return those that were free."""
+        # Sorted keys walk the B-tree in order instead of touching random pages
+        keys = sorted(by_key)
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            batch_id = self._batch_id(batch)
+            if self._insert(keys, batch_id) < len(keys):
+                # Rare: some were already taken. Redo the block without them, still under the lock.
+                db.execute("ROLLBACK")
+                db.execute("BEGIN IMMEDIATE")
+                batch_id = self._batch_id(batch)
+                taken = set()
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    taken.update(row[0] for row in db.execute(
+                        f"SELECT key FROM issued WHERE key IN ({','.join('?' * len(part))})", part))
+                keys = [key for key in keys if key not in taken]
+                self._insert(keys, batch_id)
+                by_key = {key: by_key[key] for key in keys}
+            db.execute("COMMIT")
+        except Exception:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        return list(by_key.values())
+
+    def allocate(self, n, batch=None, length=ID_LENGTH):
+        """Reserve and return ``n`` new IDs that were never issued before.
+
+        ``batch`` names the rows in ``batches`` (a fresh UUID by default). IDs are reserved in
+        blocks of BLOCK_SIZE, so other processes get the lock between blocks.
+        """
+        batch = batch or uuid.uuid4().hex
+        out = []
+        while len(out) < n:
+            want = min(n - len(out), BLOCK_SIZE)
+            # random_ids() output is always indexable, so skip id_key()'s checks
+            out.extend(self._reserve({int(uid, 36) << 4 | length: uid for uid in random_ids(want, length)}, batch))
+        return out
+
+    def add(self, ids, batch="import"):
+        """Record IDs issued elsewhere (e.g. existing assets); returns how many were new.
+
+        IDs that id_key() rejects (UUIDs, ...) can never collide with allocated
+        ones and are skipped.
+        """
+        by_key = {}
+        for uid in ids:
+            try:
+                by_key[id_key(uid)] = uid
+            except ValueError:
+                continue
+        items = list(by_key.items())
+        added = 0
+        for i in range(0, len(items), BLOCK_SIZE):
+            added += len(self._reserve(dict(items[i:i + BLOCK_SIZE]), batch))
+        return added
+
+    def close(self):
+        self._db.close()
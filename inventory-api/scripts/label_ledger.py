@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Print-history ledger for generate_labels_L7651_v4.py (--ledger).
+
+Every label the generator places is appended to a SQLite file with its ID,
+batch, page, slot, QR payload and time. Rows are never updated or deleted;
+only a batch's status changes when its render finishes:
+
+    batches(id INTEGER PRIMARY KEY, name TEXT UNIQUE, created REAL,
+            status TEXT, labels INTEGER)
+    printed(seq INTEGER PRIMARY KEY, uid TEXT, batch INTEGER, page INTEGER,
+            slot INTEGER, payload TEXT, printed REAL, reprint INTEGER)
+
+Both lookups are B-tree searches, so they stay O(log n) with millions of rows:
+
+- by ID through the ``printed_uid`` index ("has this ID been printed?"), and
+- by batch through ``printed_batch``: a batch's rows are appended in one
+  transaction in page/slot order, so (batch, seq) returns them as printed.
+
+begin_batch() checks the new IDs against the ledger and appends them inside
+one BEGIN IMMEDIATE transaction, before anything is rendered. Concurrent
+generator processes sharing the file serialise on that lock, so two of them
+can never both print the same new ID. Rows of a batch whose render failed do
+not count as printed; a batch that never finished (the process died) still
+does, since its sheets may have come out.
+"""
+
+import time
+import uuid
+import sqlite3
+
+from label_sqlite import connect
+
+RENDERING = "rendering"
+PRINTED = "printed"
+FAILED = "failed"
+
+# IDs per duplicate-check query (SQLite's bound-parameter limit is 999 on old builds)
+_QUERY_CHUNK = 500
+
+_ROW_COLUMNS = "p.uid, b.name, p.page, p.slot, p.payload, p.printed, p.reprint, b.status"
+
+
+class DuplicateIDError(ValueError):
+    """IDs that were already printed; ``duplicates`` holds their earlier ledger rows."""
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        shown = ", ".join(f"{d['id']} (batch {d['batch']}, page {d['page']}, slot {d['slot']})"
+                          for d in duplicates[:10])
+        more = f" and {len(duplicates) - 10} more" if len(duplicates) > 10 else ""
+        super().__init__(f"{len(duplicates)} ID(s) already printed: {shown}{more}")
+
+
+def _row(r):
+    uid, batch, page, slot, payload, printed, reprint, status = r
+    return {"id": uid, "batch": batch, "page": page, "slot": slot, "payload": payload,
+            "printed": printed, "reprint": bool(reprint), "status": status}
+
+
+def batch_name():
+    """Default batch name: local start time plus a random suffix (sorts by time)."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class Ledger:
+    """Append-only record of printed labels, indexed by ID and by batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = connect(path, 60, pragmas=("synchronous=NORMAL",), schema=(
+            """CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, created REAL NOT NULL,
+                status TEXT NOT NULL, labels INTEGER NOT NULL)""",
+            "CREATE INDEX IF NOT EXISTS batches_created ON batches (created)",
+            """CREATE TABLE IF NOT EXISTS printed (
+                seq INTEGER PRIMARY KEY, uid TEXT NOT NULL, batch INTEGER NOT NULL, page INTEGER NOT NULL,
+                slot INTEGER NOT NULL, payload TEXT NOT NULL, printed REAL NOT NULL, reprint INTEGER NOT NULL)""",
+            "CREATE INDEX IF NOT EXISTS printed_uid ON printed (uid)",
+            "CREATE INDEX IF NOT EXISTS printed_batch ON printed (batch)",
+        ))
+
+    def __contains__(self, uid):
+        return bool(self.printed([uid]))
+
+    def printed(self, uids):
+        """Earliest counted ledger row of each ID in ``uids`` that was printed before (uid -> row)."""
+        uids = list(uids)
+        found = {}
+        for i in range(0, len(uids), _QUERY_CHUNK):
+            part = uids[i:i + _QUERY_CHUNK]
+            # No ORDER BY: it could make SQLite walk the whole table in seq order instead of the uid index
+            for r in self._db.execute(
+                    f"SELECT p.seq, {_ROW_COLUMNS} FROM printed p JOIN batches b ON b.id = p.batch "
+                    f"WHERE p.uid IN ({','.join('?' * len(part))}) AND b.status != ?",
+                    part + [FAILED]):
+                if r[1] not in found or r[0] < found[r[1]][0]:
+                    found[r[1]] = (r[0], r[1:])
+        return {uid: _row(r) for uid, (_seq, r) in found.items()}
+
+    def begin_batch(self, rows, name=None, reprint=False):
+        """Append one render's labels; returns ``(batch id, batch name, labels)``.
+
+        ``rows`` yields ``(page, slot, uid, payload)`` in print order. Unless
+        ``reprint``, raises DuplicateIDError (and records nothing) when any ID
+        was printed before. Call finish_batch() once the render is done.
+        """
+        rows = list(rows)
+        name = name or batch_name()
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if not reprint:
+                seen = self.printed(uid for _page, _slot, uid, _payload in rows)
+                if seen:
+                    raise DuplicateIDError([seen[uid] for _page, _slot, uid, _payload in rows if uid in seen])
+            try:
+                batch_id = db.execute("INSERT INTO batches (name, created, status, labels) VALUES (?, ?, ?, ?)",
+                                      (name, now, RENDERING, len(rows))).lastrowid
+            except sqlite3.IntegrityError:
+                raise ValueError(f"ledger batch {name!r} already exists") from None
+            db.executemany(
+                "INSERT INTO printed (uid, batch, page, slot, payload, printed, reprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((uid, batch_id, page, slot, payload, now, int(reprint)) for page, slot, uid, payload in rows))
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        return batch_id, name, len(rows)
+
+    def finish_batch(self, batch_id, ok=True):
+        """Mark a batch printed, or failed (its IDs then count as never printed)."""
+        self._db.execute("UPDATE batches SET status = ? WHERE id = ?", (PRINTED if ok else FAILED, batch_id))
+
+    def history(self, uid):
+        """Every ledger row of ``uid``, oldest first (failed batches included)."""
+        return [_row(r) for r in self._db.execute(
+            f"SELECT {_ROW_COLUMNS} FROM printed p JOIN batches b ON b.id = p.batch WHERE p.uid = ? ORDER BY p.seq",
+            (uid,))]
+
+    def batch_rows(self, name):
+        """The rows of batch ``name`` in print order (page, then slot)."""
+        found = self._db.execute("SELECT id FROM batches WHERE name = ?", (name,)).fetchone()
+        if found is None:
+            raise KeyError(f"no ledger batch {name!r}")
+        for r in self._db.execute(
+                f"SELECT {_ROW_COLUMNS} FROM printed p JOIN batches b ON b.id = p.batch "
+                f"WHERE p.batch = ? ORDER BY p.seq", (found[0],)):
+            yield _row(r)
+
+    def batches(self, since=None, until=None):
+        """Batches created in ``[since, until)`` (epoch seconds), oldest first."""
+        return [{"name": name, "created": created, "status": status, "labels": labels}
+                for name, created, status, labels in self._db.execute(
+                    "SELECT name, created, status, labels FROM batches WHERE created >= ? AND created < ? "
+                    "ORDER BY created", (since or 0.0, until or float("inf")))]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Print-size logo preparation for generate_labels_L7651_v4.py.
+
+The logo file is far larger than it is ever printed (a label draws it at most
+LOGO_MAX_W x LOGO_MAX_H mm), and the PDF used to embed it at full resolution
+with a soft mask for its alpha channel. prepare_logo() instead:
+
+- flattens transparency onto the white label stock (no soft mask left, and
+  no dark fringes from resampling unpremultiplied colour),
+- resamples the result to the pixel size it is drawn at for a print DPI
+  (never upscaling), and
+- stores it as a plain RGB (or greyscale) PNG.
+
+With a cache directory the prepared file is kept on disk, keyed by the SHA-256
+of the source bytes and the target pixel size, so later runs only decode the
+small version:
+
+    <root>/<sha256>-<w>x<h>-v<LOGO_FORMAT>.png
+
+Entries are a few KB and one exists per logo and size, so nothing is evicted.
+"""
+
+import os
+import uuid
+import hashlib
+
+from PIL import Image, ImageChops
+
+# Bump when preparation changes, so stale prepared logos are never reused
+LOGO_FORMAT = 1
+
+# Label stock colour the alpha channel is flattened onto
+BACKGROUND = (255, 255, 255)
+
+
+def source_size(path):
+    """Pixel size of the image at ``path`` (reads the header only)."""
+    with Image.open(path) as im:
+        return im.size
+
+
+def print_size_px(size_mm, dpi):
+    """Pixel size of a ``(width, height)`` mm box printed at ``dpi``."""
+    return tuple(max(1, round(v / 25.4 * dpi)) for v in size_mm)
+
+
+def flatten(im, background=BACKGROUND):
+    """Composite any transparency onto ``background``; returns an RGB or L image."""
+    if im.mode in ("P", "PA", "LA", "La", "RGBa") or "transparency" in im.info:
+        im = im.convert("RGBA")
+    if im.mode == "RGBA":
+        alpha = im.getchannel("A")
+        if alpha.getextrema() == (255, 255):
+            return im.convert("RGB")
+        flat = Image.new("RGB", im.size, background)
+        flat.paste(im, mask=alpha)
+        return flat
+    if im.mode not in ("RGB", "L"):
+        im = im.convert("RGB")
+    return im
+
+
+def _grey_if_possible(im):
+    """Drop to one channel when every pixel is grey (a third of the image data)."""
+    if im.mode != "RGB":
+        return im
+    r, g, b = im.split()
+    if ImageChops.difference(r, g).getbbox() is None and ImageChops.difference(g, b).getbbox() is None:
+        return r
+    return im
+
+
+def prepare_image(path, size_px):
+    """Flattened copy of the image at ``path`` resampled to fit ``size_px`` (never enlarged)."""
+    with Image.open(path) as src:
+        im = flatten(src)
+    if size_px[0] < im.width and size_px[1] < im.height:
+        im = im.resize(size_px, Image.LANCZOS, reducing_gap=3.0)
+    return _grey_if_possible(im)
+
+
+def prepare_logo(path, size_px, cache_dir=None, digest=None):
+    """Return the print-size version of the logo at ``path``.
+
+    Without ``cache_dir`` the prepared PIL image is returned. With it, the path
+    of the cached PNG is returned, preparing and storing it first on a miss.
+    ``digest`` is the source file's SHA-256 hex digest when the caller has it.
+    """
+    if not cache_dir:
+        return prepare_image(path, size_px)
+    if digest is None:
+        with open(path, "rb") as fh:
+            digest = hashlib.sha256(fh.read()).hexdigest()
+    w, h = size_px
+    target = os.path.join(cache_dir, f"{digest}-{w}x{h}-v{LOGO_FORMAT}.png")
+    if os.path.exists(target):
+        return target
+    os.makedirs(cache_dir, exist_ok=True)
+    im = prepare_image(path, size_px)
+    tmp = os.path.join(cache_dir, f".tmp-{os.getpid()}-{uuid.uuid4().hex}.png")
+    try:
+        im.save(tmp, "PNG", optimize=True)
+        # Concurrent runs write identical bytes, so the last replace wins harmlessly
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return target
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of finished label PDFs for generate_labels_L7651_v4.py.
+
+A job's key is a SHA-256 over everything that shapes its output (see job_key()
+in the generator), and results are stored by key:
+
+    <root>/<key>.pdf    the PDF
+    <root>/<key>.json   stats of the run that produced it (pages, labels)
+
+A hit bumps the entry's mtime, so evict() — which drops entries older than
+``max_age`` and then the least recently used ones until the total is under
+``max_bytes`` — runs in LRU order. It is called after every put().
+
+Identical jobs running at the same time render once: the first one takes
+``<key>.lock`` (created with O_EXCL, which works on every platform) and the
+others wait for it to go away, then read the result. The holder touches the
+lock every LOCK_REFRESH_SECONDS for as long as it renders, so a lock not
+touched for LOCK_STALE_SECONDS was left behind by a crashed process and is
+broken, however long a live render takes.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextlib
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+LOCK_STALE_SECONDS = 600
+LOCK_REFRESH_SECONDS = 60
+LOCK_POLL_SECONDS = 0.05
+
+
+class OutputCache:
+    """Directory of rendered PDFs keyed by job hash, bounded by size and age."""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 lock_stale=LOCK_STALE_SECONDS, lock_refresh=LOCK_REFRESH_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock_stale = lock_stale
+        self.lock_refresh = lock_refresh
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, f"{key}{ext}")
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key, ".pdf")) and os.path.exists(self._path(key, ".json"))
+
+    def get(self, key):
+        """Return ``(open binary file, stats dict)`` for a cached result, or None.
+
+        The file is opened before returning so a concurrent eviction cannot
+        remove it from under the caller.
+        """
+        try:
+            fh = open(self._path(key, ".pdf"), "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            with open(self._path(key, ".json")) as meta:
+                stats = json.load(meta)
+        except (OSError, ValueError):
+            fh.close()
+            return None
+        now = time.time()
+        for ext in (".pdf", ".json"):
+            with contextlib.suppress(OSError):
+                os.utime(self._path(key, ext), (now, now))
+        return fh, stats
+
+    def temp_path(self):
+        """A fresh path inside the cache directory to render into (same filesystem as put's target)."""
+        return os.path.join(self.root, f".tmp-{os.getpid()}-{uuid.uuid4().hex}.pdf")
+
+    def put(self, key, pdf_path, stats):
+        """Move the rendered ``pdf_path`` into the cache under ``key``, then evict."""
+        meta_tmp = self._path(f".tmp-{uuid.uuid4().hex}", ".json")
+        with open(meta_tmp, "w") as fh:
+            json.dump(stats, fh)
+        # The PDF lands first; get() only trusts entries whose stats exist too
+        os.replace(pdf_path, self._path(key, ".pdf"))
+        os.replace(meta_tmp, self._path(key, ".json"))
+        self.evict()
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """Hold the render lock for ``key``; blocks while another process holds it."""
+        path = self._path(key, ".lock")
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > self.lock_stale:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(LOCK_POLL_SECONDS)
+        done = threading.Event()
+
+        def refresh():
+            while not done.wait(self.lock_refresh):
+                with contextlib.suppress(OSError):
+                    os.utime(path)
+
+        keeper = threading.Thread(target=refresh, name=f"output-cache-lock-{key[:8]}", daemon=True)
+        try:
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            keeper.start()
+            yield
+        finally:
+            done.set()
+            if keeper.is_alive():
+                keeper.join()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond ``max_bytes``."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.root):
+            if name.startswith(".tmp-"):
+                # Leftovers of crashed renders
+                path = os.path.join(self.root, name)
+                with contextlib.suppress(OSError):
+                    if now - os.path.getmtime(path) > self.lock_stale:
+                        os.remove(path)
+                continue
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name[:-4]))
+        entries.sort(reverse=True)
+        total = 0
+        for mtime, size, key in entries:
+            total += size
+            if now - mtime > self.max_age or total > self.max_bytes:
+                for ext in (".json", ".pdf"):
+                    # OSError: already gone, or still open by a reader on Windows
+                    with contextlib.suppress(OSError):
+                        os.remove(self._path(key, ext))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of encoded QR module matrices for generate_labels_L7651_v4.py.
+
+Reprints re-encode the same check-in payloads over and over; encoding is pure
+Python and costs far more than a lookup. Matrices are stored bit-packed in a
+SQLite file keyed by (payload, requested error-correction level). The symbol
+version, the level actually used ("auto") and the mask are all chosen by the
+encoder from those two, so they are not part of the key:
+
+    qr(key TEXT PRIMARY KEY, n INTEGER, bits BLOB, used REAL)
+
+SQLite does the cross-process locking, so several generator processes can share
+one cache file. Hits only bump ``used`` in memory; touches and new entries are
+written in one transaction on flush(), which also evicts the least recently
+used rows beyond ``max_entries``.
+"""
+
+import time
+
+from label_sqlite import connect
+
+# Bump when the encoder output could change, so stale matrices are never reused
+CACHE_FORMAT = 3
+
+DEFAULT_MAX_ENTRIES = 200000
+
+
+def pack_modules(modules):
+    """Pack a square boolean matrix row-major into bytes (MSB first)."""
+    n = len(modules)
+    bits = "".join("1" if dark else "0" for row in modules for dark in row)
+    return n, int(bits, 2).to_bytes((n * n + 7) // 8, "big") if bits else b""
+
+
+def unpack_modules(n, blob):
+    bits = bin(int.from_bytes(blob, "big"))[2:].zfill(len(blob) * 8)[-(n * n):] if n else ""
+    return [[b == "1" for b in bits[r * n:(r + 1) * n]] for r in range(n)]
+
+
+class QRMatrixCache:
+    """Persistent, size-bounded LRU cache of QR module matrices."""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}   # key -> (n, blob) not yet written
+        self._touched = {}   # key -> last use time for hits
+        self._db = connect(path, 30, schema=(
+            "CREATE TABLE IF NOT EXISTS qr (key TEXT PRIMARY KEY, n INTEGER NOT NULL, "
+            "bits BLOB NOT NULL, used REAL NOT NULL) WITHOUT ROWID",
+            "CREATE INDEX IF NOT EXISTS qr_used ON qr(used)",
+        ))
+
+    @staticmethod
+    def key(payload, level):
+        return f"{CACHE_FORMAT}|{level}|{payload}"
+
+    def get(self, payload, level):
+        """Return the cached matrix or None (counted as a hit or a miss)."""
+        k = self.key(payload, level)
+        row = self._pending.get(k)
+        if row is None:
+            row = self._db.execute("SELECT n, bits FROM qr WHERE key = ?", (k,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched[k] = time.time()
+        return unpack_modules(row[0], row[1])
+
+    def put(self, payload, level, modules):
+        self._pending[self.key(payload, level)] = pack_modules(modules)
+
+    def flush(self):
+        """Write new entries and LRU touches, then evict beyond ``max_entries``."""
+        if not (self._pending or self._touched):
+            return
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO qr (key, n, bits, used) VALUES (?, ?, ?, ?)",
+                [(k, n, blob, now) for k, (n, blob) in self._pending.items()],
+            )
+            db.executemany("UPDATE qr SET used = ? WHERE key = ?",
+                           [(t, k) for k, t in self._touched.items()])
+            excess = db.execute("SELECT COUNT(*) FROM qr").fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute("DELETE FROM qr WHERE key IN (SELECT key FROM qr ORDER BY used LIMIT ?)", (excess,))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        self._pending.clear()
+        self._touched.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.flush()
+        self._db.close()
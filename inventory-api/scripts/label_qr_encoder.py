@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+QR payload encoding optimizer for generate_labels_L7651_v4.py.
+
+reportlab's encoder picks one mode for the whole payload, so a single
+lower-case letter pushes a check-in URL into byte mode (8 bits per
+character), and it always uses the requested error-correction level even when
+a stronger one fits in the same symbol. encode_qr() instead:
+
+- splits the payload into numeric / alphanumeric / byte segments with the
+  fewest total bits (dynamic programming over the characters, including each
+  segment's header), per version range since header sizes depend on it,
+- picks the smallest version that holds those segments at ``level``, and
+- with level "auto", picks the smallest version at L and then raises the
+  error-correction level as far as that version still allows (L < M < Q < H).
+  That costs no extra modules but makes the PDF larger: the extra
+  error-correction codewords differ on every label where pad codewords were
+  identical, so the page streams compress worse.
+
+Alphanumeric mode only has upper-case letters (0-9 A-Z space $ % * + - . / :),
+so an upper-cased check-in URL encodes at 5.5 bits per character instead of 8.
+
+reportlab's encoder module is pure Python with no reportlab imports, but its
+package (reportlab.graphics.barcode) registers every barcode widget when it is
+imported, which pulls in reportlab.graphics.shapes and platypus. That is most of
+the generator's start-up time, so _load_qrencoder() loads the module file on its
+own when it can.
+"""
+
+import os
+import sys
+import importlib.util
+
+import reportlab.graphics
+
+
+def _load_qrencoder():
+    name = "reportlab.graphics.barcode.qrencoder"
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    path = os.path.join(os.path.dirname(reportlab.graphics.__file__), "barcode", "qrencoder.py")
+    if not os.path.exists(path):  # e.g. a zipped install
+        from reportlab.graphics.barcode import qrencoder
+        return qrencoder
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # Registered under its real name, so the QrCodeWidget route imported later shares it
+    sys.modules[name] = module
+    return module
+
+
+qrencoder = _load_qrencoder()
+
+# Weakest to strongest
+QR_LEVELS = ("L", "M", "Q", "H")
+# Accepted ``level`` values: a fixed level, or the strongest one free at the smallest size
+LEVEL_CHOICES = QR_LEVELS + ("auto",)
+
+# Segment classes in the order the optimizer considers them
+_MODES = (qrencoder.QRNumber, qrencoder.QRAlphaNum, qrencoder.QR8bitByte)
+_NUMERIC = frozenset(qrencoder.QRNumber.chars)
+_ALNUM = frozenset(qrencoder.QRAlphaNum.chars)
+# (first, last) version of each range sharing the same segment header sizes
+_VERSION_RANGES = ((1, 9), (10, 26), (27, 40))
+
+
+def _char_costs(ch):
+    """Cost of ``ch`` in each mode, in sixths of a bit (None: mode cannot encode it)."""
+    return (
+        20 if ch in _NUMERIC else None,   # 10 bits per 3 digits
+        33 if ch in _ALNUM else None,     # 11 bits per 2 characters
+        48 * len(ch.encode("utf-8")),
+    )
+
+
+def _length_bits(mode, version):
+    return mode.lengthbits[0 if version < 10 else 1 if version < 27 else 2]
+
+
+def segment_payload(payload, version=1):
+    """Split ``payload`` into the QR segments with the fewest bits at ``version``.
+
+    Only the version range matters (1-9, 10-26, 27-40), since it sets the size
+    of each segment's character count field.
+    """
+    if not payload:
+        return [qrencoder.QR8bitByte(payload)]
+    headers = [(4 + _length_bits(mode, version)) * 6 for mode in _MODES]
+    inf = float("inf")
+    cost = [0, 0, 0]
+    came_from = []  # per character: the mode each mode's best path had before it
+    for i, ch in enumerate(payload):
+        char_costs = _char_costs(ch)
+        new_cost = [inf, inf, inf]
+        prev_modes = [None, None, None]
+        for m, cc in enumerate(char_costs):
+            if cc is None:
+                continue
+            if i == 0:
+                new_cost[m] = headers[m] + cc
+                continue
+            for p in range(3):
+                if cost[p] == inf:
+                    continue
+                if p == m:
+                    total = cost[p] + cc
+                else:
+                    # A segment ends on a whole bit
+                    total = -(-cost[p] // 6) * 6 + headers[m] + cc
+                if total < new_cost[m]:
+                    new_cost[m] = total
+                    prev_modes[m] = p
+        cost = new_cost
+        came_from.append(prev_modes)
+    # Walk back from the cheapest final mode
+    m = min(range(3), key=lambda k: cost[k])
+    modes = []
+    for prev_modes in reversed(came_from):
+        modes.append(m)
+        m = prev_modes[m]
+    modes.reverse()
+    segments = []
+    start = 0
+    for i in range(1, len(payload) + 1):
+        if i == len(payload) or modes[i] != modes[start]:
+            segments.append(_MODES[modes[start]](payload[start:i]))
+            start = i
+    return segments
+
+
+def _data_bits(segments, version):
+    return sum(4 + seg.getLengthBits(version) + seg.bitlength for seg in segments)
+
+
+def _capacity_bits(version, level):
+    code = getattr(qrencoder.QRErrorCorrectLevel, level)
+    return 8 * sum(block.dataCount for block in qrencoder.QRRSBlock.getRSBlocks(version, code))
+
+
+def choose_encoding(payload, level="L"):
+    """Return ``(segments, version, level)`` for the smallest symbol holding ``payload``.
+
+    ``level`` is one of LEVEL_CHOICES; with "auto" the returned level is the
+    strongest that fits the version needed at L. Raises ValueError when the
+    payload does not fit in a version 40 symbol.
+    """
+    if level not in LEVEL_CHOICES:
+        raise ValueError(f"unknown QR error-correction level {level!r} (expected one of {', '.join(LEVEL_CHOICES)})")
+    boost = level == "auto"
+    if boost:
+        level = QR_LEVELS[0]
+    for first, last in _VERSION_RANGES:
+        segments = segment_payload(payload, first)
+        for version in range(first, last + 1):
+            bits = _data_bits(segments, version)
+            if bits <= _capacity_bits(version, level):
+                for stronger in QR_LEVELS[1:] if boost else ():
+                    if bits > _capacity_bits(version, stronger):
+                        break
+                    level = stronger
+                return segments, version, level
+    raise ValueError(f"payload of {len(payload)} characters does not fit in a QR code")
+
+
+def encode_qr(payload, level="L"):
+    """Encode ``payload``; returns ``(modules, version, level)`` (see choose_encoding)."""
+    segments, version, level = choose_encoding(payload, level)
+    qr = qrencoder.QRCode(version, getattr(qrencoder.QRErrorCorrectLevel, level))
+    for seg in segments:
+        qr.addData(seg)
+    qr.make()
+    return qr.modules, version, level
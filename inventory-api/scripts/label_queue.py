@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Durable local job queue for generate_labels_L7651_v4.py (--queue).
+
+A queue is a directory. Each job is one JSON file, and it moves between state
+directories by rename, which is atomic within one filesystem:
+
+    <root>/queued/<id>.json    submitted, waiting; ids sort in submit order
+    <root>/running/<id>.json   claimed by exactly one worker
+    <root>/done/<id>.json      {"job": ..., "result": ...}
+    <root>/failed/<id>.json    {"job": ..., "error": ...}
+    <root>/status/<id>.json    latest state and progress, for pollers
+
+Anything that can write a file can submit, and the API does it from Node. It
+writes ``queued/.<id>.tmp``, then renames it to ``queued/<id>.json``, and does
+the same for the status snapshot. A worker claims the oldest job by renaming it
+into ``running/``. When two workers race for the same file only one rename
+succeeds, and the other moves on to the next job. Status snapshots are
+replaced the same way, so a reader never sees a partial file.
+
+A worker records its host and pid in the status. recover() puts jobs whose
+worker process is gone (same host, pid no longer alive) back in ``queued/``.
+Jobs therefore survive crashes and restarts, and a job may run twice after a
+crash.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+_STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+# A claimed job without worker details yet is only recovered after this long
+CLAIM_GRACE_SECONDS = 60
+
+
+def new_job_id():
+    """Millisecond timestamp plus a random suffix: unique, and sorts in submit order."""
+    return f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:12]}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobQueue:
+    """File-backed FIFO of label jobs with per-job status snapshots."""
+
+    def __init__(self, root):
+        self.root = root
+        for state in _STATES + ("status",):
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+        self.worker = {"host": socket.gethostname(), "pid": os.getpid()}
+
+    def _path(self, state, job_id):
+        return os.path.join(self.root, state, f"{job_id}.json")
+
+    def _write(self, path, obj):
+        """Write JSON to ``path`` through a temp file and rename (readers see old or new, never half)."""
+        tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(obj, fh)
+        os.replace(tmp, path)
+
+    def _read(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def _set_status(self, job_id, **fields):
+        status = self.status(job_id) or {"id": job_id}
+        status.update(fields, updated=time.time())
+        self._write(self._path("status", job_id), status)
+        return status
+
+    def submit(self, job, job_id=None):
+        """Queue ``job`` (a run_job() dict); returns its id."""
+        job_id = job_id or new_job_id()
+        self._set_status(job_id, state=QUEUED, submitted=time.time())
+        self._write(self._path(QUEUED, job_id), job)
+        return job_id
+
+    def status(self, job_id):
+        """Latest status snapshot of ``job_id`` (None if unknown)."""
+        return self._read(self._path("status", job_id))
+
+    def claim(self):
+        """Take the oldest queued job; returns ``(id, job)`` or None when the queue is empty."""
+        for name in sorted(os.listdir(os.path.join(self.root, QUEUED))):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            job_id = name[:-5]
+            running = self._path(RUNNING, job_id)
+            try:
+                os.rename(self._path(QUEUED, job_id), running)
+            except FileNotFoundError:
+                continue  # another worker got it first
+            job = self._read(running)
+            self._set_status(job_id, state=RUNNING, started=time.time(), worker=self.worker)
+            return job_id, job
+        return None
+
+    def progress(self, job_id, progress):
+        """Publish a running job's progress dict (sheets done, labels/s, ETA, ...)."""
+        self._set_status(job_id, progress=progress)
+
+    def finish(self, job_id, result):
+        job = self._read(self._path(RUNNING, job_id))
+        self._write(self._path(DONE, job_id), {"job": job, "result": result})
+        os.remove(self._path(RUNNING, job_id))
+        self._set_status(job_id, state=DONE, finished=time.time(), result=result)
+
+    def fail(self, job_id, error):
+        job = self._read(self._path(RUNNING, job_id))
+        self._write(self._path(FAILED, job_id), {"job": job, "error": error})
+        os.remove(self._path(RUNNING, job_id))
+        self._set_status(job_id, state=FAILED, finished=time.time(), error=error)
+
+    def recover(self):
+        """Requeue running jobs whose worker process on this host has died; returns their ids."""
+        requeued = []
+        for name in sorted(os.listdir(os.path.join(self.root, RUNNING))):
+            if not name.endswith(".json") or name.startswith("."):
+                continue
+            job_id = name[:-5]
+            status = self.status(job_id) or {}
+            worker = status.get("worker")
+            if worker:
+                if worker.get("host") != self.worker["host"] or _pid_alive(worker["pid"]):
+                    continue
+            elif time.time() - status.get("updated", 0) < CLAIM_GRACE_SECONDS:
+                continue  # claimed a moment ago; the claimer has not written its status yet
+            try:
+                os.rename(self._path(RUNNING, job_id), self._path(QUEUED, job_id))
+            except FileNotFoundError:
+                continue
+            self._set_status(job_id, state=QUEUED, requeued=time.time(), worker=None, progress=None)
+            requeued.append(job_id)
+        return requeued
+
+    def counts(self):
+        """Number of jobs in each state."""
+        return {state: sum(1 for n in os.listdir(os.path.join(self.root, state))
+                           if n.endswith(".json") and not n.startswith("."))
+                for state in _STATES}
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Raster output for generate_labels_L7651_v4.py: PNG sheet previews and 1-bit
+label streams (ZPL, PBM) for thermal printers, without going through a PDF.
+
+Labels are composed into 8-bit greyscale NumPy bitmaps (0 = black) at any DPI
+from the same geometry the PDF uses: the generator passes its compiled sheet
+layout (compile_sheet_layout), so a preview lands every element where the
+vector output does. Per job the static part of a label (logo, email, phone)
+is rasterized once into a tile, and ID glyphs once per character. Per label
+only the tile is copied, the QR modules are blitted with one index gather,
+and the ID glyphs are stamped at the PDF's advance widths (no kerning,
+like drawString).
+
+Text is drawn with the Type 1 outlines reportlab ships for the standard fonts
+(found through pdfmetrics), so glyph shapes and widths match the PDF.
+
+ZPL labels embed the bitmap as a ^GF graphic in Zebra's compressed Z64 form
+(zlib + base64 + CRC-16/CCITT).
+"""
+
+import io
+import zlib
+import base64
+import binascii
+import functools
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.pdfbase import pdfmetrics
+
+# Blank border (mm) around a static tile, so parts drawn past the label edge
+# (as the PDF form allows) are not clipped
+TILE_PAD_MM = 2.0
+
+# Coverage at or above this prints black in 1-bit output
+THRESHOLD = 128
+
+
+@functools.lru_cache(maxsize=16)
+def _font(font_name, size_px):
+    path = pdfmetrics.getFont(font_name).face.findT1File()
+    return ImageFont.truetype(path, size_px)
+
+
+def _blit_ink(dst, ink, top, left):
+    """Darken ``dst`` with coverage ``ink`` (0-255) at (top, left), clipped to ``dst``."""
+    h, w = ink.shape
+    t0, l0 = max(top, 0), max(left, 0)
+    t1, l1 = min(top + h, dst.shape[0]), min(left + w, dst.shape[1])
+    if t0 >= t1 or l0 >= l1:
+        return
+    region = dst[t0:t1, l0:l1]
+    np.minimum(region, 255 - ink[t0 - top:t1 - top, l0 - left:l1 - left], out=region)
+
+
+class LabelRaster:
+    """Rasterizes one job's labels at ``dpi``.
+
+    ``layout`` is the generator's compile_sheet_layout() result and ``spec``
+    the module constants it was built from: ``label_w``, ``label_h``,
+    ``page_w``, ``page_h``, ``qr_size`` (mm), ``qr_border`` (modules) and
+    ``hscale`` (horizontal text scale). ``logo`` is a PIL image already
+    flattened onto white (or None).
+    """
+
+    def __init__(self, layout, spec, logo, email, phone, font_name, dpi):
+        self.layout = layout
+        self.spec = spec
+        self.font_name = font_name
+        self.dpi = dpi
+        self.scale = dpi / 25.4             # px per mm
+        self._glyphs = {}
+        self._qr_index = {}
+        self.tile, self.tile_pad = self._static_tile(logo, email, phone)
+
+    # ---- building blocks -------------------------------------------------
+
+    def _glyph(self, ch, size_pt):
+        """Coverage bitmap of ``ch`` condensed by hscale, its offsets and advance (px)."""
+        key = (ch, size_pt)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            hscale = self.spec["hscale"]
+            font = _font(self.font_name, size_pt * self.dpi / 72.0)
+            left, top, right, bottom = font.getbbox(ch, anchor="ls")
+            ink = None
+            if right > left and bottom > top:
+                im = Image.new("L", (right - left, bottom - top), 0)
+                ImageDraw.Draw(im).text((-left, -top), ch, font=font, fill=255, anchor="ls")
+                width = max(1, round((right - left) * hscale))
+                ink = np.asarray(im.resize((width, im.height), Image.LANCZOS))
+            advance = pdfmetrics.stringWidth(ch, self.font_name, size_pt) * hscale * self.dpi / 72.0
+            glyph = self._glyphs[key] = (ink, left * hscale, top, advance)
+        return glyph
+
+    def draw_text(self, dst, x_px, baseline_px, text, size_pt):
+        """Draw ``text`` centred on ``x_px`` with its baseline on row ``baseline_px``."""
+        width_pt = pdfmetrics.stringWidth(text, self.font_name, size_pt)
+        pen = x_px - width_pt * self.spec["hscale"] * self.dpi / 72.0 / 2.0
+        for ch in text:
+            ink, dx, dy, advance = self._glyph(ch, size_pt)
+            if ink is not None:
+                _blit_ink(dst, ink, round(baseline_px + dy), round(pen + dx))
+            pen += advance
+
+    def draw_qr(self, dst, modules, top, left):
+        """Blit a QR matrix (quiet zone included) as a ``qr_size`` mm square at (top, left)."""
+        n = len(modules)
+        size = round(self.spec["qr_size"] * self.scale)
+        border = self.spec["qr_border"]
+        idx = self._qr_index.get((n, size))
+        if idx is None:
+            # Module under each pixel centre, -1 inside the quiet zone
+            idx = np.floor((np.arange(size) + 0.5) * (n + 2 * border) / size).astype(np.intp) - border
+            idx[(idx < 0) | (idx >= n)] = -1
+            self._qr_index[(n, size)] = idx
+        mat = np.zeros((n + 1, n + 1), dtype=bool)  # last row/column stay light: index -1
+        mat[:n, :n] = np.asarray(modules, dtype=bool)
+        dark = mat[np.ix_(idx, idx)]
+        h = min(size, dst.shape[0] - top)
+        w = min(size, dst.shape[1] - left)
+        if h > 0 and w > 0 and top >= 0 and left >= 0:
+            dst[top:top + h, left:left + w][dark[:h, :w]] = 0
+
+    def _static_tile(self, logo, email, phone):
+        """The label parts shared by every label, rendered once with TILE_PAD_MM around."""
+        spec, s = self.spec, self.scale
+        geo = self.layout["label"]
+        pad = round(TILE_PAD_MM * s)
+        tile = np.full((round(spec["label_h"] * s) + 2 * pad, round(spec["label_w"] * s) + 2 * pad), 255, np.uint8)
+        if logo is not None and geo["logo"] is not None:
+            x, y_bottom, w, h = geo["logo"]
+            size = (max(1, round(w * s)), max(1, round(h * s)))
+            pixels = np.asarray(logo.convert("L").resize(size, Image.LANCZOS))
+            _blit_ink(tile, 255 - pixels, pad + round(-(y_bottom + h) * s), pad + round(x * s))
+        for text, (y, pt) in ((email, geo["email"]), (phone, geo["phone"])):
+            self.draw_text(tile, pad + geo["text_x"] * s, pad - y * s, text, pt)
+        return tile, pad
+
+    # ---- labels and sheets -----------------------------------------------
+
+    def label(self, uid, modules):
+        """One label as a bitmap of exactly ``label_w`` x ``label_h`` mm."""
+        s, pad = self.scale, self.tile_pad
+        geo = self.layout["label"]
+        canvas = self.tile.copy()
+        qr_x, qr_y = geo["qr"]
+        self.draw_qr(canvas, modules, pad + round(-(qr_y + self.spec["qr_size"]) * s), pad + round(qr_x * s))
+        id_y, id_pt = geo["id"]
+        self.draw_text(canvas, pad + geo["text_x"] * s, pad - id_y * s, uid, id_pt)
+        return canvas[pad:canvas.shape[0] - pad, pad:canvas.shape[1] - pad]
+
+    def sheet(self, labels, show_grid=False):
+        """A full page: ``labels`` is a list of ``(slot, uid, modules)``."""
+        spec, s, pad = self.spec, self.scale, self.tile_pad
+        page_h = spec["page_h"]
+        page = np.full((round(page_h * s), round(spec["page_w"] * s)), 255, np.uint8)
+        slots = self.layout["slots"]
+        ink_tile = 255 - self.tile
+        id_pt = self.layout["id_pt"]
+        for slot, uid, modules in labels:
+            x_label, y_top, qr_x, qr_y, text_x, id_y = slots[slot - 1]
+            _blit_ink(page, ink_tile, round((page_h - y_top) * s) - pad, round(x_label * s) - pad)
+            self.draw_qr(page, modules, round((page_h - qr_y - spec["qr_size"]) * s), round(qr_x * s))
+            self.draw_text(page, text_x * s, (page_h - id_y) * s, uid, id_pt)
+        if show_grid:
+            grey = 211  # colors.lightgrey
+            w, h = round(spec["label_w"] * s), round(spec["label_h"] * s)
+            for x_label, y_top, *_ in slots:
+                top, left = round((page_h - y_top) * s), round(x_label * s)
+                edges = page[top:top + h + 1, left:left + w + 1]
+                for view in (edges[0], edges[-1], edges[:, 0], edges[:, -1]):
+                    np.minimum(view, grey, out=view)
+        return page
+
+
+# ---- encoders ------------------------------------------------------------
+
+def to_png(bitmap, dpi=None):
+    """Encode a greyscale bitmap as PNG bytes (with its print resolution when given)."""
+    buf = io.BytesIO()
+    Image.fromarray(bitmap, "L").save(buf, "PNG", **({"dpi": (dpi, dpi)} if dpi else {}))
+    return buf.getvalue()
+
+
+def pack_1bit(bitmap, threshold=THRESHOLD):
+    """Rows of 1-bit pixels, MSB first, 1 = black (the ZPL ^GF and PBM convention)."""
+    return np.packbits(bitmap < (256 - threshold), axis=1)
+
+
+def to_pbm(bitmap, threshold=THRESHOLD):
+    """One raw (P4) PBM image; several may be concatenated into one stream."""
+    packed = pack_1bit(bitmap, threshold)
+    return f"P4\n{bitmap.shape[1]} {bitmap.shape[0]}\n".encode("ascii") + packed.tobytes()
+
+
+def to_zpl(bitmap, threshold=THRESHOLD):
+    """One ZPL label (^XA ... ^XZ) printing ``bitmap`` at the printer's own resolution."""
+    packed = pack_1bit(bitmap, threshold)
+    height, row_bytes = packed.shape
+    total = height * row_bytes
+    data = base64.b64encode(zlib.compress(packed.tobytes(), 9))
+    crc = binascii.crc_hqx(data, 0)
+    return (f"^XA^PW{bitmap.shape[1]}^LL{height}^FO0,0"
+            f"^GFA,{total},{total},{row_bytes},:Z64:{data.decode('ascii')}:{crc:04X}^FS^XZ\n").encode("ascii")
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite connection setup shared by the generator's stores (label_qr_cache.py,
+label_id_index.py, label_ledger.py).
+
+Several generator processes open the same files, often at the same moment on
+a fresh file: a pool of --serve workers after a deploy, or two API requests on
+an empty cache. The busy timeout covers ordinary reads and writes. It does not
+cover switching a database to WAL, which needs an exclusive lock and returns
+"database is locked" at once while another process holds the file. connect()
+therefore:
+
+- sets ``busy_timeout`` on the connection,
+- switches to WAL only when the file is not in WAL yet (the mode is stored in
+  the file, so later opens skip the exclusive lock), retrying that switch while
+  another process holds the file, and
+- runs the schema statements in one BEGIN IMMEDIATE transaction, so processes
+  racing on a fresh file create it one after the other.
+"""
+
+import time
+import sqlite3
+
+RETRY_SECONDS = 0.05
+
+
+def _locked(e):
+    return "locked" in str(e) or "busy" in str(e)
+
+
+def connect(path, timeout, schema=(), pragmas=()):
+    """Open ``path`` in autocommit mode with WAL and ``schema`` (CREATE ... IF NOT EXISTS statements).
+
+    ``timeout`` (seconds) bounds every wait for another process's lock.
+    ``pragmas`` are per-connection settings (``"synchronous=NORMAL"``, ...).
+    """
+    db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    try:
+        db.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        deadline = time.monotonic() + timeout
+        mode = db.execute("PRAGMA journal_mode").fetchone()[0].lower()
+        while mode not in ("wal", "memory"):
+            try:
+                mode = db.execute("PRAGMA journal_mode=WAL").fetchone()[0].lower()
+            except sqlite3.OperationalError as e:
+                if not _locked(e):
+                    raise
+            if mode != "wal":
+                if time.monotonic() > deadline:
+                    raise sqlite3.OperationalError(f"database is locked: could not switch {path} to WAL")
+                time.sleep(RETRY_SECONDS)
+        for pragma in pragmas:
+            db.execute(f"PRAGMA {pragma}")
+        if schema:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in schema:
+                    db.execute(statement)
+                db.execute("COMMIT")
+            except BaseException:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                raise
+    except BaseException:
+        db.close()
+        raise
+    return db
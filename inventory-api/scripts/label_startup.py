@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Start-up report for generate_labels_L7651_v4.py (--startup-report).
+
+With spawn-per-request every job pays the interpreter start and the module
+imports before the first label is drawn. run() starts the same command line
+again in a child interpreter under ``-X importtime``. The child's output goes
+through unchanged, and CPython's per-module import lines are summarized on
+stderr:
+
+- wall time of the whole run, and of a bare interpreter start for comparison,
+- import time by top-level package (the standard library as one group), and
+- the slowest imports the program itself triggered, with everything they
+  pulled in. Imports the generator defers to first use show up here with the
+  job that needed them.
+"""
+
+import sys
+import time
+import subprocess
+
+# Slowest top-level imports listed, and packages before the rest are summed up
+TOP_IMPORTS = 12
+TOP_PACKAGES = 8
+
+_PREFIX = "import time:"
+
+
+def parse_importtime(lines):
+    """Split stderr lines into ``-X importtime`` records and everything else.
+
+    Records are ``(depth, module, self_us, cumulative_us)``; depth 0 is an
+    import made by the program, deeper ones were made by those modules.
+    """
+    records, other = [], []
+    for line in lines:
+        if not line.startswith(_PREFIX):
+            other.append(line)
+            continue
+        try:
+            self_us, cumulative_us, name = line[len(_PREFIX):].split("|", 2)
+            record = (len(name) - len(name.lstrip()) - 1) // 2, name.strip(), int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # the column header
+        records.append(record)
+    return records, other
+
+
+def _group(module):
+    top = module.split(".", 1)[0]
+    return "(stdlib)" if top in sys.stdlib_module_names else top
+
+
+def summarize(records, wall_seconds, bare_seconds=None, top=TOP_IMPORTS):
+    """The report for parse_importtime() ``records`` as a list of lines."""
+    total_us = sum(r[2] for r in records)
+    lines = [f"Start-up report: {wall_seconds * 1000:.0f} ms wall"
+             + (f" (bare interpreter {bare_seconds * 1000:.0f} ms)" if bare_seconds is not None else "")
+             + f", {total_us / 1000:.0f} ms importing {len(records)} modules"]
+    groups = {}
+    for _depth, module, self_us, _cumulative in records:
+        ms, count = groups.get(_group(module), (0, 0))
+        groups[_group(module)] = (ms + self_us, count + 1)
+    ranked = sorted(groups.items(), key=lambda g: -g[1][0])
+    if len(ranked) > TOP_PACKAGES + 1:
+        rest = ranked[TOP_PACKAGES:]
+        ranked = ranked[:TOP_PACKAGES] + [("(others)", (sum(g[1][0] for g in rest), sum(g[1][1] for g in rest)))]
+    width = max([len(g) for g, _ in ranked] + [len("package")])
+    lines.append(f"  {'package':<{width}} {'ms':>8} {'modules':>8}")
+    for group, (us, count) in ranked:
+        lines.append(f"  {group:<{width}} {us / 1000:>8.1f} {count:>8}")
+    roots = sorted((r for r in records if r[0] == 0), key=lambda r: -r[3])[:top]
+    if roots:
+        width = max(len(r[1]) for r in roots)
+        lines.append("  slowest imports (with what they pulled in):")
+        for _depth, module, _self, cumulative_us in roots:
+            lines.append(f"    {module:<{width}} {cumulative_us / 1000:>8.1f} ms")
+    return lines
+
+
+def _bare_start():
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=False)
+    return time.perf_counter() - t0
+
+
+def run(script, argv, err=None):
+    """Run ``script`` with ``argv`` under ``-X importtime``; print the report and return its exit code."""
+    err = err or sys.stderr
+    bare = _bare_start()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-X", "importtime", script] + list(argv),
+                            stderr=subprocess.PIPE, text=True, errors="replace")
+    _out, stderr = proc.communicate()
+    wall = time.perf_counter() - t0
+    records, other = parse_importtime(stderr.splitlines())
+    for line in other:
+        print(line, file=err)
+    for line in summarize(records, wall, bare):
+        print(line, file=err)
+    return proc.returncode
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Decode-back verification for generate_labels_L7651_v4.py (--verify).
+
+Every page of a finished PDF is rasterized at print resolution with PyMuPDF
+and each placed label is checked the way a technician's phone would see it:
+
+- the QR square is cropped from the page bitmap and decoded with zxing-cpp;
+  the text must equal the label's check-in payload, and
+- the words PyMuPDF extracts on the label's ID line must equal the ID.
+
+Pages are spread over a process pool. Each worker opens the document once (by
+path, or from the bytes of an in-memory PDF handed over when the worker
+starts) and then only receives page numbers and the expected labels, so the
+check scales with the number of cores like --workers rendering does.
+
+Both PyMuPDF (``pip install pymupdf``) and zxing-cpp (``pip install
+zxing-cpp``) are only needed when verifying.
+"""
+
+import math
+import time
+import itertools
+
+import numpy as np
+
+# Pages per pool task
+CHUNK_PAGES = 4
+
+# What a failed label looks like in the report
+UNREADABLE = "qr unreadable"
+PAYLOAD_MISMATCH = "qr payload mismatch"
+ID_MISMATCH = "id text mismatch"
+PAGE_MISSING = "page missing"
+
+# State of a pool worker (or of the parent when verifying inline)
+_worker = {}
+
+
+def _open_document(source):
+    try:
+        import pymupdf
+    except ImportError:  # PyMuPDF before 1.24 only has the old name
+        import fitz as pymupdf
+    if isinstance(source, (bytes, bytearray)):
+        return pymupdf, pymupdf.open(stream=bytes(source), filetype="pdf")
+    return pymupdf, pymupdf.open(source)
+
+
+def _qr_decoder():
+    try:
+        import zxingcpp
+    except ImportError:
+        raise RuntimeError("QR verification needs zxing-cpp (pip install zxing-cpp)") from None
+    fmt = zxingcpp.BarcodeFormat.QRCode
+
+    def decode(bitmap):
+        # Labels are printed upright, dark on light
+        return [r.text for r in zxingcpp.read_barcodes(bitmap, formats=fmt, try_rotate=False, try_invert=False)]
+    return decode
+
+
+def _init_worker(source, boxes, dpi):
+    pymupdf, doc = _open_document(source)
+    _worker.update(pymupdf=pymupdf, doc=doc, boxes=boxes, dpi=dpi, decode=_qr_decoder())
+
+
+def _crop(bitmap, rect, scale):
+    x0, y0, x1, y1 = rect
+    return bitmap[max(0, math.floor(y0 * scale)):math.ceil(y1 * scale), max(0, math.floor(x0 * scale)):math.ceil(x1 * scale)]
+
+
+def _words_in(words, rect):
+    """Words (in reading order) whose centre lies inside ``rect``."""
+    x0, y0, x1, y1 = rect
+    return [w[4] for w in words if x0 <= (w[0] + w[2]) / 2 <= x1 and y0 <= (w[1] + w[3]) / 2 <= y1]
+
+
+def _verify_chunk(pages):
+    """Pool task: check ``pages`` (a list of ``(page, labels)``); returns (labels checked, failures)."""
+    pymupdf, doc, boxes = _worker["pymupdf"], _worker["doc"], _worker["boxes"]
+    dpi, decode = _worker["dpi"], _worker["decode"]
+    scale = dpi / 72.0
+    checked = 0
+    failures = []
+    for page_no, labels in pages:
+        checked += len(labels)
+        if page_no > doc.page_count:
+            failures.extend({"page": page_no, "slot": slot, "id": uid, "problem": PAGE_MISSING}
+                            for slot, uid, _payload in labels)
+            continue
+        page = doc[page_no - 1]
+        pix = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY, alpha=False)
+        bitmap = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+        words = page.get_text("words")
+        for slot, uid, payload in labels:
+            qr_rect, id_rect = boxes[slot - 1]
+            texts = decode(np.ascontiguousarray(_crop(bitmap, qr_rect, scale)))
+            found_id = " ".join(_words_in(words, id_rect))
+            if not texts:
+                failures.append({"page": page_no, "slot": slot, "id": uid, "problem": UNREADABLE})
+            elif texts[0] != payload:
+                failures.append({"page": page_no, "slot": slot, "id": uid, "problem": PAYLOAD_MISMATCH,
+                                 "found": texts[0]})
+            if found_id != uid:
+                failures.append({"page": page_no, "slot": slot, "id": uid, "problem": ID_MISMATCH,
+                                 "found": found_id})
+    return checked, failures
+
+
+def verify_document(source, pages, boxes, dpi, workers=1, chunk_pages=CHUNK_PAGES):
+    """Check every placed label of the PDF ``source`` (a path, or the PDF bytes).
+
+    ``pages`` yields ``(page number, [(slot, uid, payload), ...])`` with 1-based
+    page numbers and slots; ``boxes`` gives, per slot - 1, the QR square and the
+    ID line as ``(x0, y0, x1, y1)`` rectangles in PDF points from the page's
+    top-left corner. Returns a dict with ``pages``, ``labels``, ``failures``
+    (one dict per problem: ``page``, ``slot``, ``id``, ``problem`` and the text
+    ``found`` on mismatches, ordered by page and slot), ``dpi``, ``workers`` and
+    ``seconds``.
+    """
+    t0 = time.perf_counter()
+    pages = iter(pages)
+    chunks = iter(lambda: list(itertools.islice(pages, chunk_pages)), [])
+    checked = 0
+    page_count = 0
+    failures = []
+
+    def collect(result, chunk):
+        nonlocal checked, page_count
+        checked += result[0]
+        page_count += len(chunk)
+        failures.extend(result[1])
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(source, boxes, dpi)) as pool:
+            # Bounded like --workers rendering, so memory does not grow with the batch
+            pending = []
+            for chunk in chunks:
+                pending.append((pool.submit(_verify_chunk, chunk), chunk))
+                if len(pending) >= 2 * workers:
+                    future, done = pending.pop(0)
+                    collect(future.result(), done)
+            for future, done in pending:
+                collect(future.result(), done)
+    else:
+        _init_worker(source, boxes, dpi)
+        try:
+            for chunk in chunks:
+                collect(_verify_chunk(chunk), chunk)
+        finally:
+            _worker.pop("doc").close()
+            _worker.clear()
+    failures.sort(key=lambda f: (f["page"], f["slot"]))
+    return {"pages": page_count, "labels": checked, "failures": failures, "dpi": dpi, "workers": workers,
+            "seconds": time.perf_counter() - t0}
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+--ids-file parsing (iter_ids) of generate_labels_L7651_v4.py.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+
+
+def ids(text):
+    return list(labels.iter_ids(io.StringIO(text)))
+
+
+class IterIdsTest(unittest.TestCase):
+    def test_plain_text(self):
+        self.assertEqual(ids("A1\nB2\n\nA1\nC3\n"), ["A1", "B2", "C3"])
+
+    def test_one_column_csv_header_is_skipped(self):
+        for header in ("id", "ID", "uid", "asset_id", "Asset_ID"):
+            with self.subTest(header=header):
+                self.assertEqual(ids(f"{header}\nA1\nB2\n"), ["A1", "B2"])
+
+    def test_one_column_csv_header_after_bom_and_blank_lines(self):
+        self.assertEqual(ids("\ufeff\n\r\nid\r\nA1\r\nB2\r\n"), ["A1", "B2"])
+
+    def test_header_name_is_only_skipped_on_the_first_line(self):
+        self.assertEqual(ids("A1\nid\nB2\n"), ["A1", "id", "B2"])
+
+    def test_csv_id_column(self):
+        self.assertEqual(ids("name,id\nDrill,A1\nSaw,B2\n"), ["A1", "B2"])
+        self.assertEqual(ids("name,asset_id\nDrill,A1\n"), ["A1"])
+
+    def test_csv_without_header_uses_first_column(self):
+        self.assertEqual(ids("A1,Drill\nB2,Saw\n"), ["A1", "B2"])
+
+    def test_json(self):
+        self.assertEqual(ids('["A1", {"id": "B2"}, 3]'), ["A1", "B2", "3"])
+        self.assertEqual(ids('{"id": "A1"}\n{"id": "B2"}\n'), ["A1", "B2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
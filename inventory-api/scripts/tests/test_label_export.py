@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+The bulk-load export (label_export.py) and --export through generate_pdf().
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+from label_export import IDExport, export_format  # noqa: E402
+
+BASE = "https://example.com/check-in"
+
+
+def payload(uid):
+    return f"{BASE}/{uid}"
+
+
+class IDExportTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name), encoding="utf-8") as fh:
+            return fh.read()
+
+    def test_format_from_extension(self):
+        self.assertEqual(export_format("a.tsv"), "tsv")
+        self.assertEqual(export_format("a.NDJSON"), "jsonl")
+        self.assertEqual(export_format("a.jsonl", "tsv"), "tsv")
+        with self.assertRaises(ValueError):
+            export_format("a.csv", "csv")
+
+    def test_tsv_is_copy_text(self):
+        path = os.path.join(self.dir, "out.tsv")
+        with IDExport(path, payload, None) as export:
+            export.add_sheet(1, [(64, "A1"), (65, "B\t2")])
+            export.add_sheet(2, [(1, "C3")])
+        self.assertEqual(self.read("out.tsv").splitlines(), [
+            f"A1\tQR reserved asset\tIn Service\t{BASE}/A1\t\\N\t1\t64",
+            f"B\\t2\tQR reserved asset\tIn Service\t{BASE}/B\\t2\t\\N\t1\t65",
+            f"C3\tQR reserved asset\tIn Service\t{BASE}/C3\t\\N\t2\t1",
+        ])
+        self.assertEqual(export.summary(), {"path": path, "format": "tsv", "rows": 3, "batch": None})
+
+    def test_jsonl_rows(self):
+        with IDExport(os.path.join(self.dir, "out.jsonl"), payload, "b1") as export:
+            export.add_sheet(1, [(1, "A1")])
+        self.assertEqual([json.loads(line) for line in self.read("out.jsonl").splitlines()], [
+            {"id": "A1", "description": "QR reserved asset", "status": "In Service",
+             "label": {"checkin_payload": f"{BASE}/A1", "batch": "b1", "page": 1, "slot": 1}},
+        ])
+
+    def test_failed_run_leaves_no_file(self):
+        path = os.path.join(self.dir, "out.tsv")
+        with open(path, "w") as fh:
+            fh.write("previous\n")
+        with self.assertRaises(RuntimeError):
+            with IDExport(path, payload, None) as export:
+                export.add_sheet(1, [(1, "A1")])
+                raise RuntimeError("render failed")
+        self.assertEqual(self.read("out.tsv"), "previous\n")
+        self.assertEqual(os.listdir(self.dir), ["out.tsv"])
+
+
+class GenerateExportTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_rows_follow_the_placed_labels(self):
+        ids = [f"ID{i:03d}" for i in range(labels.SLOTS_PER_SHEET + 2)]
+        path = os.path.join(self.dir, "labels.jsonl")
+        with labels.open_export(path, BASE + "/", batch="b1") as export:
+            labels.generate_pdf(io.BytesIO(), None, BASE, labels.DEFAULT_EMAIL, labels.DEFAULT_PHONE, ids=ids,
+                                start_index=3, export=export)
+        with open(path, encoding="utf-8") as fh:
+            rows = [json.loads(line) for line in fh]
+        self.assertEqual([r["id"] for r in rows], ids)
+        self.assertEqual([(r["label"]["page"], r["label"]["slot"]) for r in rows[:1] + rows[-1:]],
+                         [(1, 3), (2, 4)])
+        self.assertEqual(rows[0]["label"]["checkin_payload"], labels.qr_payload(BASE, ids[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+The issued-ID index (label_id_index.py).
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import label_id_index  # noqa: E402
+from label_id_index import ID_ALPHABET, ID_LENGTH, IDIndex, id_key, random_ids  # noqa: E402
+
+
+class RandomIdsTest(unittest.TestCase):
+    def test_shape(self):
+        ids = random_ids(500)
+        self.assertEqual(len(ids), 500)
+        self.assertEqual({len(uid) for uid in ids}, {ID_LENGTH})
+        self.assertLessEqual(set("".join(ids)), set(ID_ALPHABET))
+
+    def test_id_key(self):
+        self.assertEqual(id_key("a1b2"), id_key("A1B2"))
+        # Same digits, different length: different keys
+        self.assertNotEqual(id_key("0A"), id_key("A"))
+        for bad in ("", "A" * 16, "A-1", "Ä1"):
+            with self.subTest(uid=bad), self.assertRaises(ValueError):
+                id_key(bad)
+
+
+class IDIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = IDIndex(os.path.join(self.dir, "ids.sqlite"))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.dir)
+
+    def test_allocated_ids_are_new_and_remembered(self):
+        first = self.index.allocate(300)
+        second = self.index.allocate(300)
+        self.assertEqual(len(set(first + second)), 600)
+        self.assertEqual(len(self.index), 600)
+        self.assertIn(first[0], self.index)
+        self.assertIn(first[0].lower(), self.index)
+        self.assertNotIn("not-an-id", self.index)
+
+    def test_taken_ids_are_drawn_again(self):
+        self.index.add(["AAAAAAAA", "BBBBBBBB"])
+        draws = iter([["AAAAAAAA", "CCCCCCCC", "BBBBBBBB"], ["DDDDDDDD", "AAAAAAAA"], ["EEEEEEEE"]])
+        with mock.patch.object(label_id_index, "random_ids", lambda n, length: next(draws)[:n]):
+            self.assertEqual(sorted(self.index.allocate(3)), ["CCCCCCCC", "DDDDDDDD", "EEEEEEEE"])
+        self.assertEqual(len(self.index), 5)
+
+    def test_add_skips_known_and_unindexable_ids(self):
+        self.assertEqual(self.index.add(["A1", "B2", "550e8400-e29b-41d4-a716-446655440000"]), 2)
+        self.assertEqual(self.index.add(["a1", "C3"]), 1)
+        self.assertEqual(len(self.index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+The print-history ledger (label_ledger.py) and ledger_batch() around a render.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+from label_ledger import FAILED, PRINTED, RENDERING, DuplicateIDError, Ledger  # noqa: E402
+
+BASE = "https://example.com/check-in"
+
+
+def rows(ids, page=1):
+    return [(page, slot, uid, f"{BASE}/{uid}") for slot, uid in enumerate(ids, 1)]
+
+
+class LedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ledger = Ledger(os.path.join(self.dir, "ledger.sqlite"))
+
+    def tearDown(self):
+        self.ledger.close()
+        shutil.rmtree(self.dir)
+
+    def test_duplicate_is_rejected_and_nothing_recorded(self):
+        batch_id, _name, _n = self.ledger.begin_batch(rows(["A1", "B2"]), name="first")
+        self.ledger.finish_batch(batch_id)
+        with self.assertRaises(DuplicateIDError) as cm:
+            self.ledger.begin_batch(rows(["C3", "B2"]), name="second")
+        self.assertEqual([(d["id"], d["batch"], d["slot"]) for d in cm.exception.duplicates], [("B2", "first", 2)])
+        self.assertIn("B2 (batch first, page 1, slot 2)", str(cm.exception))
+        self.assertNotIn("C3", self.ledger)
+        self.assertEqual([b["name"] for b in self.ledger.batches()], ["first"])
+
+    def test_reprint_is_recorded_as_such(self):
+        batch_id, _name, _n = self.ledger.begin_batch(rows(["A1"]), name="first")
+        self.ledger.finish_batch(batch_id)
+        batch_id, _name, _n = self.ledger.begin_batch(rows(["A1"]), name="again", reprint=True)
+        self.ledger.finish_batch(batch_id)
+        history = self.ledger.history("A1")
+        self.assertEqual([(r["batch"], r["reprint"], r["status"]) for r in history],
+                         [("first", False, PRINTED), ("again", True, PRINTED)])
+        # The first print is the one that counts
+        self.assertEqual(self.ledger.printed(["A1"])["A1"]["batch"], "first")
+
+    def test_failed_batch_does_not_count(self):
+        batch_id, _name, _n = self.ledger.begin_batch(rows(["A1"]), name="broken")
+        self.ledger.finish_batch(batch_id, ok=False)
+        self.assertNotIn("A1", self.ledger)
+        self.ledger.begin_batch(rows(["A1"]), name="retry")
+        self.assertEqual(self.ledger.printed(["A1"])["A1"]["status"], RENDERING)
+
+    def test_batch_names_are_unique(self):
+        self.ledger.begin_batch(rows(["A1"]), name="same")
+        with self.assertRaisesRegex(ValueError, "already exists"):
+            self.ledger.begin_batch(rows(["B2"]), name="same")
+        self.assertNotIn("B2", self.ledger)
+
+    def test_batch_rows_in_print_order(self):
+        self.ledger.begin_batch(rows(["C3", "A1"]) + rows(["B2"], page=2), name="b")
+        self.assertEqual([(r["page"], r["slot"], r["id"]) for r in self.ledger.batch_rows("b")],
+                         [(1, 1, "C3"), (1, 2, "A1"), (2, 1, "B2")])
+        with self.assertRaises(KeyError):
+            list(self.ledger.batch_rows("missing"))
+
+    def test_lookup_beyond_one_query_chunk(self):
+        ids = [f"ID{i:05d}" for i in range(1200)]
+        self.ledger.begin_batch(rows(ids), name="big")
+        self.assertEqual(len(self.ledger.printed(ids + ["NEW"])), len(ids))
+
+
+class LedgerBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ledger = Ledger(os.path.join(self.dir, "ledger.sqlite"))
+
+    def tearDown(self):
+        self.ledger.close()
+        shutil.rmtree(self.dir)
+
+    def test_slots_follow_start_index_and_status_follows_the_body(self):
+        with labels.ledger_batch(self.ledger, ["A1", "B2"], BASE + "/", start_index=labels.SLOTS_PER_SHEET,
+                                 batch="run") as recorded:
+            self.assertEqual(recorded, {"batch": "run", "labels": 2})
+        self.assertEqual([(r["page"], r["slot"], r["payload"], r["status"]) for r in self.ledger.batch_rows("run")],
+                         [(1, labels.SLOTS_PER_SHEET, f"{BASE}/A1", PRINTED), (2, 1, f"{BASE}/B2", PRINTED)])
+
+    def test_render_error_marks_the_batch_failed(self):
+        with self.assertRaises(RuntimeError):
+            with labels.ledger_batch(self.ledger, ["A1"], BASE, batch="run"):
+                raise RuntimeError("render failed")
+        self.assertEqual(self.ledger.history("A1")[0]["status"], FAILED)
+        self.assertNotIn("A1", self.ledger)
+
+    def test_duplicate_is_rejected_before_the_body(self):
+        with labels.ledger_batch(self.ledger, ["A1"], BASE):
+            pass
+        ran = []
+        with self.assertRaises(DuplicateIDError):
+            with labels.ledger_batch(self.ledger, ["A1"], BASE):
+                ran.append(True)
+        self.assertEqual(ran, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+The finished-PDF cache (label_output_cache.py) and generate_pdf() through it.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+from label_output_cache import OutputCache  # noqa: E402
+
+KEY = "0" * 64
+SETTINGS = (None, labels.DEFAULT_CHECKIN_BASE, labels.DEFAULT_EMAIL, labels.DEFAULT_PHONE)
+
+
+class LockTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def hold(self, cache, seconds, events, name):
+        with cache.lock(KEY):
+            events.append(f"{name} in")
+            time.sleep(seconds)
+            events.append(f"{name} out")
+
+    def test_waiter_blocks_until_release(self):
+        cache = OutputCache(self.dir)
+        events = []
+        holder = threading.Thread(target=self.hold, args=(cache, 0.3, events, "a"))
+        holder.start()
+        time.sleep(0.05)
+        self.hold(cache, 0, events, "b")
+        holder.join()
+        self.assertEqual(events, ["a in", "a out", "b in", "b out"])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, f"{KEY}.lock")))
+
+    def test_live_lock_outlasting_stale_age_is_not_broken(self):
+        # The holder keeps the lock fresh, so a render longer than lock_stale keeps it
+        cache = OutputCache(self.dir, lock_stale=0.2, lock_refresh=0.05)
+        events = []
+        holder = threading.Thread(target=self.hold, args=(cache, 0.8, events, "a"))
+        holder.start()
+        time.sleep(0.05)
+        self.hold(cache, 0, events, "b")
+        holder.join()
+        self.assertEqual(events, ["a in", "a out", "b in", "b out"])
+
+    def test_abandoned_lock_is_broken(self):
+        cache = OutputCache(self.dir, lock_stale=0.2, lock_refresh=0.05)
+        path = os.path.join(self.dir, f"{KEY}.lock")
+        with open(path, "w") as fh:
+            fh.write("999999")
+        old = time.time() - 1
+        os.utime(path, (old, old))
+        events = []
+        self.hold(cache, 0, events, "b")
+        self.assertEqual(events, ["b in", "b out"])
+
+
+class EvictTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def put(self, cache, key, size, age):
+        tmp = cache.temp_path()
+        with open(tmp, "wb") as fh:
+            fh.write(b"x" * size)
+        cache.put(key, tmp, {"pages": 1})
+        t = time.time() - age
+        for ext in (".pdf", ".json"):
+            os.utime(os.path.join(self.dir, key + ext), (t, t))
+
+    def test_least_recently_used_go_first(self):
+        cache = OutputCache(self.dir, max_bytes=10_000)
+        self.put(cache, "a" * 64, 4000, 30)
+        self.put(cache, "b" * 64, 4000, 20)
+        fh, _stats = cache.get("a" * 64)  # a hit makes "a" the most recent
+        fh.close()
+        self.put(cache, "c" * 64, 4000, 0)
+        self.assertIn("a" * 64, cache)
+        self.assertNotIn("b" * 64, cache)
+        self.assertIn("c" * 64, cache)
+
+    def test_expired_entries_go(self):
+        cache = OutputCache(self.dir, max_age=60)
+        self.put(cache, "a" * 64, 10, 120)
+        cache.evict()
+        self.assertNotIn("a" * 64, cache)
+
+
+class GenerateCachedTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = OutputCache(os.path.join(self.dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def generate(self, ids, name):
+        out = os.path.join(self.dir, name)
+        stats = labels.generate_pdf(out, *SETTINGS, ids=ids, out_csv=out + ".csv", output_cache=self.cache)
+        with open(out, "rb") as fh:
+            return stats, fh.read()
+
+    def test_streamed_ids_are_keyed_and_reused(self):
+        ids = ["A1", "B2", "C3"]
+        first, pdf = self.generate(iter(ids), "first.pdf")
+        self.assertEqual(first["output_cache"], "miss")
+        self.assertEqual(first["labels"], 3)
+        self.assertEqual(first["cache_key"], labels.job_key(ids, *SETTINGS))
+        second, again = self.generate((uid for uid in ids), "second.pdf")
+        self.assertEqual(second["output_cache"], "hit")
+        self.assertEqual(second["cache_key"], first["cache_key"])
+        self.assertEqual(again, pdf)
+        with open(os.path.join(self.dir, "second.pdf.csv")) as fh:
+            self.assertEqual(fh.read().split(), ["index,id", "1,A1", "2,B2", "3,C3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+The QR payload optimizer (label_qr_encoder.py) and the QR drawing helpers.
+
+The decoding round trip needs zxing-cpp and numpy (the --verify extras) and is
+skipped without them.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+import label_qr_encoder as enc  # noqa: E402
+
+try:
+    import numpy
+    import zxingcpp
+except ImportError:
+    zxingcpp = None
+
+PAYLOADS = (
+    "https://example.com/check-in/A4F8E75G",
+    "HTTPS://EXAMPLE.COM/CHECK-IN/A4F8E75G",
+    "http://localhost:3000/check-in/12345678901234",
+    "0123456789",
+    "ÄÖÜ asset ✓ 42",
+    "x",
+)
+
+
+def decode(modules, scale=4, border=4):
+    """Decode a module matrix with zxing-cpp."""
+    n = len(modules)
+    img = numpy.full(((n + 2 * border) * scale,) * 2, 255, dtype=numpy.uint8)
+    for r, row in enumerate(modules):
+        for c, dark in enumerate(row):
+            if dark:
+                y, x = (r + border) * scale, (c + border) * scale
+                img[y:y + scale, x:x + scale] = 0
+    found = zxingcpp.read_barcodes(img, formats=zxingcpp.BarcodeFormat.QRCode)
+    return [r.text for r in found]
+
+
+class SegmentTest(unittest.TestCase):
+    def test_segments_cover_the_payload(self):
+        for payload in PAYLOADS:
+            with self.subTest(payload=payload):
+                segments = enc.segment_payload(payload)
+                # Byte segments hold UTF-8 bytes
+                text = "".join(s.data.decode("utf-8") if isinstance(s.data, bytes) else s.data for s in segments)
+                self.assertEqual(text, payload)
+
+    def test_modes_follow_the_characters(self):
+        segments = enc.segment_payload("HTTPS://EXAMPLE.COM/A/123456789012")
+        self.assertEqual([type(s) for s in segments], [enc.qrencoder.QRAlphaNum, enc.qrencoder.QRNumber])
+        self.assertEqual([type(s) for s in enc.segment_payload("https://example.com/")], [enc.qrencoder.QR8bitByte])
+
+    def test_never_worse_than_a_single_mode(self):
+        rng = random.Random(7)
+        alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:abc"
+        for _ in range(200):
+            payload = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 60)))
+            for version in (1, 10, 27):
+                best = enc._data_bits(enc.segment_payload(payload, version), version)
+                single = enc._data_bits([enc.qrencoder.QR8bitByte(payload)], version)
+                self.assertLessEqual(best, single, payload)
+
+
+class ChooseEncodingTest(unittest.TestCase):
+    def test_upper_case_url_is_no_larger(self):
+        lower = enc.choose_encoding(PAYLOADS[0], "M")[1]
+        upper = enc.choose_encoding(PAYLOADS[1], "M")[1]
+        self.assertLessEqual(upper, lower)
+
+    def test_auto_level_is_free(self):
+        for payload in PAYLOADS:
+            with self.subTest(payload=payload):
+                _segments, version, level = enc.choose_encoding(payload, "auto")
+                self.assertEqual(version, enc.choose_encoding(payload, "L")[1])
+                self.assertIn(level, enc.QR_LEVELS)
+
+    def test_bad_input(self):
+        with self.assertRaises(ValueError):
+            enc.choose_encoding("x", "Z")
+        with self.assertRaisesRegex(ValueError, "does not fit"):
+            enc.choose_encoding("é" * 3000, "H")
+
+    def test_matrix_size_matches_version(self):
+        modules, version, _level = enc.encode_qr(PAYLOADS[0], "M")
+        self.assertEqual(len(modules), 17 + 4 * version)
+
+
+@unittest.skipIf(zxingcpp is None, "needs zxing-cpp and numpy")
+class DecodeTest(unittest.TestCase):
+    def test_round_trip(self):
+        for payload in PAYLOADS:
+            for level in enc.LEVEL_CHOICES:
+                with self.subTest(payload=payload, level=level):
+                    self.assertEqual(decode(enc.encode_qr(payload, level)[0]), [payload])
+
+
+class QRRectsTest(unittest.TestCase):
+    def covered(self, rects):
+        cells = [(row, col) for x, y, w, h in rects for row in range(y, y + h) for col in range(x, x + w)]
+        self.assertEqual(len(cells), len(set(cells)), "rectangles overlap")
+        return set(cells)
+
+    def test_union_is_the_dark_modules(self):
+        for payload in PAYLOADS:
+            with self.subTest(payload=payload):
+                modules = labels.qr_matrix(payload)
+                rects = labels.qr_rects(modules)
+                dark = {(r, c) for r, row in enumerate(modules) for c, d in enumerate(row) if d}
+                self.assertEqual(self.covered(rects), dark)
+                self.assertEqual(rects, sorted(rects))
+                self.assertLess(len(rects), len(dark))
+
+    def test_equal_runs_merge_downwards(self):
+        modules = [[True, True, False],
+                   [True, True, False],
+                   [False, True, True]]
+        self.assertEqual(labels.qr_rects(modules), [(0, 0, 2, 2), (1, 2, 2, 1)])
+        self.assertEqual(labels.qr_rects([[False] * 3] * 3), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
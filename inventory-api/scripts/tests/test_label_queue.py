@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+The durable job queue (label_queue.py) and its worker (serve_queue).
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+from label_ledger import FAILED  # noqa: E402
+import label_queue  # noqa: E402
+from label_queue import DONE, QUEUED, RUNNING, JobQueue  # noqa: E402
+
+
+def failed_report(ids):
+    return {"labels": len(ids), "dpi": 300, "seconds": 0.0, "workers": 1,
+            "failures": [{"page": 1, "slot": 2, "row": 1, "col": 2, "id": ids[1], "problem": "QR mismatch"}]}
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = JobQueue(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_jobs_are_claimed_once_in_submit_order(self):
+        # Explicit ids: generated ids in the same millisecond differ only by a random suffix
+        first = self.queue.submit({"n": 1}, job_id="0001-a")
+        second = self.queue.submit({"n": 2}, job_id="0002-b")
+        self.assertEqual(self.queue.claim(), (first, {"n": 1}))
+        # A second worker (another JobQueue on the same directory) gets the next job
+        self.assertEqual(JobQueue(self.dir).claim(), (second, {"n": 2}))
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(self.queue.status(first)["state"], RUNNING)
+        self.assertEqual(self.queue.counts(), {"queued": 0, "running": 2, "done": 0, "failed": 0})
+
+    def test_finish_and_fail(self):
+        ok, bad = self.queue.submit({"n": 1}, job_id="0001-ok"), self.queue.submit({"n": 2}, job_id="0002-bad")
+        self.queue.claim()
+        self.queue.progress(ok, {"sheets": 1})
+        self.assertEqual(self.queue.status(ok)["progress"], {"sheets": 1})
+        self.queue.finish(ok, {"labels": 3})
+        self.queue.claim()
+        self.queue.fail(bad, "ValueError: boom")
+        self.assertEqual(self.queue.status(ok)["state"], DONE)
+        self.assertEqual(self.queue.status(ok)["result"], {"labels": 3})
+        self.assertEqual(self.queue.status(bad)["error"], "ValueError: boom")
+        with open(os.path.join(self.dir, "done", f"{ok}.json")) as fh:
+            self.assertEqual(json.load(fh), {"job": {"n": 1}, "result": {"labels": 3}})
+        self.assertEqual(self.queue.counts(), {"queued": 0, "running": 0, "done": 1, "failed": 1})
+        self.assertIsNone(self.queue.status("unknown"))
+
+    def test_recover_requeues_jobs_of_dead_workers_only(self):
+        dead, alive, remote = (self.queue.submit({"n": n}, job_id=f"000{n}") for n in range(3))
+        for job_id in (dead, alive, remote):
+            self.queue.claim()
+        host = self.queue.worker["host"]
+        self.queue._set_status(dead, worker={"host": host, "pid": dead_pid()})
+        self.queue._set_status(remote, worker={"host": host + "-other", "pid": dead_pid()})
+        self.assertEqual(self.queue.recover(), [dead])
+        self.assertEqual(self.queue.status(dead)["state"], QUEUED)
+        self.assertEqual(self.queue.claim()[0], dead)
+
+    def test_recover_waits_for_a_fresh_claim(self):
+        job_id = self.queue.submit({"n": 1})
+        os.rename(os.path.join(self.dir, "queued", f"{job_id}.json"), os.path.join(self.dir, "running", f"{job_id}.json"))
+        self.assertEqual(self.queue.recover(), [])
+        with mock.patch.object(label_queue, "CLAIM_GRACE_SECONDS", -1):
+            self.assertEqual(self.queue.recover(), [job_id])
+
+
+class ServeQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.dir, "queue"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def job(self, **extra):
+        return dict({"ids": ["A1", "B2", "C3"], "logo": None, "out": os.path.join(self.dir, "sheet.pdf"),
+                     "ledger": os.path.join(self.dir, "ledger.sqlite")}, **extra)
+
+    def test_job_is_done(self):
+        job_id = self.queue.submit(self.job())
+        self.assertEqual(labels.serve_queue(self.queue.root, drain=True), 1)
+        status = self.queue.status(job_id)
+        self.assertEqual(status["state"], "done")
+        self.assertEqual(status["result"]["labels"], 3)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "sheet.pdf")))
+
+    def test_verify_failure_fails_the_job(self):
+        export = os.path.join(self.dir, "sheet.tsv")
+        job_id = self.queue.submit(self.job(verify=True, export=export))
+        with mock.patch.object(labels, "verify_pdf", side_effect=lambda _pdf, ids, *a, **k: failed_report(ids)):
+            labels.serve_queue(self.queue.root, drain=True)
+        status = self.queue.status(job_id)
+        self.assertEqual(status["state"], "failed")
+        self.assertIn("VerificationError", status["error"])
+        self.assertIn("page 1 row 1 col 2 B2: QR mismatch", status["error"])
+        # Nothing is left to serve, and the labels do not count as printed
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "sheet.pdf")))
+        self.assertFalse(os.path.exists(export))
+        ledger = labels.open_ledger(os.path.join(self.dir, "ledger.sqlite"))
+        self.assertEqual({row["status"] for row in ledger.history("B2")}, {FAILED})
+        self.assertNotIn("B2", ledger)
+
+
+if __name__ == "__main__":
+    unittest.main()
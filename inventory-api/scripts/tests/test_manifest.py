@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Manifest runs (read_manifest / run_manifest) of generate_labels_L7651_v4.py.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import generate_labels_L7651_v4 as labels  # noqa: E402
+
+
+def manifest(text):
+    return labels.read_manifest(io.StringIO(text))
+
+
+class ReadManifestTest(unittest.TestCase):
+    def test_shapes(self):
+        jobs = [{"ids": ["A1"]}, {"ids": ["B2"]}]
+        self.assertEqual(manifest(json.dumps(jobs)), jobs)
+        self.assertEqual(manifest("\n".join(json.dumps(j) for j in jobs) + "\n\n"), jobs)
+        self.assertEqual(manifest(json.dumps(jobs[0])), jobs[:1])
+
+    def test_defaults_apply_to_every_job(self):
+        doc = {"defaults": {"logo": None, "font_scale": 1.0}, "jobs": [{"ids": ["A1"]}, {"font_scale": 1.2}]}
+        self.assertEqual(manifest(json.dumps(doc)), [{"logo": None, "font_scale": 1.0, "ids": ["A1"]},
+                                                     {"logo": None, "font_scale": 1.2}])
+
+    def test_other_documents_are_rejected(self):
+        with self.assertRaises(ValueError):
+            manifest("42")
+
+
+class RunManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_one_result_line_per_job(self):
+        out = os.path.join(self.dir, "a.pdf")
+        jobs = [
+            {"ids": ["A1", "B2"], "logo": None, "out": out},
+            {"id": "bad", "ids": ["C3"], "logo": None, "out": os.path.join(self.dir, "b.pdf"), "qr_engine": "nope"},
+            "not a job",
+        ]
+        results = io.StringIO()
+        summary = labels.run_manifest(jobs, results)
+        lines = [json.loads(line) for line in results.getvalue().splitlines()]
+        self.assertEqual([(r["job"], r["id"], r["ok"]) for r in lines], [(1, 1, True), (2, "bad", False), (3, None, False)])
+        self.assertEqual(lines[0]["labels"], 2)
+        self.assertIn("qr_engine", lines[1]["error"])
+        self.assertTrue(os.path.exists(out))
+        self.assertEqual({k: summary[k] for k in ("jobs", "ok", "failed", "labels")},
+                         {"jobs": 3, "ok": 1, "failed": 2, "labels": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
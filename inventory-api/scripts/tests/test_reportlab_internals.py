@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+The reportlab internals generate_labels_L7651_v4.py depends on.
+
+reportlab has no public API for editing or splicing a page's content stream,
+so --optimize rewrites ``Canvas._code`` (compact_numbers) and --workers merges
+pages drawn elsewhere into ``Canvas._code`` and ``Canvas._formsinuse``. These
+tests fail when a reportlab release changes any of that; requirements.txt pins
+the version they were last run against.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import io
+import os
+import re
+import sys
+import unittest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+import reportlab  # noqa: E402
+from reportlab import rl_config  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+import generate_labels_L7651_v4 as labels  # noqa: E402
+import bench_labels  # noqa: E402
+
+LOGO_PATH = os.path.join(SCRIPTS_DIR, "..", "..", "assets", "ES_Logo.png")
+
+
+class ReportlabInternalsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.saved_invariant = rl_config.invariant
+        rl_config.invariant = 1  # byte-comparable PDFs
+        cls.ids = bench_labels.random_ids(2 * labels.SLOTS_PER_SHEET)
+        cls.logo = LOGO_PATH if os.path.exists(LOGO_PATH) else None
+
+    @classmethod
+    def tearDownClass(cls):
+        rl_config.invariant = cls.saved_invariant
+
+    def test_version_matches_requirements_pin(self):
+        with open(os.path.join(SCRIPTS_DIR, "requirements.txt")) as fh:
+            pin = re.search(r"^reportlab==(\S+)", fh.read(), re.M).group(1)
+        self.assertEqual(reportlab.Version, pin)
+
+    def test_canvas_code_is_the_page_content(self):
+        c = canvas.Canvas(io.BytesIO())
+        c.rect(10, 10, 20, 20)
+        self.assertIsInstance(c._code, list)
+        self.assertIsInstance(c._formsinuse, list)
+        self.assertTrue(any("re" in op.split() for op in c._code), c._code)
+        c.beginForm("F")
+        c.endForm()
+        c.doForm("F")
+        self.assertTrue(c._formsinuse)
+        # Replacing the list's contents must change what is written
+        c._code[:] = ["0 0 5 5 re f"]
+        c.showPage()
+        data = b"".join(bench_labels._decode_stream(head, raw) for head, raw in bench_labels.iter_streams(c.getpdfdata()))
+        self.assertIn(b"0 0 5 5 re f", data)
+
+    def test_optimize_rewrites_numbers_only(self):
+        plain = bench_labels.pdf_stats(labels.render_labels(self.ids, logo_path=self.logo))
+        optimized = bench_labels.pdf_stats(labels.render_labels(self.ids, logo_path=self.logo, optimize=True))
+        self.assertEqual(optimized["ops"], plain["ops"])
+        self.assertLess(optimized["content_bytes"], plain["content_bytes"])
+
+    def test_optimize_puts_use_a85_back(self):
+        saved = rl_config.useA85
+        labels.render_labels(self.ids, logo_path=self.logo, optimize=True)
+        self.assertEqual(rl_config.useA85, saved)
+        with self.assertRaises(ZeroDivisionError):
+            with labels.pdf_settings(optimize=True):
+                self.assertFalse(rl_config.useA85)
+                1 / 0
+        self.assertEqual(rl_config.useA85, saved)
+
+    def test_page_content_fails_loudly_without_the_internals(self):
+        c = canvas.Canvas(io.BytesIO())
+        self.assertIs(labels.page_content(c)[0], c._code)
+        del c._code
+        with self.assertRaisesRegex(RuntimeError, "requirements.txt"):
+            labels.page_content(c)
+
+    def test_optimize_sizes(self):
+        sizes = labels.optimize_sizes(self.ids, self.logo, labels.DEFAULT_CHECKIN_BASE, labels.DEFAULT_EMAIL,
+                                      labels.DEFAULT_PHONE)
+        self.assertLess(sizes["optimized"], sizes["plain"])
+        self.assertEqual(sizes["plain"], len(labels.render_labels(self.ids, logo_path=self.logo)))
+
+    def test_parallel_pages_match_single_process(self):
+        single = labels.render_labels(self.ids, logo_path=self.logo, workers=1)
+        parallel = labels.render_labels(self.ids, logo_path=self.logo, workers=2)
+        self.assertEqual(parallel, single)
+
+    def test_qrencoder_loads_from_reportlab(self):
+        import label_qr_encoder
+        module = label_qr_encoder._load_qrencoder()
+        self.assertTrue(module.__file__.startswith(os.path.dirname(reportlab.__file__)))
+        self.assertTrue(hasattr(module, "QRCode"))
+        matrix = labels.qr_matrix("https://example.com/check-in/A1")
+        self.assertEqual({len(row) for row in matrix}, {len(matrix)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+The SQLite stores shared by generator processes (QR cache, ID index, ledger)
+opened and written by several processes at once, starting from a fresh file:
+the way a pool of --serve workers meets them after a deploy.
+
+    python3 -m unittest discover -s scripts/tests
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+PROCESSES = 6
+ROUNDS = 4
+
+
+def _worker(kind, path, n, barrier, results):
+    sys.path.insert(0, SCRIPTS_DIR)
+    try:
+        barrier.wait()
+        if kind == "ids":
+            from label_id_index import IDIndex
+            results.put(("ok", IDIndex(path).allocate(200)))
+        elif kind == "ledger":
+            from label_ledger import Ledger, DuplicateIDError
+            rows = [(1, 1, "SHARED", "p")] + [(1, slot, f"P{n}X{slot}", "p") for slot in range(2, 40)]
+            try:
+                Ledger(path).begin_batch(rows)
+                results.put(("ok", "recorded"))
+            except DuplicateIDError:
+                results.put(("ok", "duplicate"))
+        else:
+            from label_qr_cache import QRMatrixCache
+            cache = QRMatrixCache(path)
+            for i in range(50):
+                cache.put(f"payload-{n}-{i}", "M", [[True, False], [False, True]])
+            cache.flush()
+            cache.get("payload-0-0", "M")
+            cache.close()
+            results.put(("ok", None))
+    except Exception as e:
+        results.put(("error", f"{type(e).__name__}: {e}"))
+
+
+class ConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "db.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_waits_for_a_locked_fresh_file(self):
+        from label_sqlite import connect
+        holder = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        holder.execute("BEGIN EXCLUSIVE")
+        holder.execute("CREATE TABLE t (x)")
+        threading.Timer(0.3, holder.execute, ("COMMIT",)).start()
+        db = connect(self.path, 10, schema=("CREATE TABLE IF NOT EXISTS t (x)",
+                                            "CREATE TABLE IF NOT EXISTS u (y)"))
+        self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(db.execute("PRAGMA busy_timeout").fetchone()[0], 10000)
+        self.assertEqual({r[0] for r in db.execute("SELECT name FROM sqlite_master")}, {"t", "u"})
+        db.close()
+        holder.close()
+
+    def test_gives_up_after_the_timeout(self):
+        from label_sqlite import connect
+        holder = sqlite3.connect(self.path, isolation_level=None)
+        holder.execute("BEGIN EXCLUSIVE")
+        holder.execute("CREATE TABLE t (x)")
+        with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+            connect(self.path, 0.2)
+        holder.execute("ROLLBACK")
+        holder.close()
+
+
+class ConcurrentOpenTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ctx = multiprocessing.get_context("spawn")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_processes(self, kind, round_):
+        path = os.path.join(self.dir, f"{kind}-{round_}.sqlite")
+        barrier, results = self.ctx.Barrier(PROCESSES), self.ctx.Queue()
+        procs = [self.ctx.Process(target=_worker, args=(kind, path, n, barrier, results)) for n in range(PROCESSES)]
+        for p in procs:
+            p.start()
+        out = [results.get(timeout=120) for _ in procs]
+        for p in procs:
+            p.join()
+        errors = [msg for state, msg in out if state == "error"]
+        self.assertEqual(errors, [])
+        return path, [msg for _state, msg in out]
+
+    def test_id_index(self):
+        from label_id_index import IDIndex
+        for r in range(ROUNDS):
+            path, allocated = self.run_processes("ids", r)
+            ids = [uid for block in allocated for uid in block]
+            self.assertEqual(len(ids), PROCESSES * 200)
+            self.assertEqual(len(set(ids)), len(ids))
+            self.assertEqual(len(IDIndex(path)), len(ids))
+
+    def test_ledger(self):
+        for r in range(ROUNDS):
+            _path, outcomes = self.run_processes("ledger", r)
+            # The shared ID is printed by exactly one process
+            self.assertEqual(sorted(outcomes), ["duplicate"] * (PROCESSES - 1) + ["recorded"])
+
+    def test_qr_cache(self):
+        from label_qr_cache import QRMatrixCache
+        for r in range(ROUNDS):
+            path, _ = self.run_processes("qr", r)
+            cache = QRMatrixCache(path)
+            self.assertEqual(cache.get(f"payload-{PROCESSES - 1}-49", "M"), [[True, False], [False, True]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+/**
+ * tests/labels.test.js
+ * Checklist area: QR label sheets (routes/labels.js).
+ *
+ * The generator itself is not run: the worker pool, the job queue and S3 are
+ * replaced with fakes, so these tests cover what the routes send to the
+ * generator and what they do with its answers.
+ *
+ * Verifies:
+ *  - A preview is the worker's PNG, rendered without reserving or recording IDs
+ *  - A queued job gets the shared request defaults, records to the ledger
+ *    unless record: false, and rejects unknown export formats
+ *  - A finished queued job is reported done with its file URL
+ *  - A queued job whose sheet failed verification is reported failed,
+ *    with the failure summary, and is never uploaded to S3
+ *  - A job failed by the worker keeps its error
+ *  - Unknown job ids are 404
+ */
+'use strict';
+
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const express = require('express');
+const request = require('supertest');
+
+const mockUpload = jest.fn(() => ({ promise: async () => ({ Location: 'https://s3.example/sheet.pdf' }) }));
+jest.mock('aws-sdk', () => ({ S3: jest.fn(() => ({ upload: mockUpload })) }));
+
+const mockQueue = { root: null, statuses: new Map(), submitted: [] };
+jest.mock('../lib/labelJobQueue', () => ({
+  getLabelJobQueue: () => ({
+    root: mockQueue.root,
+    status: async (id) => mockQueue.statuses.get(id) || null,
+    submit: async (job) => { mockQueue.submitted.push(job); return '1760000000000-feedfacecafe'; },
+  }),
+}));
+
+const mockPool = { jobs: [], png: Buffer.from('\x89PNG\r\n\x1a\npreview') };
+jest.mock('../lib/labelWorkerPool', () => ({
+  getLabelWorkerPool: () => ({
+    run: async (job) => { mockPool.jobs.push(job); return { png_b64: mockPool.png.toString('base64') }; },
+  }),
+}));
+
+const labelsRouter = require('../routes/labels');
+const LABEL_DEFAULTS = require('../lib/labelJobDefaults.json');
+
+const app = express();
+app.use(express.json());
+app.use('/labels', labelsRouter);
+
+const JOB_ID = '1760000000000-0123456789ab';
+
+function finishJob(result, api = { fileName: 'sheet.pdf', storage: 's3', exportName: null }) {
+  mockQueue.statuses.set(JOB_ID, { id: JOB_ID, state: 'done', submitted: 1, finished: 2, result });
+  fs.writeFileSync(path.join(mockQueue.root, 'done', `${JOB_ID}.json`),
+    JSON.stringify({ job: { out: path.join(mockQueue.root, 'sheet.pdf'), api }, result }));
+}
+
+beforeEach(() => {
+  mockQueue.root = fs.mkdtempSync(path.join(os.tmpdir(), 'label-queue-'));
+  fs.mkdirSync(path.join(mockQueue.root, 'done'));
+  fs.writeFileSync(path.join(mockQueue.root, 'sheet.pdf'), '%PDF-1.4\n');
+  mockQueue.statuses.clear();
+  mockQueue.submitted = [];
+  mockPool.jobs = [];
+  mockUpload.mockClear();
+  process.env.S3_BUCKET = 'test-bucket';
+});
+
+afterEach(() => {
+  fs.rmSync(mockQueue.root, { recursive: true, force: true });
+});
+
+describe('GET /labels/l7651/jobs/:id', () => {
+  test('a finished job is done and served', async () => {
+    finishJob({ pages: 1, labels: 3, seconds: 0.5, bytes: 9, verify: { failures: [] } });
+    const res = await request(app).get(`/labels/l7651/jobs/${JOB_ID}`);
+    expect(res.status).toBe(200);
+    expect(res.body.state).toBe('done');
+    expect(res.body.file.name).toBe('sheet.pdf');
+    expect(res.body.file.s3Url).toBe('https://s3.example/sheet.pdf');
+    expect(mockUpload).toHaveBeenCalledTimes(1);
+  });
+
+  test('a job whose sheet failed verification is failed and not uploaded', async () => {
+    finishJob({
+      pages: 1, labels: 3, seconds: 0.5, bytes: 9,
+      verify: { failures: [{ page: 1, slot: 2, row: 1, col: 2, id: 'B2', problem: 'QR mismatch' }] },
+    });
+    const res = await request(app).get(`/labels/l7651/jobs/${JOB_ID}`);
+    expect(res.status).toBe(200);
+    expect(res.body.state).toBe('failed');
+    expect(res.body.error).toBe('Label verification failed for 1 check(s): page 1 row 1 col 2 B2: QR mismatch');
+    expect(res.body.file).toBeUndefined();
+    expect(mockUpload).not.toHaveBeenCalled();
+  });
+
+  test('a job failed by the worker keeps its error', async () => {
+    mockQueue.statuses.set(JOB_ID, {
+      id: JOB_ID, state: 'failed', submitted: 1,
+      error: 'VerificationError: Label verification failed for 1 check(s): page 1 row 1 col 2 B2: QR mismatch',
+    });
+    const res = await request(app).get(`/labels/l7651/jobs/${JOB_ID}`);
+    expect(res.body.state).toBe('failed');
+    expect(res.body.error).toMatch(/^VerificationError/);
+    expect(res.body.conflict).toBeUndefined();
+  });
+
+  test('an unknown job is 404', async () => {
+    const res = await request(app).get(`/labels/l7651/jobs/${JOB_ID}`);
+    expect(res.status).toBe(404);
+  });
+});
+
+describe('POST /labels/l7651/preview', () => {
+  test('returns the PNG without touching the ID index or ledger', async () => {
+    const res = await request(app).post('/labels/l7651/preview').send({ ids: ['A1', 7], dpi: 96 })
+      .buffer(true).parse((r, cb) => { const c = []; r.on('data', (d) => c.push(d)); r.on('end', () => cb(null, Buffer.concat(c))); });
+    expect(res.status).toBe(200);
+    expect(res.headers['content-type']).toBe('image/png');
+    expect(res.headers['cache-control']).toBe('no-store');
+    expect(res.body.equals(mockPool.png)).toBe(true);
+    const [job] = mockPool.jobs;
+    expect(job).toMatchObject({ ids: ['A1', '7'], format: 'png', dpi: 96, font_scale: LABEL_DEFAULTS.fontScale });
+    expect(job.id_index).toBeUndefined();
+    expect(job.ledger).toBeUndefined();
+    expect(job.output_cache).toBeUndefined();
+  });
+});
+
+describe('POST /labels/l7651/jobs', () => {
+  test('queues the job with the shared defaults and the ledger', async () => {
+    const res = await request(app).post('/labels/l7651/jobs').send({ count: 130, fileName: '../x/run.pdf', exportFormat: 'jsonl' });
+    expect(res.status).toBe(202);
+    expect(res.body).toEqual({
+      status: 'queued', jobId: '1760000000000-feedfacecafe', statusUrl: '/labels/l7651/jobs/1760000000000-feedfacecafe',
+    });
+    const [job] = mockQueue.submitted;
+    expect(job).toMatchObject({
+      ids: null, count: 130, email: LABEL_DEFAULTS.email, phone: LABEL_DEFAULTS.phone,
+      font_scale: LABEL_DEFAULTS.fontScale, optimize: LABEL_DEFAULTS.optimize, export_format: 'jsonl',
+      api: { fileName: 'run.pdf', storage: null, exportName: 'run.jsonl' },
+    });
+    expect(path.basename(job.out)).toBe('run.pdf');
+    expect(path.basename(job.ledger)).toBe('ledger.sqlite');
+    expect(job.reprint).toBeUndefined();
+  });
+
+  test('record: false leaves the ledger out, reprint needs record', async () => {
+    await request(app).post('/labels/l7651/jobs').send({ ids: ['A1'], record: false, reprint: true });
+    await request(app).post('/labels/l7651/jobs').send({ ids: ['A1'], reprint: true });
+    const [testPrint, reprint] = mockQueue.submitted;
+    expect(testPrint.ledger).toBeUndefined();
+    expect(testPrint.reprint).toBeUndefined();
+    expect(reprint.reprint).toBe(true);
+  });
+
+  test('an unknown export format is rejected', async () => {
+    const res = await request(app).post('/labels/l7651/jobs').send({ exportFormat: 'csv' });
+    expect(res.status).toBe(400);
+    expect(mockQueue.submitted).toEqual([]);
+  });
+});